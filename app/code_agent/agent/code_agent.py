@@ -18,7 +18,17 @@ from langgraph.prebuilt import create_react_agent
 from pydantic import SecretStr
 
 # 导入 RAG 相关函数
-from app.code_agent.rag.rag import create_client, retrieve_index
+from app.code_agent.rag.backends import (
+    REMOTE_BACKENDS,
+    aretrieve_from_backend,
+    create_client_from_env,
+    get_backend_name,
+)
+from app.code_agent.rag.cache import mark_stale_text
+from app.code_agent.rag.fusion import get_index_ids
+from app.code_agent.rag.packing import pack_nodes
+from app.code_agent.rag.telemetry import get_telemetry
+from app.code_agent.rag.turn_memo import get_turn_memo, start_turn
 
 # 导入自定义工具
 from app.code_agent.tools.file_saver import (  # 仅导入需要的文件工具
@@ -26,18 +36,10 @@ from app.code_agent.tools.file_saver import (  # 仅导入需要的文件工具
     get_file_content,
     save_file,
 )
-from app.code_agent.tools.file_tools import (
-    get_stdio_file_tools,  # 导入文件工具获取函数
-)
-from app.code_agent.tools.powershell_tools import (
-    get_stdio_powershell_tools,  # 导入PowerShell工具获取函数
-)
-from app.code_agent.tools.terminal_tools import (
-    get_stdio_terminal_tools,  # 导入终端工具获取函数
-)
-from app.code_agent.tools.rag_tools import (
-    get_stdio_rag_tools,  # 导入RAG工具获取函数
+from app.code_agent.tools.mcp_servers import (
+    get_all_stdio_tools,  # 导入MCP工具服务统一加载函数
 )
+from app.code_agent.utils.mcp import close_mcp_sessions
 
 # 注释掉shell_tools，暂时不使用
 # from app.code_agent.tools.shell_tools import (
@@ -84,40 +86,12 @@ async def run_agent():
         # 2.1 基础文件工具
         file_tools = [save_file, append_file, get_file_content]
 
-        # 2.2 获取MCP文件工具（通过MCP协议连接到外部文件工具服务）
-        try:
-            mcp_file_tools = await get_stdio_file_tools()
-            print(f"成功加载 {len(mcp_file_tools)} 个MCP文件工具")
-        except Exception as e:
-            print(f"警告：加载MCP文件工具失败 - {str(e)}")
-            mcp_file_tools = []
-
-        # 2.3 获取PowerShell工具（通过MCP协议连接到外部PowerShell工具服务）
-        try:
-            powershell_tools = await get_stdio_powershell_tools()
-            print(f"成功加载 {len(powershell_tools)} 个PowerShell工具")
-        except Exception as e:
-            print(f"警告：加载PowerShell工具失败 - {str(e)}")
-            powershell_tools = []
-
-        # 2.4 获取终端工具（通过MCP协议连接到外部终端工具服务）
-        try:
-            terminal_tools = await get_stdio_terminal_tools()
-            print(f"成功加载 {len(terminal_tools)} 个终端工具")
-        except Exception as e:
-            print(f"警告：加载终端工具失败 - {str(e)}")
-            terminal_tools = []
-
-        # 2.5 获取RAG工具（通过MCP协议连接到外部RAG工具服务）
-        try:
-            rag_tools = await get_stdio_rag_tools()
-            print(f"成功加载 {len(rag_tools)} 个RAG工具")
-        except Exception as e:
-            print(f"警告：加载RAG工具失败 - {str(e)}")
-            rag_tools = []
+        # 2.2 并发启动所有MCP工具服务（文件、PowerShell、终端、RAG），每个服务单独限时，
+        #     启动超时或失败的服务不会拖慢其他服务
+        mcp_tools = await get_all_stdio_tools()
 
         # 注释掉shell_tools，暂时不使用
-        # 2.5 获取shell工具（通过MCP协议连接到外部shell工具服务）
+        # 2.3 获取shell工具（通过MCP协议连接到外部shell工具服务）
         # try:
         #     shell_tools = await get_stdio_shell_tools()
         #     print(f"成功加载 {len(shell_tools)} 个shell工具")
@@ -125,8 +99,8 @@ async def run_agent():
         #     print(f"警告：加载shell工具失败 - {str(e)}")
         #     shell_tools = []
 
-        # 2.6 合并所有工具
-        all_tools = file_tools + mcp_file_tools + powershell_tools + terminal_tools + rag_tools
+        # 2.4 合并所有工具
+        all_tools = file_tools + [tool for tools in mcp_tools.values() for tool in tools]
 
         if not all_tools:
             print("错误：未加载到任何工具")
@@ -138,7 +112,7 @@ async def run_agent():
 
         # 4. 创建自定义提示词，明确告诉智能体在使用任何工具之前都必须先使用 RAG 工具获取相关知识
         react_prompt = ChatPromptTemplate.from_messages([
-            ("system", "你是一个代码智能体，负责处理用户的各种请求。\n\n**强制性要求：在使用任何工具之前，你必须先使用 RAG 工具获取相关的知识**。这是绝对必须执行的步骤，没有例外。无论你认为自己是否已经知道答案，都必须先使用 RAG 工具获取最新的相关知识。\n\n**严格使用步骤：**\n1. 首先，分析用户的请求，确定需要获取哪些相关知识\n2. 然后，使用 RAG 工具（工具名称：query_rag_from_bailian）获取相关知识，将用户的请求作为查询参数传递给 RAG 工具\n3. 接着，根据获取到的知识和用户的请求，决定下一步操作\n4. 最后，使用适当的工具完成用户的请求\n\n**重要注意事项：**\n- 必须先使用 RAG 工具，然后才能使用其他工具\n- 获取到的知识将作为你决策和执行的基础\n- 如果 RAG 工具没有返回相关信息，你可以根据自己的知识来处理任务\n- 你必须在思考过程中明确说明你使用了 RAG 工具获取知识，以及获取到了哪些知识\n- 无论用户的请求是什么，你都必须先使用 RAG 工具获取相关知识，然后才能使用其他工具"),
+            ("system", "你是一个代码智能体，负责处理用户的各种请求。\n\n**强制性要求：在使用任何工具之前，你必须先使用 RAG 工具获取相关的知识**。这是绝对必须执行的步骤，没有例外。无论你认为自己是否已经知道答案，都必须先使用 RAG 工具获取最新的相关知识。\n\n**严格使用步骤：**\n1. 首先，分析用户的请求，确定需要获取哪些相关知识\n2. 然后，使用 RAG 工具（工具名称：query_rag_from_bailian）获取相关知识，将用户的请求作为查询参数传递给 RAG 工具；需要多个主题的知识时，使用 query_rag_batch 一次传入多个查询\n3. 接着，根据获取到的知识和用户的请求，决定下一步操作\n4. 最后，使用适当的工具完成用户的请求\n\n**重要注意事项：**\n- 必须先使用 RAG 工具，然后才能使用其他工具\n- 获取到的知识将作为你决策和执行的基础\n- 如果 RAG 工具没有返回相关信息，你可以根据自己的知识来处理任务\n- 你必须在思考过程中明确说明你使用了 RAG 工具获取知识，以及获取到了哪些知识\n- 无论用户的请求是什么，你都必须先使用 RAG 工具获取相关知识，然后才能使用其他工具"),
             ("user", "{messages}")
         ])
 
@@ -162,31 +136,33 @@ async def run_agent():
                 break
 
             try:
+                # 开始新的一轮对话，本轮内 RAG 工具对相同查询直接复用预检索结果
+                turn_id = start_turn()
+
                 # 1. 从阿里云百炼知识库中读取知识
                 rag_knowledge = ""
                 try:
-                    # 创建百炼客户端
-                    bailian_client = create_client()
+                    # 获取检索后端，远程后端使用共享的百炼客户端
+                    backend = get_backend_name()
+                    bailian_client = create_client_from_env() if backend in REMOTE_BACKENDS else None
 
                     # 从环境变量获取配置
                     workspace_id = os.getenv('workspace_id')
-                    index_id = os.getenv('knowledge_base_id')
+                    index_ids = get_index_ids()
 
-                    # 验证配置
-                    if workspace_id and index_id:
-                        # 查询知识库
-                        rag = retrieve_index(bailian_client, workspace_id, index_id, user_input)
+                    # 验证配置（本地后端无需知识库配置）
+                    if backend not in REMOTE_BACKENDS or (workspace_id and index_ids):
+                        # 查询知识库，记录预检索耗时
+                        with get_telemetry().timed("pre_retrieval"):
+                            rag = await aretrieve_from_backend(
+                                bailian_client, workspace_id, index_ids, user_input, backend)
 
                         # 处理查询结果
                         if rag.body and hasattr(rag.body, 'data') and rag.body.data:
                             if hasattr(rag.body.data, 'nodes') and rag.body.data.nodes:
-                                # 拼接查询结果
-                                result = ""
-                                index = 1
-                                for data in rag.body.data.nodes:
-                                    result += f"第{index}段知识：\n    {data.text}\n    --\n    "
-                                    index += 1
-                                rag_knowledge = result
+                                # 重排、去重并在 token 预算内拼接查询结果，过期结果与 RAG 工具一样加上提示
+                                rag_knowledge = mark_stale_text(rag, pack_nodes(user_input, rag.body.data.nodes))
+                                get_turn_memo().put(turn_id, user_input, rag_knowledge)
                                 # 打印 RAG 工具的结果
                                 print("\n=== RAG 知识库查询结果 ===")
                                 print(rag_knowledge)
@@ -205,10 +181,11 @@ async def run_agent():
                     # 如果没有 RAG 知识，使用原始输入
                     rag_enhanced_input = user_input
 
-                # 4. 调用智能体处理用户请求
-                response = await agent.ainvoke(
-                    input={"messages": rag_enhanced_input}, config=config
-                )
+                # 4. 调用智能体处理用户请求，记录模型及工具调用耗时
+                with get_telemetry().timed("agent_invoke"):
+                    response = await agent.ainvoke(
+                        input={"messages": rag_enhanced_input}, config=config
+                    )
 
                 # 输出智能体响应
                 if response and "messages" in response and response["messages"]:
@@ -219,10 +196,23 @@ async def run_agent():
             except Exception as e:
                 print(f"错误：处理用户请求时发生异常 - {str(e)}")
 
+            # 按间隔写入本进程的遥测快照
+            try:
+                await asyncio.to_thread(get_telemetry().maybe_flush)
+            except Exception as e:
+                print(f"写入遥测快照失败: {type(e).__name__} {e}")
+
             print("=" * 50)
 
     except Exception as e:
         print(f"严重错误：智能体运行失败 - {str(e)}")
+    finally:
+        # 关闭所有 MCP 长连接会话及服务进程，写入最终的遥测快照
+        await close_mcp_sessions()
+        try:
+            await asyncio.to_thread(get_telemetry().flush)
+        except Exception as e:
+            print(f"写入遥测快照失败: {type(e).__name__} {e}")
 
 
 if __name__ == "__main__":
@@ -6,118 +6,229 @@
 用于从百炼平台查询知识库
 """
 
+import asyncio
 import os
 import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List
+
 from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+
+# 以 stdio 子进程方式启动时，需要将项目根目录加入 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent))
 
 # 导入阿里云百炼相关模块
-from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_bailian20231229 import client as bailian_20231229_client
-from alibabacloud_bailian20231229 import models as bailian_20231229_models
-from alibabacloud_tea_util import models as util_models
+
+from app.code_agent.rag.backends import (
+    REMOTE_BACKENDS,
+    aretrieve_from_backend,
+    create_client_from_env,
+    get_backend_name,
+)
+from app.code_agent.rag.cache import is_stale, mark_stale_text, normalize_query
+from app.code_agent.rag.fusion import get_index_ids
+from app.code_agent.rag.packing import estimate_tokens, get_token_budget, pack_nodes
+from app.code_agent.rag.query_log import aprewarm, get_query_log
+from app.code_agent.rag.telemetry import get_telemetry
+from app.code_agent.rag.turn_memo import NO_RESULT_MESSAGE, TURN_ID_META_KEY, get_turn_memo
+from app.code_agent.utils.env import get_env_number
 
 # 加载环境变量
 load_dotenv()
 
-# 创建 MCP 实例
-mcp = FastMCP()
+# 批量查询的默认并发上限、单次最大查询数及每个查询的最小 token 预算
+DEFAULT_BATCH_CONCURRENCY = 4
+DEFAULT_BATCH_MAX_QUERIES = 8
+MIN_BATCH_TOKEN_BUDGET = 300
 
 
 def create_client() -> bailian_20231229_client.Client:
     """
-    创建并配置阿里云百炼客户端。
+    获取阿里云百炼客户端，同一配置在进程内共享同一个客户端及其连接池。
 
     返回:
         bailian_20231229_client.Client: 配置好的客户端。
     """
-    # 从环境变量获取配置
-    access_key_id = os.getenv('accessKeyId')
-    access_key_secret = os.getenv('accessKeySecret')
+    return create_client_from_env()
+
 
-    # 验证配置
-    if not access_key_id:
-        raise ValueError("accessKeyId 配置未找到，请在 .env 文件中设置")
-    if not access_key_secret:
-        raise ValueError("accessKeySecret 配置未找到，请在 .env 文件中设置")
+async def prewarm_query(query: str):
+    """
+    按当前配置检索一次查询，结果由检索链路写入缓存。
+
+    参数:
+        query (str): 查询。
+    """
+    backend = get_backend_name()
+    bailian_client = create_client() if backend in REMOTE_BACKENDS else None
+    await aretrieve_from_backend(bailian_client, os.getenv('workspace_id'), get_index_ids(), query, backend)
 
-    config = open_api_models.Config(
-        access_key_id=access_key_id,
-        access_key_secret=access_key_secret
-    )
-    config.endpoint = 'bailian.cn-beijing.aliyuncs.com'
-    return bailian_20231229_client.Client(config=config)
+
+async def prewarm():
+    """
+    后台预热最常见的查询，日志输出到 stderr，避免干扰 stdio 协议。
+    """
+    try:
+        stats = await aprewarm(prewarm_query)
+        if stats["queries"]:
+            print(f"检索缓存预热完成: {stats}", file=sys.stderr)
+    except Exception as e:
+        print(f"检索缓存预热失败: {type(e).__name__} {e}", file=sys.stderr)
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """
+    MCP 服务生命周期：启动时在后台预热检索缓存，不阻塞服务就绪；退出时写入最终的遥测快照。
+    """
+    task = asyncio.create_task(prewarm())
+    try:
+        yield {}
+    finally:
+        task.cancel()
+        try:
+            await asyncio.to_thread(get_telemetry().flush)
+        except Exception as e:
+            print(f"写入遥测快照失败: {type(e).__name__} {e}", file=sys.stderr)
+
+
+# 创建 MCP 实例
+mcp = FastMCP(lifespan=lifespan)
+
+
+def write_query_record(query: str, latency_ms: float, nodes: int, size: int, backend: str, status: str):
+    """
+    写入查询日志及遥测事件，并按间隔刷新遥测快照，在线程中执行。
+    """
+    telemetry = get_telemetry()
+    query_log = get_query_log()
+    if query_log is not None and status != "error":
+        query_log.record(query, latency_ms, nodes, size, backend)
+    telemetry.log_event("query_rag", query=query, backend=backend, status=status,
+                        latency_ms=latency_ms, nodes=nodes, bytes=size)
+    telemetry.maybe_flush()
+
+
+async def record_query(query: str, started: float, nodes: int, result: str, backend: str, status: str = "ok"):
+    """
+    记录一次工具调用的耗时、节点数、返回字节数和 token 数，成功的查询写入查询日志用于下次启动时预热。
+
+    参数:
+        query (str): 查询。
+        started (float): 开始时间（time.perf_counter）。
+        nodes (int): 检索到的节点数。
+        result (str): 返回给模型的文本。
+        backend (str): 检索后端。
+        status (str): ok、stale、empty、memo 或 error。
+    """
+    latency_ms = (time.perf_counter() - started) * 1000
+    size = len(result.encode("utf-8"))
+    telemetry = get_telemetry()
+    telemetry.incr(f"query_rag.{status}")
+    telemetry.observe("query_rag.latency_ms", latency_ms)
+    if status in ("ok", "stale", "empty"):
+        telemetry.observe("query_rag.nodes", nodes)
+        telemetry.observe("query_rag.bytes", size)
+        telemetry.observe("query_rag.tokens", estimate_tokens(result))
+    try:
+        await asyncio.to_thread(write_query_record, query, latency_ms, nodes, size, backend, status)
+    except Exception as e:
+        print(f"记录查询日志失败: {type(e).__name__} {e}", file=sys.stderr)
 
 
-def retrieve_index(client, workspace_id, index_id, query):
+def get_turn_id(ctx: Context):
     """
-    在指定的知识库中检索信息。
+    从 MCP 调用元数据中读取对话轮次 ID。
 
     参数:
-        client (bailian_20231229_client.Client): 客户端（Client）。
-        workspace_id (str): 业务空间ID。
-        index_id (str): 知识库ID。
-        query (str): 原始输入prompt。
+        ctx (Context): MCP 请求上下文。
 
     返回:
-        阿里云百炼服务的响应。
+        str: 轮次 ID，客户端未携带时返回 None。
     """
-    headers = {}
-    retrieve_request = bailian_20231229_models.RetrieveRequest(
-        index_id=index_id,
-        query=query
-    )
-    runtime = util_models.RuntimeOptions()
-    return client.retrieve_with_options(workspace_id, retrieve_request, headers, runtime)
+    try:
+        meta = ctx.request_context.meta
+    except (AttributeError, ValueError):
+        return None
+    return getattr(meta, TURN_ID_META_KEY, None) if meta is not None else None
 
 
-@mcp.tool(name="query_rag_from_bailian", description="当需要获取特定领域的知识或信息时，从百炼平台知识库查询相关内容，传入需要查询的知识关键字即可")
-def query_rag_from_bailian(query: str) -> str:
+def get_batch_limits():
+    """
+    获取批量查询的并发上限和单次最大查询数，
+    可通过环境变量 RAG_BATCH_CONCURRENCY、RAG_BATCH_MAX_QUERIES 配置。
+
+    返回:
+        tuple: (并发上限, 最大查询数)。
+    """
+    return (max(get_env_number("RAG_BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY), 1),
+            max(get_env_number("RAG_BATCH_MAX_QUERIES", DEFAULT_BATCH_MAX_QUERIES), 1))
+
+
+async def aquery_rag(query: str, turn_id: str = None, token_budget: int = None) -> str:
     """
-    从百炼平台查询知识库
+    查询知识库并返回拼接后的知识文本，同一轮对话内重复的查询直接返回备忘结果
 
     参数:
         query (str): 需要查询的知识关键字
+        turn_id (str): 对话轮次 ID
+        token_budget (int): 知识文本的 token 预算，默认读取 RAG_CONTEXT_TOKEN_BUDGET
 
     返回:
-        str: 查询到的知识内容
+        str: 查询到的知识内容，或错误信息
     """
+    started = time.perf_counter()
+    backend = get_backend_name()
     try:
-        # 创建百炼客户端
-        bailian_client = create_client()
+        # 同一轮对话内已检索过的查询直接返回
+        memo_result = get_turn_memo().get(turn_id, query)
+        if memo_result is not None:
+            await record_query(query, started, 0, memo_result, backend, "memo")
+            return memo_result
 
         # 从环境变量获取配置
         workspace_id = os.getenv('workspace_id')
-        index_id = os.getenv('knowledge_base_id')
+        index_ids = get_index_ids()
+
+        # 远程后端需要百炼客户端及知识库配置，本地后端可离线运行
+        bailian_client = None
+        if backend in REMOTE_BACKENDS:
+            # 获取共享的百炼客户端
+            bailian_client = create_client()
 
-        # 验证配置
-        if not workspace_id:
-            return "错误：workspace_id 配置未找到，请在 .env 文件中设置"
-        if not index_id:
-            return "错误：knowledge_base_id 配置未找到，请在 .env 文件中设置"
+            # 验证配置
+            if not workspace_id:
+                return "错误：workspace_id 配置未找到，请在 .env 文件中设置"
+            if not index_ids:
+                return "错误：knowledge_base_id 配置未找到，请在 .env 文件中设置"
 
         # 查询知识库
-        rag = retrieve_index(bailian_client, workspace_id, index_id, query)
+        rag = await aretrieve_from_backend(bailian_client, workspace_id, index_ids, query, backend)
 
         # 处理查询结果
         if rag.body and hasattr(rag.body, 'data') and rag.body.data:
             if hasattr(rag.body.data, 'nodes') and rag.body.data.nodes:
-                # 拼接查询结果
-                result = ""
-                index = 1
-                for data in rag.body.data.nodes:
-                    result += f"第{index}段知识：\n    {data.text}\n    --\n    "
-                    index += 1
+                # 重排、去重并在 token 预算内拼接查询结果
+                result = mark_stale_text(rag, pack_nodes(query, rag.body.data.nodes, token_budget))
+                stale = is_stale(rag)
                 # 打印 RAG 工具的结果
                 print("\n=== RAG 工具查询结果 ===")
                 print(result)
                 print("====================\n")
+                get_turn_memo().put(turn_id, query, result)
+                await record_query(query, started, len(rag.body.data.nodes), result, backend,
+                                   "stale" if stale else "ok")
                 return result
             else:
-                no_result_msg = "未找到相关知识节点"
+                no_result_msg = NO_RESULT_MESSAGE
                 print("\n=== RAG 工具查询结果 ===")
                 print(no_result_msg)
                 print("====================\n")
+                await record_query(query, started, 0, "", backend, "empty")
                 return no_result_msg
         else:
             # 处理错误情况
@@ -131,8 +242,12 @@ def query_rag_from_bailian(query: str) -> str:
             print("\n=== RAG 工具查询结果 ===")
             print(error_msg)
             print("====================\n")
+            get_telemetry().record_error("query_rag", RuntimeError(error_message))
+            await record_query(query, started, 0, error_msg, backend, "error")
             return error_msg
     except Exception as e:
+        get_telemetry().record_error("query_rag", e)
+        await record_query(query, started, 0, "", backend, "error")
         error_msg = f"执行错误: {str(e)}"
         print("\n=== RAG 工具查询结果 ===")
         print(error_msg)
@@ -140,6 +255,59 @@ def query_rag_from_bailian(query: str) -> str:
         return error_msg
 
 
+@mcp.tool(name="query_rag_from_bailian", description="当需要获取特定领域的知识或信息时，从百炼平台知识库查询相关内容，传入需要查询的知识关键字即可")
+async def query_rag_from_bailian(query: str, ctx: Context = None) -> str:
+    """
+    从百炼平台查询知识库，同一轮对话内重复的查询直接返回备忘结果
+
+    参数:
+        query (str): 需要查询的知识关键字
+        ctx (Context): MCP 请求上下文，元数据中可携带对话轮次 ID
+
+    返回:
+        str: 查询到的知识内容
+    """
+    return await aquery_rag(query, get_turn_id(ctx))
+
+
+@mcp.tool(name="query_rag_batch", description="当需要同时获取多个主题的知识时，一次传入多个知识关键字，并发查询百炼平台知识库并按关键字分别返回结果")
+async def query_rag_batch(queries: List[str], ctx: Context = None) -> str:
+    """
+    批量查询知识库：去除重复的查询后以有限并发检索，token 预算在各查询之间平分
+
+    参数:
+        queries (List[str]): 需要查询的知识关键字列表
+        ctx (Context): MCP 请求上下文，元数据中可携带对话轮次 ID
+
+    返回:
+        str: 按查询分节的知识内容
+    """
+    unique = {}
+    for query in queries or []:
+        if query and query.strip():
+            unique.setdefault(normalize_query(query), query.strip())
+    if not unique:
+        return "错误：未提供查询关键字"
+
+    concurrency, max_queries = get_batch_limits()
+    batch = list(unique.values())[:max_queries]
+    skipped = list(unique.values())[max_queries:]
+    token_budget = max(get_token_budget() // len(batch), MIN_BATCH_TOKEN_BUDGET)
+    turn_id = get_turn_id(ctx)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(query):
+        async with semaphore:
+            return await aquery_rag(query, turn_id, token_budget)
+
+    results = await asyncio.gather(*[run(query) for query in batch])
+    sections = [f"## {query}\n{result}" for query, result in zip(batch, results)]
+    if skipped:
+        sections.append(f"（单次最多查询 {max_queries} 个关键字，未查询: {'、'.join(skipped)}）")
+    get_telemetry().observe("query_rag_batch.queries", len(batch))
+    return "\n\n".join(sections)
+
+
 if __name__ == '__main__':
     """
     运行 MCP 工具
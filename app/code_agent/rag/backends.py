@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库检索后端
+根据环境变量 RAG_BACKEND 选择检索后端：
+    bailian  远程百炼知识库（默认）
+    local    本地 BM25 索引，可完全离线运行
+    vector   本地向量库（字符 n-gram 特征哈希嵌入），可完全离线运行
+    mirror   百炼知识库的本地镜像，可完全离线运行
+    hybrid   同时检索远程和本地，远程超过截止时间则回退到本地结果
+"""
+
+import asyncio
+import os
+
+from app.code_agent.rag.client_pool import get_client
+from app.code_agent.rag.fusion import aretrieve_indices, get_index_ids
+from app.code_agent.rag.hybrid import ahybrid_retrieve
+from app.code_agent.rag.local_index import get_local_index
+from app.code_agent.rag.mirror_store import retrieve_from_mirror
+from app.code_agent.rag.vector_store import get_vector_store
+
+# 支持的检索后端
+BACKEND_BAILIAN = "bailian"
+BACKEND_LOCAL = "local"
+BACKEND_HYBRID = "hybrid"
+BACKEND_VECTOR = "vector"
+BACKEND_MIRROR = "mirror"
+
+# 需要访问百炼服务的后端
+REMOTE_BACKENDS = (BACKEND_BAILIAN, BACKEND_HYBRID)
+
+
+def get_backend_name() -> str:
+    """
+    获取当前配置的检索后端名称。
+
+    返回:
+        str: 后端名称。
+    """
+    return (os.getenv("RAG_BACKEND") or BACKEND_BAILIAN).lower()
+
+
+def create_client_from_env():
+    """
+    根据 .env 中的 accessKeyId、accessKeySecret、workspace_id 获取共享的百炼客户端。
+
+    返回:
+        bailian_20231229_client.Client: 配置好的客户端。
+    """
+    access_key_id = os.getenv('accessKeyId')
+    access_key_secret = os.getenv('accessKeySecret')
+    if not access_key_id:
+        raise ValueError("accessKeyId 配置未找到，请在 .env 文件中设置")
+    if not access_key_secret:
+        raise ValueError("accessKeySecret 配置未找到，请在 .env 文件中设置")
+    return get_client(
+        access_key_id=access_key_id,
+        access_key_secret=access_key_secret,
+        workspace_id=os.getenv('workspace_id')
+    )
+
+
+async def aretrieve_from_backend(client, workspace_id, index_id, query, backend=None):
+    """
+    使用指定的检索后端检索知识库，返回与 retrieve_index 结构一致的响应。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client），本地后端可为 None。
+        workspace_id (str): 业务空间ID。
+        index_id (str | list): 知识库ID，或多个知识库ID的列表（并发检索后按 RRF 合并）。
+        query (str): 原始输入prompt。
+        backend (str): 后端名称，默认读取环境变量 RAG_BACKEND。
+
+    返回:
+        阿里云百炼服务的响应，或结构一致的本地检索响应。
+    """
+    backend = backend or get_backend_name()
+    if backend == BACKEND_LOCAL:
+        return await asyncio.to_thread(get_local_index().retrieve, query)
+    if backend == BACKEND_VECTOR:
+        return await asyncio.to_thread(get_vector_store().retrieve, query)
+    if backend == BACKEND_MIRROR:
+        return await asyncio.to_thread(retrieve_from_mirror, get_index_ids(index_id), query)
+    if backend == BACKEND_BAILIAN:
+        return await aretrieve_indices(client, workspace_id, get_index_ids(index_id), query)
+    if backend == BACKEND_HYBRID:
+        return await ahybrid_retrieve(client, workspace_id, index_id, query)
+    raise ValueError(f"不支持的检索后端: {backend}")
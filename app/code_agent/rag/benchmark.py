@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库性能基准测试
+启动本地模拟百炼服务（或连接已启动的模拟服务），以指定并发驱动 retrieve_index、
+query_rag_from_bailian 工具逻辑和批量导入流水线，输出吞吐量及 p50/p95/p99 延迟
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from app.code_agent.rag.fake_bailian import PROFILES, FakeBailianServer, FakeProfile
+from app.code_agent.rag.telemetry import summarize
+
+# 支持的测试场景
+SCENARIOS = ("retrieve", "query", "ingest")
+
+# 默认配置
+DEFAULT_REQUESTS = 200
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DISTINCT = 50
+DEFAULT_FILES = 50
+
+# 基准测试使用的环境变量：指向模拟服务，并关闭会写入 .temp 的查询日志、遥测快照和磁盘缓存
+BENCHMARK_ENV = {
+    "RAG_BACKEND": "bailian",
+    "BAILIAN_PROTOCOL": "http",
+    "RAG_CACHE_DB": "",
+    "RAG_QUERY_LOG_ENABLED": "0",
+    "RAG_TELEMETRY_SNAPSHOT": "",
+    "RAG_FINGERPRINT_CACHE_ENABLED": "0",
+}
+FAKE_CREDENTIALS = {
+    "accessKeyId": "fake-ak",
+    "accessKeySecret": "fake-sk",
+    "workspace_id": "fake-workspace",
+    "knowledge_base_id": "fake-index",
+}
+
+
+def make_queries(count: int, distinct: int) -> List[str]:
+    """
+    生成查询序列，共 distinct 个不同的查询循环出现，用于控制缓存命中率。
+    """
+    distinct = max(distinct, 1)
+    return [f"基准查询 {i % distinct}" for i in range(count)]
+
+
+async def arun_load(call: Callable[[str], Awaitable], queries: Sequence[str], concurrency: int,
+                    warmup: bool = True) -> Dict:
+    """
+    以有限并发依次发起调用，统计每次调用的延迟。
+
+    参数:
+        call (Callable): 接收查询的异步调用。
+        queries (Sequence[str]): 查询序列，每个查询一次调用。
+        concurrency (int): 并发数。
+        warmup (bool): 先以相同并发发起一轮不计入统计的调用（使用不同的查询，不影响缓存命中率），
+                       排除建立连接和首次调用的开销。
+
+    返回:
+        dict: 请求数、错误数及错误类型、耗时、吞吐量和延迟（毫秒）分位数。
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(query)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    if warmup:
+        await asyncio.gather(*[call(f"预热查询 {i}") for i in range(max(concurrency, 1))], return_exceptions=True)
+    started = time.perf_counter()
+    await asyncio.gather(*[one(query) for query in queries])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(queries),
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "elapsed": elapsed,
+        "throughput": len(queries) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+    }
+
+
+async def abench_retrieve(queries: Sequence[str], concurrency: int) -> Dict:
+    """
+    直接调用 aretrieve_index（不经过缓存），测量单次检索。
+    """
+    from app.code_agent.rag.backends import create_client_from_env
+    from app.code_agent.rag.retrieval import aretrieve_index
+
+    client = create_client_from_env()
+    workspace_id = os.getenv("workspace_id")
+    index_id = os.getenv("knowledge_base_id")
+    return await arun_load(lambda query: aretrieve_index(client, workspace_id, index_id, query), queries, concurrency)
+
+
+async def abench_query(queries: Sequence[str], concurrency: int) -> Dict:
+    """
+    调用 query_rag_from_bailian 的工具逻辑（缓存、熔断、重排及拼接），测量端到端延迟。
+    """
+    from app.code_agent.mcp.rag import aquery_rag
+
+    async def call(query):
+        result = await aquery_rag(query)
+        if result.startswith(("执行错误", "查询失败", "错误")):
+            raise RuntimeError(result)
+
+    return await arun_load(call, queries, concurrency)
+
+
+async def abench_ingest(files: int, file_size: int = 4096) -> Dict:
+    """
+    导入 files 个生成的文档并跟踪追加导入任务直到完成，以每个文档所在任务完成的时间点作为延迟样本，
+    覆盖申请租约、上传、添加文件、解析状态查询、提交导入任务及任务状态查询的全部接口。
+    """
+    from app.code_agent.rag.backends import create_client_from_env
+    from app.code_agent.rag.ingest import IngestPipeline
+    from app.code_agent.rag.jobs import IndexJobError, IndexJobTracker
+
+    client = create_client_from_env()
+    workspace_id = os.getenv("workspace_id")
+    index_id = os.getenv("knowledge_base_id")
+    tracker = IndexJobTracker(client, workspace_id, initial_interval=0.05, max_interval=0.5)
+    completions: List[float] = []
+    errors: Dict[str, int] = {}
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp_dir:
+        paths = []
+        for i in range(files):
+            path = os.path.join(tmp_dir, f"doc{i:05d}.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# 基准文档 {i}\n" + "内容" * (file_size // 6))
+            paths.append(path)
+        pipeline = IngestPipeline(client, workspace_id, index_id, poll_interval=0.05, progress=lambda snapshot: None)
+        started = time.perf_counter()
+        results = await pipeline.arun(paths)
+
+        for result in results:
+            if result["status"] != "success":
+                errors[result["stage"]] = errors.get(result["stage"], 0) + 1
+        jobs = Counter(result["job_id"] for result in results if result["status"] == "success")
+
+        async def wait_job(job_id, documents):
+            try:
+                await tracker.track(index_id, job_id)
+            except IndexJobError:
+                errors["job"] = errors.get("job", 0) + documents
+                return
+            completions.extend([(time.perf_counter() - started) * 1000] * documents)
+
+        await asyncio.gather(*[wait_job(job_id, documents) for job_id, documents in jobs.items()])
+        elapsed = time.perf_counter() - started
+
+    job_stats = tracker.stats()
+    return {
+        "requests": files,
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "elapsed": elapsed,
+        "throughput": files / elapsed if elapsed else 0.0,
+        "latency_ms": summarize(completions),
+        "index_jobs": {name: job_stats[name] for name in ("tracked", "completed", "failed", "polls")},
+    }
+
+
+async def arun_benchmark(scenarios: Sequence[str] = SCENARIOS, requests: int = DEFAULT_REQUESTS,
+                         concurrency: int = DEFAULT_CONCURRENCY, distinct: int = DEFAULT_DISTINCT,
+                         files: int = DEFAULT_FILES) -> Dict[str, Dict]:
+    """
+    依次运行指定的场景，调用前需已配置指向模拟服务的环境变量（见 configure_env）。
+
+    返回:
+        dict: 场景 -> 统计结果。
+    """
+    queries = make_queries(requests, distinct)
+    report = {}
+    for scenario in scenarios:
+        if scenario == "retrieve":
+            report[scenario] = await abench_retrieve(queries, concurrency)
+        elif scenario == "query":
+            report[scenario] = await abench_query(queries, concurrency)
+        elif scenario == "ingest":
+            report[scenario] = await abench_ingest(files)
+        else:
+            raise ValueError(f"不支持的测试场景: {scenario}")
+    return report
+
+
+def configure_env(endpoint: str):
+    """
+    将百炼客户端指向模拟服务；未配置密钥时使用假的密钥。
+    """
+    os.environ.update(BENCHMARK_ENV)
+    os.environ["BAILIAN_ENDPOINT"] = endpoint
+    for name, value in FAKE_CREDENTIALS.items():
+        os.environ.setdefault(name, value)
+
+
+def print_report(report: Dict[str, Dict]):
+    """
+    打印基准测试结果。
+    """
+    print(f"{'场景':<10}{'请求':>8}{'错误':>6}{'吞吐(/s)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for scenario, stats in report.items():
+        latency = stats["latency_ms"]
+        if not latency["count"]:
+            print(f"{scenario:<10}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput']:>12.1f}")
+            continue
+        print(f"{scenario:<10}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput']:>12.1f}"
+              f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}{latency['max']:>10.1f}")
+    for scenario, stats in report.items():
+        if "index_jobs" in stats:
+            print(f"{scenario} 导入任务: {stats['index_jobs']}")
+
+
+def run_benchmark(profile: Optional[FakeProfile] = None, endpoint: Optional[str] = None, **kwargs) -> Dict[str, Dict]:
+    """
+    启动模拟服务（指定 endpoint 时直接使用已有服务）并运行基准测试。
+
+    参数:
+        profile (FakeProfile): 模拟服务的行为配置。
+        endpoint (str): 已启动的模拟服务地址。
+        **kwargs: 传给 arun_benchmark 的其他参数。
+
+    返回:
+        dict: 场景 -> 统计结果，模拟服务收到的各接口请求数记录在 server_requests 中。
+    """
+    if endpoint:
+        configure_env(endpoint)
+        return asyncio.run(arun_benchmark(**kwargs))
+    with FakeBailianServer(profile) as server:
+        configure_env(server.endpoint)
+        report = asyncio.run(arun_benchmark(**kwargs))
+        report["server_requests"] = dict(server.state.requests)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 解析命令行参数，指定服务档位、场景和负载
+    parser = argparse.ArgumentParser(description="基于本地模拟百炼服务的知识库性能基准测试")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="normal", help="模拟服务档位")
+    parser.add_argument("--endpoint", default=None, help="使用已启动的模拟服务（host:port）")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="测试场景，可重复指定，默认全部")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="检索场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="检索场景的并发数")
+    parser.add_argument("--distinct", type=int, default=DEFAULT_DISTINCT, help="不同查询的数量")
+    parser.add_argument("--files", type=int, default=DEFAULT_FILES, help="导入场景的文档数")
+    parser.add_argument("--output", default=None, help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        PROFILES[args.profile], args.endpoint,
+        scenarios=args.scenario or SCENARIOS,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        distinct=args.distinct,
+        files=args.files,
+    )
+    server_requests = report.pop("server_requests", None)
+    print_report(report)
+    if server_requests:
+        print(f"模拟服务请求数: {server_requests}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
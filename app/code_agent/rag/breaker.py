@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库检索熔断器
+连续失败或连续慢调用达到阈值后熔断，熔断期间检索请求立即失败而不是等待 SDK 超时；
+冷却时间过后进入半开状态，只放行少量探测请求，探测成功则恢复，失败则重新熔断
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.code_agent.utils.env import get_env_number
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 默认配置
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_SLOW_CALL_MS = 5000.0
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_HALF_OPEN_PROBES = 1
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    熔断器处于打开状态，请求未发出
+    """
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    关闭状态下统计连续失败次数（耗时超过 slow_call_ms 的调用也计为失败），达到 failure_threshold 后打开；
+    打开 reset_timeout 秒后转为半开，同时最多放行 half_open_probes 个探测请求。
+    调用方先调用 allow()，放行后必须以 record_success() 或 record_failure() 结束本次调用。
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 slow_call_ms: float = DEFAULT_SLOW_CALL_MS, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 half_open_probes: int = DEFAULT_HALF_OPEN_PROBES):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.slow_call_ms = slow_call_ms
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(half_open_probes, 1)
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """
+        当前状态，打开超过冷却时间后视为半开。
+        """
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = STATE_HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        判断是否放行本次请求。
+
+        返回:
+            bool: 关闭状态或半开状态下仍有探测名额时返回 True。
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency_ms: float = 0.0):
+        """
+        记录一次成功的调用，耗时超过 slow_call_ms 时按失败处理。
+
+        参数:
+            latency_ms (float): 调用耗时（毫秒）。
+        """
+        if self.slow_call_ms and latency_ms > self.slow_call_ms:
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state != STATE_CLOSED:
+                self._state = STATE_CLOSED
+                self._probes = 0
+
+    def record_failure(self):
+        """
+        记录一次失败的调用，半开状态下的失败立即重新熔断。
+        """
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == STATE_HALF_OPEN or (state == STATE_CLOSED and self._failures >= self.failure_threshold):
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self.opens += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取熔断器统计信息。
+
+        返回:
+            dict: 当前状态、连续失败次数、熔断次数及被拒绝的请求数。
+        """
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "failures": self._failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+            }
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> Optional[CircuitBreaker]:
+    """
+    获取进程内共享的百炼检索熔断器，配置来自环境变量：
+    RAG_BREAKER_ENABLED、RAG_BREAKER_FAILURES、RAG_BREAKER_SLOW_MS、RAG_BREAKER_RESET_SECONDS、RAG_BREAKER_PROBES。
+
+    返回:
+        CircuitBreaker: 熔断器，RAG_BREAKER_ENABLED=0 时返回 None。
+    """
+    global _breaker
+    if os.getenv("RAG_BREAKER_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=get_env_number("RAG_BREAKER_FAILURES", DEFAULT_FAILURE_THRESHOLD),
+                    slow_call_ms=get_env_number("RAG_BREAKER_SLOW_MS", DEFAULT_SLOW_CALL_MS),
+                    reset_timeout=get_env_number("RAG_BREAKER_RESET_SECONDS", DEFAULT_RESET_TIMEOUT),
+                    half_open_probes=get_env_number("RAG_BREAKER_PROBES", DEFAULT_HALF_OPEN_PROBES),
+                )
+    return _breaker
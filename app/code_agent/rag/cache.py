@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库检索缓存
+按 (业务空间, 知识库, 归一化查询) 精确匹配缓存检索结果，支持 TTL、LRU 淘汰以及可选的 SQLite 磁盘层
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.utils.env import get_env_number
+
+# 默认缓存配置
+DEFAULT_TTL = 600
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# 过期条目继续保留的时间（秒），检索服务不可用时作为最后一次成功的结果返回
+DEFAULT_STALE_TTL = 86400
+
+# 标记过期结果的响应头
+STALE_HEADER = "x-rag-stale"
+# 过期结果拼接成知识文本时的提示
+STALE_NOTICE = "（知识库服务暂不可用，以下为缓存的历史检索结果，可能已过期）"
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化查询文本：全半角统一、去除首尾空白、合并连续空白并转为小写。
+
+    参数:
+        query (str): 原始查询。
+
+    返回:
+        str: 归一化后的查询。
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def make_cache_key(workspace_id: str, index_id: str, query: str) -> str:
+    """
+    生成缓存键。
+
+    参数:
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        query (str): 原始查询。
+
+    返回:
+        str: 缓存键。
+    """
+    return "\x1f".join([workspace_id or "", index_id or "", normalize_query(query)])
+
+
+def encode_response(response) -> str:
+    """
+    将阿里云百炼检索响应序列化为 JSON 字符串。
+    """
+    return json.dumps(response.to_map(), ensure_ascii=False)
+
+
+def decode_response(value: str):
+    """
+    将序列化的 JSON 字符串还原为阿里云百炼检索响应。
+    """
+    return bailian_20231229_models.RetrieveResponse().from_map(json.loads(value))
+
+
+def mark_stale(response):
+    """
+    将检索响应标记为过期结果。
+    """
+    response.headers = dict(response.headers or {}, **{STALE_HEADER: "1"})
+    return response
+
+
+def is_stale(response) -> bool:
+    """
+    判断检索响应是否为过期结果。
+    """
+    return bool((getattr(response, "headers", None) or {}).get(STALE_HEADER))
+
+
+def mark_stale_text(response, text: str) -> str:
+    """
+    检索响应为过期结果时，在拼接好的知识文本前加上过期提示。
+
+    参数:
+        response: 检索响应。
+        text (str): 知识文本。
+
+    返回:
+        str: 知识文本。
+    """
+    return f"{STALE_NOTICE}\n{text}" if is_stale(response) else text
+
+
+def is_cacheable(response) -> bool:
+    """
+    判断检索响应是否可以缓存，只缓存成功返回数据的响应。
+    """
+    body = getattr(response, "body", None)
+    return bool(body and getattr(body, "data", None) is not None)
+
+
+class RetrievalCache:
+    """
+    检索结果缓存
+
+    内存层为带 TTL 的 LRU，按条目数和字节数双重限制；
+    配置 db_path 后启用 SQLite 磁盘层，MCP 服务重启后仍可命中。
+    过期条目在 stale_ttl 秒内继续保留（默认不保留），只能通过 get_stale 取出。
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES, db_path: Optional[str] = None,
+                 stale_ttl: float = 0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+
+        # key -> (过期时间, 序列化后的响应)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+        self._db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        """
+        打开 SQLite 磁盘层并清理已过期的条目。
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS retrieval_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM retrieval_cache WHERE expires_at < ?", (time.time() - self.stale_ttl,))
+
+    def get(self, workspace_id: str, index_id: str, query: str):
+        """
+        查询缓存。
+
+        参数:
+            workspace_id (str): 业务空间ID。
+            index_id (str): 知识库ID。
+            query (str): 原始查询。
+
+        返回:
+            命中时返回阿里云百炼检索响应，未命中返回 None。
+        """
+        key = make_cache_key(workspace_id, index_id, query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return decode_response(value)
+                if expires_at + self.stale_ttl < now:
+                    self._remove(key)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM retrieval_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] >= now:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return decode_response(row[0])
+
+            self.misses += 1
+            return None
+
+    def get_stale(self, workspace_id: str, index_id: str, query: str):
+        """
+        查询最后一次成功的结果，已过期但仍在保留期内的条目也会返回。
+
+        参数:
+            workspace_id (str): 业务空间ID。
+            index_id (str): 知识库ID。
+            query (str): 原始查询。
+
+        返回:
+            命中时返回标记为过期结果的检索响应，未命中返回 None。
+        """
+        key = make_cache_key(workspace_id, index_id, query)
+        since = time.time() - self.stale_ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            value = entry[1] if entry is not None and entry[0] >= since else None
+            if value is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM retrieval_cache WHERE key = ? AND expires_at >= ?", (key, since)
+                ).fetchone()
+                value = row[0] if row is not None else None
+            if value is None:
+                return None
+            self.stale_hits += 1
+        return mark_stale(decode_response(value))
+
+    def put(self, workspace_id: str, index_id: str, query: str, response):
+        """
+        写入缓存，非成功的响应会被忽略。
+
+        参数:
+            workspace_id (str): 业务空间ID。
+            index_id (str): 知识库ID。
+            query (str): 原始查询。
+            response: 阿里云百炼检索响应。
+        """
+        if not is_cacheable(response):
+            return
+        key = make_cache_key(workspace_id, index_id, query)
+        value = encode_response(response)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO retrieval_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+
+    def clear(self):
+        """
+        清空内存层和磁盘层。
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM retrieval_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息。
+
+        返回:
+            dict: 命中、未命中、淘汰次数以及当前占用。
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _store(self, key: str, value: str, expires_at: float):
+        """
+        写入内存层并按 LRU 淘汰，调用方需持有锁。
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        """
+        从内存层移除条目，调用方需持有锁。
+        """
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    """
+    获取进程内共享的检索缓存，配置来自环境变量：
+    RAG_CACHE_ENABLED、RAG_CACHE_TTL、RAG_CACHE_MAX_ENTRIES、RAG_CACHE_MAX_BYTES、RAG_CACHE_DB、RAG_CACHE_STALE_TTL。
+
+    返回:
+        RetrievalCache: 检索缓存，RAG_CACHE_ENABLED=0 时返回 None。
+    """
+    global _cache
+    if os.getenv("RAG_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache(
+                    ttl=get_env_number("RAG_CACHE_TTL", float(DEFAULT_TTL)),
+                    max_entries=get_env_number("RAG_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+                    max_bytes=get_env_number("RAG_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+                    db_path=os.getenv("RAG_CACHE_DB") or None,
+                    stale_ttl=get_env_number("RAG_CACHE_STALE_TTL", float(DEFAULT_STALE_TTL)),
+                )
+    return _cache
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+百炼客户端注册表
+按 (endpoint, access_key_id, workspace_id) 在进程内复用百炼客户端，
+避免每次检索都重新构建客户端、签名器以及 HTTP 连接；
+文件上传同样复用一个带连接池的 requests Session
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from alibabacloud_bailian20231229 import client as bailian_20231229_client
+from alibabacloud_tea_openapi import models as open_api_models
+from alibabacloud_tea_util import models as util_models
+
+from app.code_agent.utils.env import get_env_number
+
+# 默认的百炼服务地址
+DEFAULT_ENDPOINT = 'bailian.cn-beijing.aliyuncs.com'
+
+# 默认的请求协议，连接本地模拟服务（fake_bailian）时设置 BAILIAN_PROTOCOL=http
+DEFAULT_PROTOCOL = 'https'
+
+# 默认的连接池大小（每个 host 保持的空闲 keep-alive 连接数）
+DEFAULT_POOL_SIZE = 16
+
+_clients: Dict[Tuple[str, str, str, str], bailian_20231229_client.Client] = {}
+_lock = threading.Lock()
+
+_upload_session: Optional[requests.Session] = None
+
+
+def get_pool_size() -> int:
+    """
+    获取连接池大小，可通过环境变量 BAILIAN_POOL_SIZE 配置。
+
+    返回:
+        int: 连接池大小。
+    """
+    return max(get_env_number('BAILIAN_POOL_SIZE', DEFAULT_POOL_SIZE), 1)
+
+
+def create_runtime_options() -> util_models.RuntimeOptions:
+    """
+    创建开启 keep-alive 的运行时参数，使请求复用连接池中的连接。
+
+    返回:
+        util_models.RuntimeOptions: 运行时参数。
+    """
+    return util_models.RuntimeOptions(
+        keep_alive=True,
+        max_idle_conns=get_pool_size()
+    )
+
+
+def get_client(access_key_id: str, access_key_secret: str, workspace_id: Optional[str] = None,
+               endpoint: Optional[str] = None) -> bailian_20231229_client.Client:
+    """
+    获取共享的百炼客户端，同一 (endpoint, access_key_id, workspace_id, 协议) 只创建一次。
+
+    参数:
+        access_key_id (str): AccessKey ID。
+        access_key_secret (str): AccessKey Secret。
+        workspace_id (str): 业务空间ID。
+        endpoint (str): 服务地址，默认读取环境变量 BAILIAN_ENDPOINT。
+
+    返回:
+        bailian_20231229_client.Client: 共享的客户端。
+    """
+    endpoint = endpoint or os.getenv('BAILIAN_ENDPOINT') or DEFAULT_ENDPOINT
+    protocol = os.getenv('BAILIAN_PROTOCOL') or DEFAULT_PROTOCOL
+    key = (endpoint, access_key_id, workspace_id or '', protocol)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        # 双重检查，避免并发调用时重复创建
+        client = _clients.get(key)
+        if client is None:
+            config = open_api_models.Config(
+                access_key_id=access_key_id,
+                access_key_secret=access_key_secret
+            )
+            config.endpoint = endpoint
+            config.protocol = protocol
+            config.max_idle_conns = get_pool_size()
+            client = bailian_20231229_client.Client(config=config)
+            _clients[key] = client
+        return client
+
+
+def get_upload_session() -> requests.Session:
+    """
+    获取文件上传共享的 requests Session，连接池大小与百炼客户端一致，
+    并发上传时复用 keep-alive 连接。
+
+    返回:
+        requests.Session: 共享的 Session。
+    """
+    global _upload_session
+    if _upload_session is None:
+        with _lock:
+            if _upload_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=get_pool_size(), pool_maxsize=get_pool_size())
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _upload_session = session
+    return _upload_session
+
+
+def clear_clients():
+    """
+    清空客户端注册表及上传 Session，下次获取时重新创建（例如密钥轮换后）。
+    """
+    global _upload_session
+    with _lock:
+        _clients.clear()
+        if _upload_session is not None:
+            _upload_session.close()
+            _upload_session = None
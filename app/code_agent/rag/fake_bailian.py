@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟百炼服务
+在本地 HTTP 端口上模拟 rag 模块用到的百炼接口（检索、上传租约、文件上传、添加文件、文件解析状态、
+追加导入任务及任务状态、文档和切片列表、删除文档），可配置延迟、长尾、错误率和返回内容大小，
+用于在不访问阿里云的情况下做性能测试和回归测试。
+将 BAILIAN_ENDPOINT 设为服务地址、BAILIAN_PROTOCOL 设为 http 即可让百炼客户端访问本服务
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class FakeProfile:
+    """
+    模拟服务的行为配置
+
+    每个接口的延迟为 latency_ms 加上 [0, jitter_ms] 内的随机值，并以 tail_rate 的概率再增加 tail_ms 的长尾延迟；
+    以 error_rate 的概率返回 HTTP 500；检索返回 nodes 个节点，每个节点约 node_chars 个字符；
+    文件解析和索引任务分别在查询 parse_polls、job_polls 次后完成。
+    """
+
+    latency_ms: float = 20.0
+    jitter_ms: float = 10.0
+    tail_rate: float = 0.0
+    tail_ms: float = 1000.0
+    error_rate: float = 0.0
+    nodes: int = 5
+    node_chars: int = 400
+    parse_polls: int = 1
+    job_polls: int = 1
+    seed: Optional[int] = None
+
+
+# 预置的档位，可通过 --profile 选择
+PROFILES = {
+    "fast": FakeProfile(latency_ms=5.0, jitter_ms=2.0),
+    "normal": FakeProfile(),
+    "degraded": FakeProfile(latency_ms=200.0, jitter_ms=100.0, tail_rate=0.05, tail_ms=3000.0, error_rate=0.05),
+    "large": FakeProfile(nodes=20, node_chars=2000),
+}
+
+_WORDS = ("终端", "命令", "规范", "目录", "文件", "权限", "提交", "分支", "部署", "日志", "缓存", "检索",
+          "配置", "接口", "超时", "重试", "索引", "文档", "工具", "模型")
+
+
+def _make_text(seed: str, chars: int) -> str:
+    """
+    由种子确定性地生成指定长度的文本，同一查询每次返回相同的内容。
+    """
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < chars:
+        word = rng.choice(_WORDS)
+        parts.append(word)
+        size += len(word)
+    return "".join(parts)[:chars]
+
+
+class FakeBailianState:
+    """
+    模拟服务的内存状态：上传租约、文件、索引任务及各知识库的文档
+    """
+
+    def __init__(self, profile: FakeProfile):
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self.lock = threading.Lock()
+        self.leases: Dict[str, Dict] = {}
+        self.files: Dict[str, Dict] = {}
+        self.jobs: Dict[str, Dict] = {}
+        self.documents: Dict[str, Dict[str, Dict]] = {}
+        self.requests: Dict[str, int] = {}
+
+    def delay(self) -> float:
+        """
+        按配置抽样本次请求的延迟（秒）。
+        """
+        with self.lock:
+            delay = self.profile.latency_ms + self.rng.uniform(0, self.profile.jitter_ms)
+            if self.rng.random() < self.profile.tail_rate:
+                delay += self.profile.tail_ms
+        return delay / 1000
+
+    def should_fail(self) -> bool:
+        """
+        按配置的错误率决定本次请求是否失败。
+        """
+        with self.lock:
+            return self.rng.random() < self.profile.error_rate
+
+    def count(self, action: str):
+        with self.lock:
+            self.requests[action] = self.requests.get(action, 0) + 1
+
+
+class FakeBailianHandler(BaseHTTPRequestHandler):
+    """
+    模拟百炼 OpenAPI 的请求处理器，路由与 SDK 中各接口的 pathname 和 method 一致
+    """
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭 Nagle 算法时会与客户端的延迟确认叠加出约 40ms 的额外延迟
+    disable_nagle_algorithm = True
+    server: "FakeBailianServer"
+
+    ROUTES = (
+        ("POST", re.compile(r"^/[^/]+/index/retrieve$"), "retrieve"),
+        ("POST", re.compile(r"^/[^/]+/datacenter/category/[^/]+$"), "apply_lease"),
+        ("PUT", re.compile(r"^/upload/(?P<lease_id>[^/]+)$"), "upload"),
+        ("PUT", re.compile(r"^/[^/]+/datacenter/file$"), "add_file"),
+        ("GET", re.compile(r"^/[^/]+/datacenter/file/(?P<file_id>[^/]+)/?$"), "describe_file"),
+        ("POST", re.compile(r"^/[^/]+/index/add_documents_to_index$"), "submit_job"),
+        ("GET", re.compile(r"^/[^/]+/index/job/status$"), "job_status"),
+        ("GET", re.compile(r"^/[^/]+/index/list_index_documents$"), "list_documents"),
+        ("POST", re.compile(r"^/[^/]+/index/list_chunks$"), "list_chunks"),
+        ("POST", re.compile(r"^/[^/]+/index/delete_index_document$"), "delete_documents"),
+        ("GET", re.compile(r"^/[^/]+/index/list_indices$"), "list_indices"),
+    )
+
+    def log_message(self, format, *args):
+        # 压测时不逐条输出访问日志
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def _dispatch(self, method: str):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        for route_method, pattern, action in self.ROUTES:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self._send(404, {"Code": "NotFound", "Message": f"{method} {url.path}"})
+            return
+
+        state = self.server.state
+        state.count(action)
+        time.sleep(state.delay())
+        if state.should_fail():
+            self._send(500, {"Code": "InternalError", "Message": "模拟的服务端错误", "Success": False})
+            return
+        if action == "upload":
+            self._upload(match.group("lease_id"), raw)
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if raw and "json" in (self.headers.get("Content-Type") or ""):
+            params.update(json.loads(raw))
+        elif raw:
+            params.update({key: values[-1] for key, values in parse_qs(raw.decode("utf-8")).items()})
+        params.update(match.groupdict())
+        data = getattr(self, f"_{action}")(state, params)
+        self._send(200, {
+            "Code": "Success",
+            "Success": True,
+            "Status": "200",
+            "RequestId": uuid.uuid4().hex,
+            "Data": data,
+        })
+
+    def _send(self, status: int, body: Dict):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    @staticmethod
+    def _id_list(value) -> List[str]:
+        """
+        解析 SDK 以 JSON 字符串传递的 ID 列表。
+        """
+        if isinstance(value, list):
+            return value
+        try:
+            return list(json.loads(value))
+        except (TypeError, ValueError):
+            return [value] if value else []
+
+    def _retrieve(self, state: FakeBailianState, params: Dict) -> Dict:
+        query = params.get("Query", "")
+        index_id = params.get("IndexId", "")
+        nodes = []
+        for i in range(state.profile.nodes):
+            seed = hashlib.md5(f"{index_id}\x1f{query}\x1f{i}".encode("utf-8")).hexdigest()
+            nodes.append({
+                "Text": f"{query} {_make_text(seed, state.profile.node_chars)}",
+                "Score": round(1.0 - i / (state.profile.nodes + 1), 4),
+                "Metadata": {"doc_name": f"doc-{seed[:6]}.md", "doc_id": f"doc-{seed[:12]}"},
+            })
+        return {"Nodes": nodes}
+
+    def _apply_lease(self, state: FakeBailianState, params: Dict) -> Dict:
+        lease_id = uuid.uuid4().hex
+        with state.lock:
+            state.leases[lease_id] = {"name": params.get("FileName", ""), "size": 0, "uploaded": False}
+        host, port = self.server.server_address[:2]
+        return {
+            "FileUploadLeaseId": lease_id,
+            "Type": "HTTP",
+            "Param": {
+                "Method": "PUT",
+                "Url": f"http://{host}:{port}/upload/{lease_id}",
+                "Headers": {"X-bailian-extra": lease_id, "Content-Type": "application/octet-stream"},
+            },
+        }
+
+    def _upload(self, lease_id: str, raw: bytes):
+        state = self.server.state
+        with state.lock:
+            lease = state.leases.get(lease_id)
+            if lease is not None:
+                lease.update(size=len(raw), uploaded=True)
+        if lease is None:
+            self._send(404, {"Code": "LeaseNotFound", "Message": lease_id})
+        else:
+            self._send(200, {})
+
+    def _add_file(self, state: FakeBailianState, params: Dict) -> Dict:
+        file_id = f"file_{uuid.uuid4().hex}"
+        with state.lock:
+            lease = state.leases.get(params.get("LeaseId"), {"name": "", "size": 0})
+            state.files[file_id] = {"name": lease["name"], "size": lease["size"], "polls": 0}
+        return {"FileId": file_id, "Parser": params.get("Parser")}
+
+    def _describe_file(self, state: FakeBailianState, params: Dict) -> Dict:
+        file_id = params["file_id"]
+        with state.lock:
+            info = state.files.get(file_id)
+            if info is None:
+                return {"FileId": file_id, "Status": "PARSE_FAILED"}
+            info["polls"] += 1
+            done = info["polls"] >= state.profile.parse_polls
+        return {"FileId": file_id, "FileName": info["name"], "SizeInBytes": info["size"],
+                "Status": "PARSE_SUCCESS" if done else "PARSING"}
+
+    def _submit_job(self, state: FakeBailianState, params: Dict) -> Dict:
+        job_id = uuid.uuid4().hex
+        with state.lock:
+            state.jobs[job_id] = {
+                "index_id": params.get("IndexId", ""),
+                "documents": self._id_list(params.get("DocumentIds")),
+                "polls": 0,
+            }
+        return {"Id": job_id}
+
+    def _job_status(self, state: FakeBailianState, params: Dict) -> Dict:
+        job_id = params.get("JobId", "")
+        with state.lock:
+            job = state.jobs.get(job_id)
+            if job is None:
+                return {"JobId": job_id, "Status": "FAILED", "Documents": []}
+            job["polls"] += 1
+            done = job["polls"] >= state.profile.job_polls
+            if done:
+                documents = state.documents.setdefault(job["index_id"], {})
+                for doc_id in job["documents"]:
+                    info = state.files.get(doc_id, {"name": doc_id, "size": 0})
+                    documents[doc_id] = {"Id": doc_id, "Name": info["name"], "Size": info["size"], "Status": "FINISH"}
+        return {
+            "JobId": job_id,
+            "Status": "COMPLETED" if done else "RUNNING",
+            "Documents": [{"DocId": doc_id, "Status": "FINISH" if done else "RUNNING"} for doc_id in job["documents"]],
+        }
+
+    def _list_documents(self, state: FakeBailianState, params: Dict) -> Dict:
+        page_number = int(params.get("PageNumber") or 1)
+        page_size = int(params.get("PageSize") or 10)
+        with state.lock:
+            documents = sorted(state.documents.get(params.get("IndexId", ""), {}).values(), key=lambda d: d["Id"])
+        start = (page_number - 1) * page_size
+        return {"Documents": documents[start:start + page_size], "TotalCount": len(documents),
+                "PageNumber": page_number, "PageSize": page_size}
+
+    def _list_chunks(self, state: FakeBailianState, params: Dict) -> Dict:
+        file_id = params.get("Filed", "")
+        with state.lock:
+            document = state.documents.get(params.get("IndexId", ""), {}).get(file_id)
+        if document is None:
+            return {"Nodes": [], "Total": 0}
+        nodes = [{"Text": _make_text(f"{file_id}\x1f{i}", state.profile.node_chars),
+                  "Metadata": {"doc_name": document["Name"]}} for i in range(state.profile.nodes)]
+        page_num = int(params.get("PageNum") or 1)
+        page_size = int(params.get("PageSize") or 10)
+        start = (page_num - 1) * page_size
+        return {"Nodes": nodes[start:start + page_size], "Total": len(nodes)}
+
+    def _delete_documents(self, state: FakeBailianState, params: Dict) -> Dict:
+        doc_ids = self._id_list(params.get("DocumentIds"))
+        with state.lock:
+            documents = state.documents.get(params.get("IndexId", ""), {})
+            deleted = [doc_id for doc_id in doc_ids if documents.pop(doc_id, None) is not None]
+        return {"DeletedDocument": deleted}
+
+    def _list_indices(self, state: FakeBailianState, params: Dict) -> Dict:
+        with state.lock:
+            indices = [{"Id": index_id, "Name": index_id} for index_id in sorted(state.documents)]
+        return {"Indices": indices, "TotalCount": len(indices)}
+
+
+class FakeBailianServer(ThreadingHTTPServer):
+    """
+    模拟百炼服务，每个请求一个线程；可作为上下文管理器在后台线程中运行。
+
+    用法:
+        with FakeBailianServer(PROFILES["fast"]) as server:
+            os.environ["BAILIAN_ENDPOINT"] = server.endpoint
+    """
+
+    daemon_threads = True
+    # 默认的监听队列只有 5，并发建立连接时会因 SYN 重传产生数百毫秒的虚假延迟
+    request_queue_size = 128
+
+    def __init__(self, profile: Optional[FakeProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), FakeBailianHandler)
+        self.state = FakeBailianState(profile or FakeProfile())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        """
+        服务地址（host:port），用作 BAILIAN_ENDPOINT。
+        """
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "FakeBailianServer":
+        """
+        在后台线程中启动服务。
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-bailian", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        停止服务并释放端口。
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 解析命令行参数，指定监听地址和服务行为
+    parser = argparse.ArgumentParser(description="启动本地模拟百炼服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="normal", help="预置档位")
+    parser.add_argument("--latency-ms", type=float, default=None, help="基础延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=None, help="错误率")
+    parser.add_argument("--nodes", type=int, default=None, help="每次检索返回的节点数")
+    parser.add_argument("--node-chars", type=int, default=None, help="每个节点的字符数")
+    args = parser.parse_args()
+
+    profile = FakeProfile(**vars(PROFILES[args.profile]))
+    for name in ("latency_ms", "error_rate", "nodes", "node_chars"):
+        if getattr(args, name) is not None:
+            setattr(profile, name, getattr(args, name))
+    server = FakeBailianServer(profile, args.host, args.port)
+    print(f"模拟百炼服务已启动: BAILIAN_ENDPOINT={server.endpoint} BAILIAN_PROTOCOL=http，档位: {profile}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
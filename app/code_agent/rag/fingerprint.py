@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文件指纹缓存
+按 (路径, inode, 大小, mtime_ns) 持久化文件的 MD5，未变化的文件不再重新计算；
+大文件通过 mmap 计算哈希，多个文件在线程池中并行计算（hashlib 计算时释放 GIL）
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+# 分块读取的缓冲区大小
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# 超过该大小的文件使用 mmap 计算哈希
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# 默认的指纹数据库路径
+DEFAULT_DB_PATH = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_fingerprints.sqlite3")
+
+
+def hash_file(file_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> str:
+    """
+    计算文件的 MD5，大文件使用 mmap，其余按 buffer_size 分块读取。
+
+    参数:
+        file_path (str): 文件路径。
+        buffer_size (int): 分块读取的缓冲区大小。
+
+    返回:
+        str: 文件的 MD5 哈希值。
+    """
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hash_md5.update(mapped)
+        else:
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                hash_md5.update(view[:n])
+    return hash_md5.hexdigest()
+
+
+class FingerprintCache:
+    """
+    文件指纹缓存
+
+    内存中保存 路径 -> (inode, 大小, mtime_ns, MD5)；配置 db_path 后持久化到 SQLite，
+    文件的 inode、大小或修改时间任一变化即视为未命中。
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._entries: Dict[str, Tuple[int, int, int, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        """
+        打开 SQLite 数据库并加载已有的指纹。
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_fingerprints ("
+            "path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, md5 TEXT NOT NULL)"
+        )
+        for path, inode, size, mtime_ns, md5 in self._db.execute(
+                "SELECT path, inode, size, mtime_ns, md5 FROM file_fingerprints"):
+            self._entries[path] = (inode, size, mtime_ns, md5)
+
+    @staticmethod
+    def _signature(st: os.stat_result) -> Tuple[int, int, int]:
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def get(self, path: str, st: os.stat_result) -> Optional[str]:
+        """
+        查询文件指纹。
+
+        参数:
+            path (str): 文件绝对路径。
+            st (os.stat_result): 文件当前的 stat 结果。
+
+        返回:
+            str: 文件未变化时返回 MD5，否则返回 None。
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:3] == self._signature(st):
+                self.hits += 1
+                return entry[3]
+            self.misses += 1
+            return None
+
+    def put_many(self, items: Iterable[Tuple[str, os.stat_result, str]]):
+        """
+        批量写入文件指纹，磁盘层在一个事务中写入。
+
+        参数:
+            items (Iterable[tuple]): (文件绝对路径, stat 结果, MD5)。
+        """
+        rows = [(path, *self._signature(st), md5) for path, st, md5 in items]
+        if not rows:
+            return
+        with self._lock:
+            for path, inode, size, mtime_ns, md5 in rows:
+                self._entries[path] = (inode, size, mtime_ns, md5)
+            if self._db is not None:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO file_fingerprints VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+
+    def put(self, path: str, st: os.stat_result, md5: str):
+        """
+        写入文件指纹。
+        """
+        self.put_many([(path, st, md5)])
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计信息。
+
+        返回:
+            dict: 命中数、未命中数及条目数。
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_cache: Optional[FingerprintCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_fingerprint_cache() -> Optional[FingerprintCache]:
+    """
+    获取进程内共享的指纹缓存，配置来自环境变量 RAG_FINGERPRINT_CACHE_ENABLED、RAG_FINGERPRINT_DB。
+
+    返回:
+        FingerprintCache: 指纹缓存，RAG_FINGERPRINT_CACHE_ENABLED=0 时返回 None。
+    """
+    global _cache
+    if os.getenv("RAG_FINGERPRINT_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FingerprintCache(os.getenv("RAG_FINGERPRINT_DB") or DEFAULT_DB_PATH)
+    return _cache
+
+
+def file_fingerprints(paths: Iterable[str], cache: Optional[FingerprintCache] = None,
+                      workers: Optional[int] = None) -> Dict[str, Tuple[str, str, int]]:
+    """
+    并行获取多个文件的名称、MD5 和大小，未变化的文件直接使用缓存的 MD5。
+
+    参数:
+        paths (Iterable[str]): 文件路径。
+        cache (FingerprintCache): 指纹缓存，为 None 时每次都重新计算。
+        workers (int): 计算哈希的线程数，默认按 CPU 核数。
+
+    返回:
+        dict: 文件路径 -> (file_name, file_md5, file_size)。
+    """
+    results = {}
+    pending = []
+    for path in paths:
+        st = os.stat(path)
+        md5 = cache.get(os.path.abspath(path), st) if cache is not None else None
+        if md5 is None:
+            pending.append((path, st))
+        else:
+            results[path] = (os.path.basename(path), md5, st.st_size)
+
+    if pending:
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        if len(pending) == 1 or workers == 1:
+            hashes = [hash_file(path) for path, _ in pending]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="file-hash") as executor:
+                hashes = list(executor.map(hash_file, [path for path, _ in pending]))
+        for (path, st), md5 in zip(pending, hashes):
+            results[path] = (os.path.basename(path), md5, st.st_size)
+        if cache is not None:
+            cache.put_many((os.path.abspath(path), st, md5) for (path, st), md5 in zip(pending, hashes))
+    return results
+
+
+def file_fingerprint(path: str, cache: Optional[FingerprintCache] = None) -> Tuple[str, str, int]:
+    """
+    获取单个文件的名称、MD5 和大小。
+
+    参数:
+        path (str): 文件路径。
+        cache (FingerprintCache): 指纹缓存。
+
+    返回:
+        tuple: (file_name, file_md5, file_size)
+    """
+    return file_fingerprints([path], cache)[path]
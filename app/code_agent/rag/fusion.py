@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多知识库并发检索
+并发检索多个知识库（每个知识库单独超时），使用倒数排名融合（RRF）合并结果并截取全局 top-k
+"""
+
+import asyncio
+import os
+import sys
+from typing import Dict, List, Union
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.cache import is_cacheable, is_stale, mark_stale
+from app.code_agent.rag.retrieval import acached_retrieve_index
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_INDEX_TIMEOUT_MS = 3000
+DEFAULT_TOP_K = 5
+DEFAULT_RRF_K = 60
+
+
+def get_index_ids(index_id: Union[str, List[str], None] = None) -> List[str]:
+    """
+    获取需要检索的知识库ID列表。
+
+    优先使用传入的知识库ID；否则读取环境变量 knowledge_base_ids（逗号分隔），
+    未配置时回退到 knowledge_base_id。
+
+    参数:
+        index_id (str | list): 知识库ID或知识库ID列表。
+
+    返回:
+        list: 知识库ID列表。
+    """
+    if isinstance(index_id, (list, tuple)):
+        return [i for i in index_id if i]
+    if index_id:
+        return [index_id]
+    index_ids = os.getenv("knowledge_base_ids") or os.getenv("knowledge_base_id") or ""
+    return [i.strip() for i in index_ids.split(",") if i.strip()]
+
+
+def reciprocal_rank_fusion(ranked_lists: Dict[str, List], top_k: int = DEFAULT_TOP_K, k: int = DEFAULT_RRF_K):
+    """
+    倒数排名融合：节点得分为其在各列表中 1 / (k + 排名) 之和，文本相同的节点视为同一节点。
+
+    参数:
+        ranked_lists (dict): 知识库ID -> 按相关度排序的节点列表。
+        top_k (int): 返回的节点数。
+        k (int): RRF 平滑常数。
+
+    返回:
+        list: 融合后的节点字典列表，Score 为融合得分，Metadata 中记录来源知识库。
+    """
+    fused: Dict[str, Dict] = {}
+    for index_id, nodes in ranked_lists.items():
+        for rank, node in enumerate(nodes, start=1):
+            entry = fused.get(node.text)
+            if entry is None:
+                entry = node.to_map()
+                entry["Score"] = 0.0
+                entry["Metadata"] = dict(entry.get("Metadata") or {}, index_id=index_id)
+                fused[node.text] = entry
+            entry["Score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda node: node["Score"], reverse=True)[:top_k]
+
+
+async def amulti_index_retrieve(client, workspace_id, index_ids: List[str], query, timeout=None, top_k=None):
+    """
+    并发检索多个知识库并用 RRF 合并，总耗时取决于最慢的知识库而不是各知识库之和。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_ids (list): 知识库ID列表。
+        query (str): 原始输入prompt。
+        timeout (float): 单个知识库的超时时间（秒），默认读取 RAG_INDEX_TIMEOUT_MS。
+        top_k (int): 全局返回的节点数，默认读取 RAG_TOP_K。
+
+    返回:
+        与 retrieve_index 结构一致的检索响应。
+    """
+    if timeout is None:
+        timeout = get_env_number("RAG_INDEX_TIMEOUT_MS", DEFAULT_INDEX_TIMEOUT_MS) / 1000
+    if top_k is None:
+        top_k = get_env_number("RAG_TOP_K", DEFAULT_TOP_K)
+
+    results = await asyncio.gather(
+        *[
+            asyncio.wait_for(acached_retrieve_index(client, workspace_id, index_id, query), timeout)
+            for index_id in index_ids
+        ],
+        return_exceptions=True,
+    )
+
+    ranked_lists = {}
+    stale = False
+    first_response, first_error = None, None
+    for index_id, result in zip(index_ids, results):
+        if isinstance(result, BaseException):
+            # 在 stdio MCP 服务进程中运行，日志写入 stderr，避免破坏 stdout 上的 JSON-RPC 通信
+            print(f"知识库 {index_id} 检索失败: {type(result).__name__} {result}", file=sys.stderr)
+            first_error = first_error or result
+            continue
+        first_response = first_response or result
+        if is_cacheable(result):
+            ranked_lists[index_id] = result.body.data.nodes or []
+            stale = stale or is_stale(result)
+
+    if not ranked_lists:
+        # 全部失败时返回第一个原始响应以便调用方输出错误信息，没有响应则抛出异常
+        if first_response is not None:
+            return first_response
+        raise first_error
+
+    response = bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {
+            "Code": "Success",
+            "Success": True,
+            "Data": {"Nodes": reciprocal_rank_fusion(ranked_lists, top_k)},
+        },
+    })
+    # 任一知识库返回的是过期结果时，合并结果也标记为过期
+    return mark_stale(response) if stale else response
+
+
+async def aretrieve_indices(client, workspace_id, index_ids: List[str], query):
+    """
+    检索一个或多个知识库，只有一个知识库时直接返回其原始响应。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_ids (list): 知识库ID列表。
+        query (str): 原始输入prompt。
+
+    返回:
+        与 retrieve_index 结构一致的检索响应。
+    """
+    if len(index_ids) == 1:
+        return await acached_retrieve_index(client, workspace_id, index_ids[0], query)
+    return await amulti_index_retrieve(client, workspace_id, index_ids, query)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+对冲式混合检索
+同时发起远程百炼检索和本地索引检索：远程结果在截止时间内返回则优先使用，
+两者都按时返回时合并结果，远程超时或失败时回退到本地结果
+"""
+
+import asyncio
+from typing import Dict, List
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.cache import is_cacheable
+from app.code_agent.rag.fusion import aretrieve_indices, get_index_ids
+from app.code_agent.rag.local_index import get_local_index
+from app.code_agent.rag.telemetry import get_telemetry
+from app.code_agent.utils.env import get_env_number
+
+# 默认的远程检索截止时间（毫秒）
+DEFAULT_DEADLINE_MS = 800
+
+# 结果来源
+SOURCE_REMOTE = "remote"
+SOURCE_LOCAL = "local"
+SOURCE_MERGED = "merged"
+SOURCE_NONE = "none"
+
+# 截止时间后仍在运行的远程检索任务，完成后结果会写入检索缓存
+_pending_tasks = set()
+
+
+def get_deadline() -> float:
+    """
+    获取远程检索截止时间（秒），可通过环境变量 RAG_HYBRID_DEADLINE_MS 配置。
+
+    返回:
+        float: 截止时间（秒）。
+    """
+    return max(get_env_number("RAG_HYBRID_DEADLINE_MS", float(DEFAULT_DEADLINE_MS)), 0) / 1000
+
+
+def record_win(source: str):
+    """
+    记录一次混合检索的结果来源，计入遥测计数器 hybrid.win.<来源>。
+    """
+    get_telemetry().incr(f"hybrid.win.{source}")
+
+
+def merge_responses(primary, secondary):
+    """
+    合并两个检索响应：保留主响应的节点顺序，再追加次响应中文本不重复的节点。
+
+    参数:
+        primary: 主检索响应（远程）。
+        secondary: 次检索响应（本地）。
+
+    返回:
+        RetrieveResponse: 合并后的检索响应。
+    """
+    nodes: List[Dict] = []
+    seen = set()
+    for response in (primary, secondary):
+        for node in response.body.data.nodes or []:
+            if node.text in seen:
+                continue
+            seen.add(node.text)
+            nodes.append(node.to_map())
+    body = primary.body.to_map()
+    body["Data"] = {"Nodes": nodes}
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": primary.status_code,
+        "headers": primary.headers,
+        "body": body,
+    })
+
+
+def _result_of(task):
+    """
+    获取已完成任务的成功结果，任务未完成、失败或响应不成功时返回 None。
+    """
+    if not task.done() or task.cancelled() or task.exception() is not None:
+        return None
+    result = task.result()
+    return result if is_cacheable(result) else None
+
+
+def _keep_running(task):
+    """
+    保留截止时间后仍在运行的远程任务，完成时取出异常避免未处理警告。
+    """
+    _pending_tasks.add(task)
+
+    def _done(t):
+        _pending_tasks.discard(t)
+        if not t.cancelled():
+            t.exception()
+
+    task.add_done_callback(_done)
+
+
+async def ahybrid_retrieve(client, workspace_id, index_id, query, deadline=None):
+    """
+    对冲式混合检索。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str | list): 知识库ID或知识库ID列表。
+        query (str): 原始输入prompt。
+        deadline (float): 远程检索截止时间（秒），默认读取 RAG_HYBRID_DEADLINE_MS。
+
+    返回:
+        与 retrieve_index 结构一致的检索响应。
+    """
+    deadline = get_deadline() if deadline is None else deadline
+    remote = asyncio.ensure_future(aretrieve_indices(client, workspace_id, get_index_ids(index_id), query))
+    # 本地索引在线程中加载，索引不存在时的异常由本地任务抛出，不影响远程检索
+    local = asyncio.ensure_future(asyncio.to_thread(lambda: get_local_index().retrieve(query)))
+
+    await asyncio.wait({remote, local}, timeout=deadline)
+    remote_result = _result_of(remote)
+    if not remote.done():
+        _keep_running(remote)
+
+    if remote_result is None:
+        # 远程超时或失败，回退到本地结果
+        try:
+            local_result = await local
+        except Exception:
+            # 本地索引不可用时，返回远程的原始响应或继续等待远程结果
+            if not remote.done():
+                record_win(SOURCE_REMOTE)
+                return await remote
+            if not remote.cancelled() and remote.exception() is None:
+                record_win(SOURCE_REMOTE)
+                return remote.result()
+            record_win(SOURCE_NONE)
+            raise
+        record_win(SOURCE_LOCAL)
+        return local_result
+
+    local_result = _result_of(local)
+    if local_result is None:
+        local.cancel()
+        record_win(SOURCE_REMOTE)
+        return remote_result
+
+    record_win(SOURCE_MERGED)
+    return merge_responses(remote_result, local_result)
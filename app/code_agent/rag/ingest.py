@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库批量导入
+将目录下的文档按 申请租约 -> 上传 -> 添加文件 -> 等待解析 -> 追加到知识库 的流程导入百炼知识库。
+各文件的不同阶段流水线并行执行，每个阶段单独限制并发，失败的调用按指数退避重试，并实时输出进度
+"""
+
+import asyncio
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.code_agent.rag.fingerprint import file_fingerprints, get_fingerprint_cache
+from app.code_agent.rag.preprocess import preprocess_files
+from app.code_agent.rag.rag import (
+    add_file,
+    apply_lease_by_file_path,
+    describe_file,
+    submit_index_add_documents_job,
+    upload_file,
+)
+from app.code_agent.utils.env import get_env_number
+
+# 导入阶段
+STAGE_LEASE = "lease"
+STAGE_UPLOAD = "upload"
+STAGE_ADD = "add"
+STAGE_PARSE = "parse"
+STAGE_INDEX = "index"
+STAGES = (STAGE_LEASE, STAGE_UPLOAD, STAGE_ADD, STAGE_PARSE, STAGE_INDEX)
+
+# 默认配置
+DEFAULT_CATEGORY_ID = "default"
+DEFAULT_PARSER = "DASHSCOPE_DOCMIND"
+DEFAULT_SOURCE_TYPE = "DATA_CENTER_FILE"
+DEFAULT_CONCURRENCY = {
+    STAGE_LEASE: 8,
+    STAGE_UPLOAD: 8,
+    STAGE_ADD: 8,
+    STAGE_PARSE: 32,
+    STAGE_INDEX: 4,
+}
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 8.0
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_PARSE_TIMEOUT = 600.0
+DEFAULT_INDEX_BATCH_SIZE = 50
+
+# 可导入的文档类型
+INGEST_SUFFIXES = (".md", ".markdown", ".txt", ".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx", ".html")
+
+# 文档解析状态
+PARSE_SUCCESS = "PARSE_SUCCESS"
+PARSE_FAILED = "PARSE_FAILED"
+
+
+class IngestError(RuntimeError):
+    """
+    导入阶段失败（服务返回不成功或解析失败）
+    """
+
+
+def iter_ingest_files(source_paths: Iterable[str], suffixes=INGEST_SUFFIXES) -> List[str]:
+    """
+    遍历源路径下所有可导入的文档。
+
+    参数:
+        source_paths (Iterable[str]): 文件或目录路径。
+        suffixes (tuple): 可导入的文件后缀。
+
+    返回:
+        list: 文档路径列表。
+    """
+    paths = []
+    for source in source_paths:
+        if os.path.isfile(source):
+            paths.append(source)
+            continue
+        for root, _, files in os.walk(source):
+            for file in sorted(files):
+                if file.lower().endswith(suffixes):
+                    paths.append(os.path.join(root, file))
+    return paths
+
+
+def get_stage_concurrency(overrides: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    获取各阶段的并发上限，可通过环境变量 RAG_INGEST_<阶段>_CONCURRENCY 配置，
+    例如 RAG_INGEST_UPLOAD_CONCURRENCY=16。
+
+    参数:
+        overrides (dict): 阶段 -> 并发上限，优先于环境变量。
+
+    返回:
+        dict: 阶段 -> 并发上限。
+    """
+    concurrency = {}
+    for stage, default in DEFAULT_CONCURRENCY.items():
+        concurrency[stage] = max(get_env_number(f"RAG_INGEST_{stage.upper()}_CONCURRENCY", default), 1)
+    for stage, value in (overrides or {}).items():
+        if stage not in concurrency:
+            raise ValueError(f"未知的导入阶段: {stage}")
+        concurrency[stage] = max(int(value), 1)
+    return concurrency
+
+
+def get_index_batch_size() -> int:
+    """
+    获取每个追加导入任务包含的文档数，可通过环境变量 RAG_INGEST_INDEX_BATCH_SIZE 配置。
+
+    返回:
+        int: 每批文档数。
+    """
+    return max(get_env_number("RAG_INGEST_INDEX_BATCH_SIZE", DEFAULT_INDEX_BATCH_SIZE), 1)
+
+
+def _check_response(stage: str, response):
+    """
+    检查百炼服务的响应，调用不成功时抛出 IngestError。
+    """
+    body = getattr(response, "body", None)
+    if body is None or getattr(body, "success", True) is False or getattr(body, "data", None) is None:
+        message = getattr(body, "message", None) or getattr(body, "code", None) or "无响应数据"
+        raise IngestError(f"{stage} 失败: {message}")
+    return body.data
+
+
+class IngestProgress:
+    """
+    导入进度
+
+    记录各阶段完成和失败的文件数，每次变化时调用回调函数（默认打印一行进度）。
+    """
+
+    def __init__(self, total: int, callback: Optional[Callable[[Dict], None]] = None):
+        self.total = total
+        self.callback = callback or self.print_progress
+        self.started_at = time.monotonic()
+        self.completed = Counter()
+        self.failed = Counter()
+        self.retries = Counter()
+
+    def snapshot(self) -> Dict:
+        """
+        获取当前进度。
+
+        返回:
+            dict: 总数、各阶段完成数、失败数、重试次数及耗时。
+        """
+        return {
+            "total": self.total,
+            "done": self.completed[STAGE_INDEX],
+            "failed": sum(self.failed.values()),
+            "completed": dict(self.completed),
+            "failed_by_stage": dict(self.failed),
+            "retries": dict(self.retries),
+            "elapsed": time.monotonic() - self.started_at,
+        }
+
+    def stage_done(self, stage: str):
+        self.completed[stage] += 1
+        self.callback(self.snapshot())
+
+    def stage_failed(self, stage: str):
+        self.failed[stage] += 1
+        self.callback(self.snapshot())
+
+    def stage_retry(self, stage: str):
+        self.retries[stage] += 1
+
+    @staticmethod
+    def print_progress(snapshot: Dict):
+        stages = " ".join(f"{stage}={snapshot['completed'].get(stage, 0)}" for stage in STAGES)
+        print(f"[导入进度] {snapshot['done']}/{snapshot['total']} 完成，{snapshot['failed']} 失败 | "
+              f"{stages} | {snapshot['elapsed']:.1f}s")
+
+
+class IngestPipeline:
+    """
+    知识库批量导入流水线
+
+    每个文件依次经过各阶段，阶段之间互不阻塞：一个文件在上传时，其他文件可以同时申请租约或等待解析。
+    解析完成的文档攒够 index_batch_size 个后合并为一个追加导入任务提交，剩余的在最后一起提交。
+    开启 preprocess 时先在进程池中本地预处理文档，上传清理和切分后的片段。
+    阻塞的 SDK 调用在独立线程池中执行，线程数等于各阶段并发上限之和。
+    """
+
+    def __init__(self, client, workspace_id: str, index_id: str, category_id: str = DEFAULT_CATEGORY_ID,
+                 parser: str = DEFAULT_PARSER, source_type: str = DEFAULT_SOURCE_TYPE,
+                 concurrency: Optional[Dict[str, int]] = None, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 parse_timeout: float = DEFAULT_PARSE_TIMEOUT, index_batch_size: Optional[int] = None,
+                 preprocess: Optional[bool] = None, uploader: Callable = upload_file,
+                 progress: Optional[Callable[[Dict], None]] = None):
+        self.client = client
+        self.workspace_id = workspace_id
+        self.index_id = index_id
+        self.category_id = category_id
+        self.parser = parser
+        self.source_type = source_type
+        self.concurrency = get_stage_concurrency(concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.parse_timeout = parse_timeout
+        self.index_batch_size = index_batch_size or get_index_batch_size()
+        if preprocess is None:
+            preprocess = os.getenv("RAG_INGEST_PREPROCESS", "0").lower() in ("1", "true", "yes")
+        self.preprocess = preprocess
+        self.uploader = uploader
+        self.progress_callback = progress
+        self.progress: Optional[IngestProgress] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._parsed: List[Dict] = []
+
+    async def _call(self, stage: str, func, *args, check: bool = True, idempotent: bool = True):
+        """
+        在线程池中执行阻塞调用，调用异常或服务返回不成功时按指数退避重试。
+
+        非幂等的调用（添加文件、提交导入任务）只在服务明确返回不成功时重试：调用异常（如超时）时
+        服务端可能已经接受了请求，重试会产生重复的文件或任务。
+
+        返回:
+            check 为 True 时返回响应的 body.data，否则返回原始返回值。
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            try:
+                response = await loop.run_in_executor(self._executor, partial(func, *args))
+                return _check_response(stage, response) if check else response
+            except Exception as e:
+                if attempt >= self.retries or not (idempotent or isinstance(e, IngestError)):
+                    raise
+                self.progress.stage_retry(stage)
+                await asyncio.sleep(min(self.backoff * (2 ** attempt), DEFAULT_MAX_BACKOFF))
+                attempt += 1
+
+    async def _lease(self, path: str):
+        async with self._semaphores[STAGE_LEASE]:
+            return await self._call(
+                STAGE_LEASE, apply_lease_by_file_path, self.client, self.category_id, self.workspace_id, path)
+
+    async def _upload(self, path: str, lease):
+        async with self._semaphores[STAGE_UPLOAD]:
+            await self._call(STAGE_UPLOAD, self.uploader, lease.param.url, lease.param.headers, path, check=False)
+
+    async def _add(self, lease) -> str:
+        async with self._semaphores[STAGE_ADD]:
+            data = await self._call(
+                STAGE_ADD, add_file, self.client, lease.file_upload_lease_id, self.parser,
+                self.category_id, self.workspace_id, idempotent=False)
+        return data.file_id
+
+    async def _wait_parsed(self, file_id: str):
+        """
+        轮询文档解析状态直到解析成功，解析失败或超时抛出 IngestError。
+        """
+        deadline = time.monotonic() + self.parse_timeout
+        while True:
+            async with self._semaphores[STAGE_PARSE]:
+                data = await self._call(STAGE_PARSE, describe_file, self.client, self.workspace_id, file_id)
+            if data.status == PARSE_SUCCESS:
+                return
+            if data.status == PARSE_FAILED:
+                raise IngestError(f"文档 {file_id} 解析失败")
+            if time.monotonic() >= deadline:
+                raise IngestError(f"文档 {file_id} 解析超时，当前状态: {data.status}")
+            # 等待期间不占用并发名额
+            await asyncio.sleep(self.poll_interval)
+
+    async def _index(self, batch: List[Dict]):
+        """
+        将一批已解析的文档合并为一个追加导入任务提交。
+        """
+        try:
+            async with self._semaphores[STAGE_INDEX]:
+                data = await self._call(
+                    STAGE_INDEX, submit_index_add_documents_job, self.client, self.workspace_id,
+                    self.index_id, [result["file_id"] for result in batch], self.source_type, idempotent=False)
+        except Exception as e:
+            for result in batch:
+                self._fail(result, STAGE_INDEX, e)
+            return
+        for result in batch:
+            result["job_id"] = data.id
+            result["status"] = "success"
+            self.progress.stage_done(STAGE_INDEX)
+
+    def _fail(self, result: Dict, stage: str, error: Exception):
+        result["stage"] = stage
+        result["error"] = f"{type(error).__name__}: {error}"
+        print(f"导入失败 [{stage}] {result['path']}: {result['error']}")
+        self.progress.stage_failed(stage)
+
+    async def _ingest_one(self, path: str, source: str) -> Dict:
+        result = {"path": path, "source": source, "file_id": None, "job_id": None, "status": "failed",
+                  "stage": None, "error": None}
+        stage = STAGE_LEASE
+        try:
+            lease = await self._lease(path)
+            self.progress.stage_done(stage)
+
+            stage = STAGE_UPLOAD
+            await self._upload(path, lease)
+            self.progress.stage_done(stage)
+
+            stage = STAGE_ADD
+            result["file_id"] = await self._add(lease)
+            self.progress.stage_done(stage)
+
+            stage = STAGE_PARSE
+            await self._wait_parsed(result["file_id"])
+            self.progress.stage_done(stage)
+        except Exception as e:
+            self._fail(result, stage, e)
+            return result
+
+        self._parsed.append(result)
+        if len(self._parsed) >= self.index_batch_size:
+            batch, self._parsed = self._parsed, []
+            await self._index(batch)
+        return result
+
+    async def arun(self, paths: List[str]) -> List[Dict]:
+        """
+        导入文档。
+
+        参数:
+            paths (list): 文档路径列表。
+
+        返回:
+            list: 每个上传文件的导入结果，包含上传的文件 path、源文档 source、file_id、job_id、
+                  status（success/failed）、失败阶段 stage 及错误信息 error。
+        """
+        loop = asyncio.get_running_loop()
+        sources = {path: path for path in paths}
+        if self.preprocess and paths:
+            outputs = await loop.run_in_executor(None, preprocess_files, paths)
+            sources = {output: path for path in paths for output in outputs[path]}
+            paths = list(sources)
+
+        self.progress = IngestProgress(len(paths), self.progress_callback)
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.concurrency.items()}
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.concurrency.values()),
+                                            thread_name_prefix="bailian-ingest")
+        try:
+            cache = get_fingerprint_cache()
+            if cache is not None and paths:
+                # 先并行计算所有文件的指纹，申请租约时直接命中缓存
+                await loop.run_in_executor(None, file_fingerprints, paths, cache)
+            results = list(await asyncio.gather(*[self._ingest_one(path, sources[path]) for path in paths]))
+            if self._parsed:
+                batch, self._parsed = self._parsed, []
+                await self._index(batch)
+            return results
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+async def aingest_directory(client, workspace_id: str, index_id: str, source_paths: Iterable[str], **kwargs):
+    """
+    导入目录（或文件）下的所有文档到知识库。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        source_paths (Iterable[str]): 文件或目录路径。
+        **kwargs: 传给 IngestPipeline 的其他参数。
+
+    返回:
+        list: 每个文档的导入结果。
+    """
+    paths = iter_ingest_files(source_paths)
+    return await IngestPipeline(client, workspace_id, index_id, **kwargs).arun(paths)
+
+
+def ingest_directory(client, workspace_id: str, index_id: str, source_paths: Iterable[str], **kwargs):
+    """
+    aingest_directory 的同步版本。
+    """
+    return asyncio.run(aingest_directory(client, workspace_id, index_id, source_paths, **kwargs))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.code_agent.rag.jobs import await_index_jobs
+    from app.code_agent.rag.rag import create_client
+
+    # 解析命令行参数，指定文档来源和目标知识库
+    parser = argparse.ArgumentParser(description="批量导入文档到百炼知识库")
+    parser.add_argument("sources", nargs="+", help="文档文件或目录")
+    parser.add_argument("--index-id", default=os.getenv("knowledge_base_id"), help="知识库ID")
+    parser.add_argument("--category-id", default=DEFAULT_CATEGORY_ID, help="类目ID")
+    parser.add_argument("--parser", default=DEFAULT_PARSER, help="文档解析器")
+    parser.add_argument("--source-type", default=DEFAULT_SOURCE_TYPE, help="数据类型")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="每次调用的重试次数")
+    parser.add_argument("--index-batch-size", type=int, default=None, help="每个追加导入任务包含的文档数")
+    parser.add_argument("--wait", action="store_true", help="等待所有索引任务完成")
+    parser.add_argument("--preprocess", action="store_true", default=None,
+                        help="上传前在本地清理并切分 markdown、HTML 和文本文档")
+    for stage_name in STAGES:
+        parser.add_argument(f"--{stage_name}-concurrency", type=int, default=None, help=f"{stage_name} 阶段的并发上限")
+    args = parser.parse_args()
+
+    overrides = {
+        stage_name: getattr(args, f"{stage_name}_concurrency")
+        for stage_name in STAGES
+        if getattr(args, f"{stage_name}_concurrency") is not None
+    }
+    bailian_client = create_client()
+    results = ingest_directory(
+        bailian_client,
+        os.getenv("workspace_id"),
+        args.index_id,
+        args.sources,
+        category_id=args.category_id,
+        parser=args.parser,
+        source_type=args.source_type,
+        concurrency=overrides,
+        retries=args.retries,
+        index_batch_size=args.index_batch_size,
+        preprocess=args.preprocess,
+    )
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    print(f"导入完成: 成功 {succeeded}，失败 {len(results) - succeeded}")
+    for result in results:
+        if result["status"] != "success":
+            print(f"  {result['path']} [{result['stage']}] {result['error']}")
+    if args.wait:
+        job_ids = sorted({result["job_id"] for result in results if result["job_id"]})
+        asyncio.run(await_index_jobs(bailian_client, os.getenv("workspace_id"),
+                                     [(args.index_id, job_id) for job_id in job_ids]))
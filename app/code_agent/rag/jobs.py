@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库索引任务跟踪
+并发轮询多个索引任务的状态，轮询间隔按指数退避增长并加入随机抖动，
+每个任务完成或失败时完成对应的 Future，并统计整体吞吐量
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.code_agent.rag.rag import get_index_job_status
+from app.code_agent.utils.env import get_env_number
+
+# 索引任务状态
+JOB_COMPLETED = "COMPLETED"
+JOB_FAILED = "FAILED"
+
+# 默认配置
+DEFAULT_POLL_CONCURRENCY = 8
+DEFAULT_INITIAL_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 30.0
+DEFAULT_JOB_TIMEOUT = 3600.0
+DEFAULT_MAX_ERRORS = 5
+
+
+class IndexJobError(RuntimeError):
+    """
+    索引任务失败、超时或状态查询连续出错
+    """
+
+
+class IndexJobTracker:
+    """
+    索引任务跟踪器
+
+    每个任务单独轮询，同一时刻最多 concurrency 个状态查询在执行；
+    轮询间隔从 initial_interval 开始翻倍，最大为 max_interval，实际等待时间在 [间隔/2, 间隔] 内随机，
+    避免大量任务同时轮询。
+    """
+
+    def __init__(self, client, workspace_id: str, concurrency: Optional[int] = None,
+                 initial_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                 timeout: Optional[float] = None, max_errors: int = DEFAULT_MAX_ERRORS):
+        self.client = client
+        self.workspace_id = workspace_id
+        self.concurrency = concurrency or get_env_number("RAG_JOB_POLL_CONCURRENCY", DEFAULT_POLL_CONCURRENCY)
+        self.initial_interval = (initial_interval if initial_interval is not None
+                                 else get_env_number("RAG_JOB_POLL_INTERVAL", DEFAULT_INITIAL_INTERVAL))
+        self.max_interval = (max_interval if max_interval is not None
+                             else get_env_number("RAG_JOB_POLL_MAX_INTERVAL", DEFAULT_MAX_INTERVAL))
+        self.timeout = timeout if timeout is not None else get_env_number("RAG_JOB_TIMEOUT", DEFAULT_JOB_TIMEOUT)
+        self.max_errors = max_errors
+
+        self._futures: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._tasks = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.documents = 0
+        self.polls = 0
+
+    def track(self, index_id: str, job_id: str) -> asyncio.Future:
+        """
+        开始跟踪一个索引任务，重复跟踪同一任务返回同一个 Future。
+
+        参数:
+            index_id (str): 知识库ID。
+            job_id (str): 任务ID。
+
+        返回:
+            asyncio.Future: 任务完成时结果为 dict（index_id、job_id、status、documents、elapsed），
+                            失败时抛出 IndexJobError。
+        """
+        key = (index_id, job_id)
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        task = asyncio.ensure_future(self._poll(index_id, job_id, future))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return future
+
+    async def _poll(self, index_id: str, job_id: str, future: asyncio.Future):
+        started = time.monotonic()
+        interval = self.initial_interval
+        errors = 0
+        while not future.done():
+            try:
+                async with self._semaphore:
+                    self.polls += 1
+                    response = await asyncio.to_thread(
+                        get_index_job_status, self.client, self.workspace_id, index_id, job_id)
+                data = response.body.data
+                if getattr(response.body, "success", True) is False or data is None:
+                    raise IndexJobError(response.body.message or response.body.code or "无响应数据")
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if errors >= self.max_errors:
+                    self._fail(future, IndexJobError(f"索引任务 {job_id} 状态查询连续失败: {e}"))
+                    return
+                data = None
+
+            if data is not None and data.status == JOB_COMPLETED:
+                documents = len(data.documents or [])
+                self.completed += 1
+                self.documents += documents
+                future.set_result({
+                    "index_id": index_id,
+                    "job_id": job_id,
+                    "status": data.status,
+                    "documents": documents,
+                    "elapsed": time.monotonic() - started,
+                })
+                return
+            if data is not None and data.status == JOB_FAILED:
+                self._fail(future, IndexJobError(f"索引任务 {job_id} 执行失败"))
+                return
+            if time.monotonic() - started >= self.timeout:
+                self._fail(future, IndexJobError(f"索引任务 {job_id} 等待超时"))
+                return
+
+            await asyncio.sleep(random.uniform(interval / 2, interval))
+            interval = min(interval * 2, self.max_interval)
+
+    def _fail(self, future: asyncio.Future, error: IndexJobError):
+        self.failed += 1
+        if not future.done():
+            future.set_exception(error)
+
+    async def wait_all(self) -> List:
+        """
+        等待所有已跟踪的任务结束。
+
+        返回:
+            list: 每个任务的结果 dict，失败的任务为 IndexJobError。
+        """
+        return list(await asyncio.gather(*self._futures.values(), return_exceptions=True))
+
+    def stats(self) -> Dict:
+        """
+        获取跟踪统计信息。
+
+        返回:
+            dict: 任务数、完成数、失败数、进行中数量、状态查询次数、文档数、耗时及吞吐量。
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "tracked": len(self._futures),
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": len(self._futures) - self.completed - self.failed,
+            "polls": self.polls,
+            "documents": self.documents,
+            "elapsed": elapsed,
+            "jobs_per_sec": self.completed / elapsed,
+            "documents_per_sec": self.documents / elapsed,
+        }
+
+    def report(self):
+        """
+        打印吞吐量统计。
+        """
+        stats = self.stats()
+        print(f"[索引任务] 完成 {stats['completed']}/{stats['tracked']}，失败 {stats['failed']}，"
+              f"文档 {stats['documents']}，查询 {stats['polls']} 次，耗时 {stats['elapsed']:.1f}s，"
+              f"{stats['jobs_per_sec']:.2f} 任务/s，{stats['documents_per_sec']:.2f} 文档/s")
+
+
+async def await_index_jobs(client, workspace_id: str, jobs: Iterable[Tuple[str, str]], **kwargs) -> List:
+    """
+    等待一组索引任务完成并打印吞吐量。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        jobs (Iterable[tuple]): (知识库ID, 任务ID)。
+        **kwargs: 传给 IndexJobTracker 的其他参数。
+
+    返回:
+        list: 每个任务的结果 dict 或 IndexJobError。
+    """
+    tracker = IndexJobTracker(client, workspace_id, **kwargs)
+    for index_id, job_id in jobs:
+        tracker.track(index_id, job_id)
+    results = await tracker.wait_all()
+    tracker.report()
+    return results
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地 BM25 知识库索引
+从 markdown 等文档构建倒排索引并持久化到磁盘，加载时通过 mmap 映射，
+检索结果与百炼 retrieve_index 的响应结构一致，可离线替代远程检索
+"""
+
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.cache import normalize_query
+
+# 索引格式版本
+INDEX_VERSION = 1
+
+# 默认构建参数
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_TOP_K = 5
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+
+# 参与构建索引的文档类型
+DOC_SUFFIXES = (".md", ".markdown", ".txt")
+
+# 记录当前生效构建目录名的指针文件
+CURRENT_FILE = "CURRENT"
+# Windows 上替换指针文件失败时的重试次数
+REPLACE_RETRIES = 5
+
+# 默认索引目录
+DEFAULT_INDEX_DIR = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_index")
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文感知的分词：英文数字按单词切分，中文按字符二元组切分（单字保留为一元）。
+
+    参数:
+        text (str): 文本。
+
+    返回:
+        list: 词项列表。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(normalize_query(text)):
+        word = match.group()
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _split_sections(text: str) -> List[str]:
+    """
+    按标题行切分 markdown，代码块内以 # 开头的注释行不视为标题。
+    """
+    sections, current, in_code = [], [], False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        if not in_code and re.match(r"#{1,6}\s", line) and current:
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current).strip())
+    return [section for section in sections if section]
+
+
+def split_markdown(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """
+    按标题将 markdown 切分为段落，相邻的短段落合并到不超过 chunk_size，
+    超长的段落再按空行切分为不超过 chunk_size 的片段。
+
+    参数:
+        text (str): markdown 文本。
+        chunk_size (int): 片段的最大字符数。
+
+    返回:
+        list: 片段列表。
+    """
+    chunks = []
+    current = ""
+    for section in _split_sections(text):
+        if len(section) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            for paragraph in re.split(r"\n\s*\n", section):
+                if current and len(current) + len(paragraph) + 2 > chunk_size:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current}\n\n{paragraph}" if current else paragraph
+                while len(current) > chunk_size:
+                    chunks.append(current[:chunk_size])
+                    current = current[chunk_size:]
+            continue
+        if current and len(current) + len(section) + 2 > chunk_size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{section}" if current else section
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def iter_documents(source_paths: Iterable[str]) -> Iterable[str]:
+    """
+    遍历源路径下所有可索引的文档。
+
+    参数:
+        source_paths (Iterable[str]): 文件或目录路径。
+
+    返回:
+        Iterable[str]: 文档路径。
+    """
+    for source in source_paths:
+        if os.path.isfile(source):
+            yield source
+            continue
+        for root, _, files in os.walk(source):
+            for file in sorted(files):
+                if file.lower().endswith(DOC_SUFFIXES):
+                    yield os.path.join(root, file)
+
+
+def iter_document_chunks(source_paths: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterable[tuple]:
+    """
+    遍历文档并切分为片段。
+
+    参数:
+        source_paths (Iterable[str]): 文件或目录路径。
+        chunk_size (int): 片段的最大字符数。
+
+    返回:
+        Iterable[tuple]: (片段文本, 元数据)。
+    """
+    for path in iter_documents(source_paths):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        for chunk_no, chunk in enumerate(split_markdown(text, chunk_size)):
+            yield chunk, {"doc_name": os.path.basename(path), "source": path, "chunk": chunk_no}
+
+
+def write_local_index(chunks: Iterable[tuple], output_dir: str) -> Dict:
+    """
+    将片段写入本地 BM25 索引，每次构建写入新的子目录并通过 CURRENT 指针文件切换，
+    正在通过 mmap 读取旧索引的进程不受影响。
+
+    构建目录包含：
+        meta.json      索引元信息
+        vocab.json     词项 -> [文档频率, 倒排表偏移]
+        postings.bin   int32 的 (文档序号, 词频) 对
+        doclens.bin    int32 的文档长度
+        docs.jsonl     片段文本及元数据
+        offsets.bin    int64 的 docs.jsonl 行偏移
+
+    参数:
+        chunks (Iterable[tuple]): (片段文本, 元数据)。
+        output_dir (str): 索引目录。
+
+    返回:
+        dict: 索引元信息。
+    """
+    return write_directory(output_dir, lambda tmp_dir: _write_index_files(chunks, tmp_dir))
+
+
+def resolve_directory(target: str) -> str:
+    """
+    获取目录当前生效的构建目录：存在 CURRENT 指针文件时为其中记录的子目录，否则为目录本身。
+
+    参数:
+        target (str): 索引或向量库目录。
+
+    返回:
+        str: 构建目录。
+    """
+    try:
+        with open(os.path.join(target, CURRENT_FILE), "r", encoding="utf-8") as f:
+            build = f.read().strip()
+    except FileNotFoundError:
+        return target
+    return os.path.join(target, build)
+
+
+def write_directory(target: str, write):
+    """
+    将内容写入 target 下新的构建目录，再原子地替换 CURRENT 指针文件切换到新构建。
+
+    每次构建写入各自的目录，不重命名或覆盖任何已有文件：Windows 上仍被其他进程 mmap 的旧构建无法删除，
+    会保留到下次构建时再清理，已打开旧构建的进程可继续读取，新加载的进程读到完整的新构建。
+
+    参数:
+        target (str): 目标目录。
+        write (Callable[[str], Any]): 写入函数，参数为临时目录。
+
+    返回:
+        写入函数的返回值。
+    """
+    target = os.path.normpath(target)
+    os.makedirs(target, exist_ok=True)
+    build = f"build-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(target, f"{build}.tmp")
+    result = write(tmp_dir)
+    os.rename(tmp_dir, os.path.join(target, build))
+
+    current = os.path.join(target, CURRENT_FILE)
+    tmp_current = f"{current}.{os.getpid()}.tmp"
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(build)
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(tmp_current, current)
+            break
+        except PermissionError:
+            # Windows 上其他进程正在读取指针文件时替换会失败，稍后重试
+            if attempt == REPLACE_RETRIES - 1:
+                os.remove(tmp_current)
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+    # 清理旧构建及旧版本直接写在目录下的索引文件，仍被占用的文件留到下次构建
+    for name in os.listdir(target):
+        if name in (CURRENT_FILE, build):
+            continue
+        path = os.path.join(target, name)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            print(f"旧构建 {path} 仍在使用，下次构建时再清理: {type(e).__name__} {e}")
+    return result
+
+
+def _write_index_files(chunks: Iterable[tuple], output_dir: str) -> Dict:
+    """
+    将索引文件写入指定目录。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    postings: Dict[str, List[int]] = {}
+    doc_lens = array("i")
+    offsets = array("q", [0])
+
+    with open(os.path.join(output_dir, "docs.jsonl"), "wb") as docs_file:
+        for chunk, metadata in chunks:
+            tokens = tokenize(chunk)
+            if not tokens:
+                continue
+            doc_id = len(doc_lens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).extend((doc_id, tf))
+            doc_lens.append(len(tokens))
+
+            line = json.dumps({"text": chunk, "metadata": metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+            docs_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    vocab = {}
+    with open(os.path.join(output_dir, "postings.bin"), "wb") as f:
+        offset = 0
+        for term in sorted(postings):
+            pairs = array("i", postings[term])
+            vocab[term] = [len(pairs) // 2, offset]
+            pairs.tofile(f)
+            offset += len(pairs)
+
+    with open(os.path.join(output_dir, "doclens.bin"), "wb") as f:
+        doc_lens.tofile(f)
+    with open(os.path.join(output_dir, "offsets.bin"), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.join(output_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+
+    meta = {
+        "version": INDEX_VERSION,
+        "byteorder": sys.byteorder,
+        "num_docs": len(doc_lens),
+        "num_terms": len(vocab),
+        "avgdl": sum(doc_lens) / len(doc_lens) if doc_lens else 0.0,
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def build_local_index(source_paths: Iterable[str], output_dir: str = DEFAULT_INDEX_DIR,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+    """
+    从文档构建本地 BM25 索引并写入磁盘。
+
+    参数:
+        source_paths (Iterable[str]): 文件或目录路径。
+        output_dir (str): 索引目录。
+        chunk_size (int): 片段的最大字符数。
+
+    返回:
+        dict: 索引元信息。
+    """
+    return write_local_index(iter_document_chunks(source_paths, chunk_size), output_dir)
+
+
+def _map_file(path: str):
+    """
+    以只读方式 mmap 文件，空文件返回空字节串。
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LocalIndex:
+    """
+    本地 BM25 索引
+
+    倒排表、文档长度和片段文本均通过 mmap 按需读取，多个进程共享操作系统页缓存。
+    """
+
+    def __init__(self, index_dir: str, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        index_dir = resolve_directory(index_dir)
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION or self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"本地索引格式不兼容，请重新构建: {index_dir}")
+        with open(os.path.join(index_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        self.num_docs = self.meta["num_docs"]
+        self.avgdl = self.meta["avgdl"] or 1.0
+        self._postings_map = _map_file(os.path.join(index_dir, "postings.bin"))
+        self._doclens_map = _map_file(os.path.join(index_dir, "doclens.bin"))
+        self._offsets_map = _map_file(os.path.join(index_dir, "offsets.bin"))
+        self._docs_map = _map_file(os.path.join(index_dir, "docs.jsonl"))
+        self._postings = memoryview(self._postings_map).cast("i")
+        self._doclens = memoryview(self._doclens_map).cast("i")
+        self._offsets = memoryview(self._offsets_map).cast("q")
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[tuple]:
+        """
+        BM25 检索。
+
+        参数:
+            query (str): 查询。
+            top_k (int): 返回的片段数。
+
+        返回:
+            list: (分数, 文档序号) 列表，按分数降序。
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            df, offset = entry
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            for i in range(offset, offset + df * 2, 2):
+                doc_id, tf = self._postings[i], self._postings[i + 1]
+                norm = self.k1 * (1 - self.b + self.b * self._doclens[doc_id] / self.avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in scores.items()))
+
+    def get_document(self, doc_id: int) -> Dict:
+        """
+        读取片段文本及元数据。
+
+        参数:
+            doc_id (int): 文档序号。
+
+        返回:
+            dict: 包含 text 和 metadata 的字典。
+        """
+        start, end = self._offsets[doc_id], self._offsets[doc_id + 1]
+        return json.loads(bytes(self._docs_map[start:end]).decode("utf-8"))
+
+    def retrieve(self, query: str, top_k: int = DEFAULT_TOP_K):
+        """
+        检索并返回与百炼 retrieve_index 结构一致的响应。
+
+        参数:
+            query (str): 查询。
+            top_k (int): 返回的片段数。
+
+        返回:
+            RetrieveResponse: 检索响应，节点包含 text、score 和 metadata。
+        """
+        nodes = []
+        for score, doc_id in self.search(query, top_k):
+            doc = self.get_document(doc_id)
+            nodes.append({"Text": doc["text"], "Score": score, "Metadata": doc["metadata"]})
+        return bailian_20231229_models.RetrieveResponse().from_map({
+            "statusCode": 200,
+            "body": {"Code": "Success", "Success": True, "Data": {"Nodes": nodes}},
+        })
+
+
+_index: Optional[tuple] = None
+_index_lock = threading.Lock()
+
+
+def get_local_index() -> LocalIndex:
+    """
+    获取进程内共享的本地索引，索引目录由环境变量 RAG_LOCAL_INDEX_DIR 配置，
+    索引重新构建（当前构建目录或 meta.json 修改时间变化）后自动重新加载。
+
+    返回:
+        LocalIndex: 本地索引。
+    """
+    global _index
+    index_dir = resolve_directory(os.getenv("RAG_LOCAL_INDEX_DIR") or DEFAULT_INDEX_DIR)
+    version = (index_dir, os.stat(os.path.join(index_dir, "meta.json")).st_mtime_ns)
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            _index = (version, LocalIndex(index_dir))
+        return _index[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 解析命令行参数，指定文档来源和索引目录
+    parser = argparse.ArgumentParser(description="构建本地 BM25 知识库索引")
+    parser.add_argument("sources", nargs="+", help="文档文件或目录")
+    parser.add_argument("--output", default=os.getenv("RAG_LOCAL_INDEX_DIR") or DEFAULT_INDEX_DIR, help="索引目录")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="片段的最大字符数")
+    args = parser.parse_args()
+
+    meta = build_local_index(args.sources, args.output, args.chunk_size)
+    print(f"本地索引构建完成: {args.output}，片段数={meta['num_docs']}，词项数={meta['num_terms']}")
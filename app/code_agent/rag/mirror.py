@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+百炼知识库本地镜像
+将知识库中已完成导入的文档切片拉取到本地，并构建为本地 BM25 索引；
+刷新时只重新拉取新增或变化的文档，检索见 mirror_store
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from app.code_agent.rag.local_index import resolve_directory, write_local_index
+from app.code_agent.rag.mirror_store import get_mirror_dir
+from app.code_agent.rag.rag import list_chunks, list_index_documents, list_indices
+
+# 已完成导入的文档状态
+DOCUMENT_FINISHED = "FINISH"
+
+# 默认配置
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_WORKERS = 8
+
+
+def _data_of(response):
+    """
+    取出响应数据，调用不成功时抛出 RuntimeError。
+    """
+    body = response.body
+    if body is None or getattr(body, "success", True) is False or body.data is None:
+        raise RuntimeError(getattr(body, "message", None) or getattr(body, "code", None) or "无响应数据")
+    return body.data
+
+
+def fetch_documents(client, workspace_id: str, index_id: str, page_size: int = DEFAULT_PAGE_SIZE) -> Dict[str, Dict]:
+    """
+    分页拉取知识库下所有已完成导入的文档。
+
+    返回:
+        dict: 文档ID -> {"name", "size"}。
+    """
+    documents = {}
+    page_number = 1
+    while True:
+        data = _data_of(list_index_documents(client, workspace_id, index_id, page_number, page_size))
+        for document in data.documents or []:
+            if document.status == DOCUMENT_FINISHED:
+                documents[document.id] = {"name": document.name, "size": document.size}
+        if page_number * page_size >= (data.total_count or 0) or not data.documents:
+            return documents
+        page_number += 1
+
+
+def fetch_chunks(client, workspace_id: str, index_id: str, file_id: str,
+                 page_size: int = DEFAULT_PAGE_SIZE) -> List[Dict]:
+    """
+    分页拉取文档的所有切片。
+
+    返回:
+        list: 切片列表，包含 text 和 metadata。
+    """
+    chunks = []
+    page_num = 1
+    while True:
+        data = _data_of(list_chunks(client, workspace_id, index_id, file_id, page_num, page_size))
+        for node in data.nodes or []:
+            chunks.append({"text": node.text or "", "metadata": dict(node.metadata or {})})
+        if page_num * page_size >= (data.total or 0) or not data.nodes:
+            return chunks
+        page_num += 1
+
+
+def _write_json(path: str, value):
+    """
+    原子地写入 JSON 文件。
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def mirror_index(client, workspace_id: str, index_id: str, mirror_dir: Optional[str] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE, workers: int = DEFAULT_WORKERS, full: bool = False) -> Dict:
+    """
+    镜像（或增量刷新）一个知识库。
+
+    镜像目录结构：
+        <mirror_dir>/<index_id>/documents.json         文档ID -> {"name", "size"}
+        <mirror_dir>/<index_id>/chunks/<文档ID>.json   文档的切片
+        <mirror_dir>/<index_id>/index/                 由全部切片构建的本地 BM25 索引
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        mirror_dir (str): 镜像目录，默认读取 RAG_MIRROR_DIR。
+        page_size (int): 分页大小。
+        workers (int): 并发拉取切片的线程数。
+        full (bool): 忽略已有镜像，重新拉取所有文档。
+
+    返回:
+        dict: 新增或变化、删除、未变化的文档数及切片总数。
+    """
+    index_dir = os.path.join(mirror_dir or get_mirror_dir(), index_id)
+    chunks_dir = os.path.join(index_dir, "chunks")
+    os.makedirs(chunks_dir, exist_ok=True)
+    documents_path = os.path.join(index_dir, "documents.json")
+
+    previous = {}
+    if not full and os.path.exists(documents_path):
+        with open(documents_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    documents = fetch_documents(client, workspace_id, index_id, page_size)
+    changed = [doc_id for doc_id, info in documents.items()
+               if previous.get(doc_id) != info or not os.path.exists(os.path.join(chunks_dir, f"{doc_id}.json"))]
+    removed = [doc_id for doc_id in previous if doc_id not in documents]
+
+    def refresh(doc_id):
+        chunks = fetch_chunks(client, workspace_id, index_id, doc_id, page_size)
+        for chunk in chunks:
+            chunk["metadata"].setdefault("doc_name", documents[doc_id]["name"])
+            chunk["metadata"]["doc_id"] = doc_id
+        _write_json(os.path.join(chunks_dir, f"{doc_id}.json"), chunks)
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bailian-mirror") as executor:
+            list(executor.map(refresh, changed))
+    for doc_id in removed:
+        chunk_path = os.path.join(chunks_dir, f"{doc_id}.json")
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+    _write_json(documents_path, documents)
+
+    stats = {"changed": len(changed), "removed": len(removed), "unchanged": len(documents) - len(changed)}
+    index_meta = os.path.join(resolve_directory(os.path.join(index_dir, "index")), "meta.json")
+    if changed or removed or not os.path.exists(index_meta):
+        meta = _rebuild_index(index_dir, documents)
+        stats["chunks"] = meta["num_docs"]
+    return stats
+
+
+def _rebuild_index(index_dir: str, documents: Dict[str, Dict]) -> Dict:
+    """
+    由全部切片重新构建本地索引，write_local_index 写入新的构建目录后再切换，检索方不会读到写了一半的索引。
+    """
+    def iter_chunks():
+        for doc_id in sorted(documents):
+            with open(os.path.join(index_dir, "chunks", f"{doc_id}.json"), "r", encoding="utf-8") as f:
+                for chunk in json.load(f):
+                    yield chunk["text"], chunk["metadata"]
+
+    return write_local_index(iter_chunks(), os.path.join(index_dir, "index"))
+
+
+def mirror_indices(client, workspace_id: str, index_ids: Iterable[str], **kwargs) -> Dict[str, Dict]:
+    """
+    依次镜像多个知识库。
+
+    返回:
+        dict: 知识库ID -> 刷新统计。
+    """
+    results = {}
+    for index_id in index_ids:
+        results[index_id] = mirror_index(client, workspace_id, index_id, **kwargs)
+        print(f"知识库 {index_id} 镜像完成: {results[index_id]}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.code_agent.rag.fusion import get_index_ids
+    from app.code_agent.rag.rag import create_client
+
+    # 解析命令行参数，指定需要镜像的知识库
+    parser = argparse.ArgumentParser(description="将百炼知识库镜像到本地")
+    parser.add_argument("--index-id", action="append", help="知识库ID，可重复指定，默认读取 knowledge_base_ids")
+    parser.add_argument("--all", action="store_true", help="镜像业务空间下的所有知识库")
+    parser.add_argument("--output", default=None, help="镜像目录")
+    parser.add_argument("--full", action="store_true", help="重新拉取所有文档")
+    args = parser.parse_args()
+
+    bailian_client = create_client()
+    workspace_id = os.getenv("workspace_id")
+    if args.all:
+        index_ids = [index.id for index in _data_of(list_indices(bailian_client, workspace_id)).indices or []]
+    else:
+        index_ids = get_index_ids(args.index_id)
+    mirror_indices(bailian_client, workspace_id, index_ids, mirror_dir=args.output, full=args.full)
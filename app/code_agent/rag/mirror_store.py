@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库镜像检索
+从 mirror 拉取到本地的知识库镜像中检索，MCP 服务配置 RAG_BACKEND=mirror 后无需访问百炼服务；
+镜像刷新后自动加载新的索引
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.fusion import reciprocal_rank_fusion
+from app.code_agent.rag.local_index import LocalIndex, resolve_directory
+
+# 默认配置
+DEFAULT_TOP_K = 5
+DEFAULT_MIRROR_DIR = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_mirror")
+
+
+def get_mirror_dir() -> str:
+    """
+    获取镜像目录，可通过环境变量 RAG_MIRROR_DIR 配置。
+
+    返回:
+        str: 镜像目录。
+    """
+    return os.getenv("RAG_MIRROR_DIR") or DEFAULT_MIRROR_DIR
+
+
+_indexes: Dict[str, tuple] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_mirror_index(index_id: str) -> LocalIndex:
+    """
+    获取知识库镜像的本地索引，镜像刷新后自动重新加载。
+
+    参数:
+        index_id (str): 知识库ID。
+
+    返回:
+        LocalIndex: 镜像索引。
+    """
+    index_dir = resolve_directory(os.path.join(get_mirror_dir(), index_id, "index"))
+    try:
+        version = (index_dir, os.stat(os.path.join(index_dir, "meta.json")).st_mtime_ns)
+    except FileNotFoundError:
+        raise ValueError(f"知识库 {index_id} 尚未镜像，请先运行 python -m app.code_agent.rag.mirror")
+    with _indexes_lock:
+        cached = _indexes.get(index_id)
+        if cached is None or cached[0] != version:
+            cached = (version, LocalIndex(index_dir))
+            _indexes[index_id] = cached
+        return cached[1]
+
+
+def retrieve_from_mirror(index_ids: List[str], query: str, top_k: int = DEFAULT_TOP_K):
+    """
+    从知识库镜像检索，多个知识库按 RRF 合并。
+
+    参数:
+        index_ids (list): 知识库ID列表。
+        query (str): 查询。
+        top_k (int): 返回的片段数。
+
+    返回:
+        RetrieveResponse: 与百炼 retrieve_index 结构一致的检索响应。
+    """
+    if not index_ids:
+        raise ValueError("knowledge_base_id 配置未找到，请在 .env 文件中设置")
+    if len(index_ids) == 1:
+        return get_mirror_index(index_ids[0]).retrieve(query, top_k)
+    ranked_lists = {
+        index_id: get_mirror_index(index_id).retrieve(query, top_k).body.data.nodes or []
+        for index_id in index_ids
+    }
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {
+            "Code": "Success",
+            "Success": True,
+            "Data": {"Nodes": reciprocal_rank_fusion(ranked_lists, top_k)},
+        },
+    })
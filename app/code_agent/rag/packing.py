@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+检索结果上下文打包
+按与查询的词项重合度在本地重排节点，去除近似重复的段落，
+并在 token 预算内一次性拼接知识文本，避免提示词无限膨胀
+"""
+
+import math
+import re
+from typing import List
+
+from app.code_agent.rag.local_index import tokenize
+from app.code_agent.rag.similarity_cache import jaccard, shingles
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_TOKEN_BUDGET = 2000
+DEFAULT_DEDUPE_THRESHOLD = 0.85
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的 token 数：中文字符及全角标点按 1 个 token，其余字符按 4 个字符 1 个 token。
+
+    参数:
+        text (str): 文本。
+
+    返回:
+        int: 估算的 token 数。
+    """
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, token_budget: int, template: str = "{}") -> str:
+    """
+    截取文本的最长前缀，使按模板格式化后的估算 token 数不超过预算。
+
+    参数:
+        text (str): 文本。
+        token_budget (int): token 预算。
+        template (str): 格式化模板，{} 处填入截取的文本。
+
+    返回:
+        str: 截取的前缀，预算不足以容纳模板本身时返回空字符串。
+    """
+    # 前缀越长估算的 token 数越多，二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(template.format(text[:mid])) <= token_budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def get_token_budget() -> int:
+    """
+    获取知识文本的 token 预算，可通过环境变量 RAG_CONTEXT_TOKEN_BUDGET 配置。
+
+    返回:
+        int: token 预算。
+    """
+    return get_env_number("RAG_CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)
+
+
+def rerank_nodes(query: str, nodes: List) -> List:
+    """
+    按与查询的词项重合度重排节点，重合度相同时保持原有顺序。
+
+    参数:
+        query (str): 查询。
+        nodes (list): 检索返回的节点。
+
+    返回:
+        list: 重排后的节点。
+    """
+    query_terms = set(tokenize(query))
+    if not query_terms:
+        return list(nodes)
+
+    def overlap(node):
+        return len(query_terms & set(tokenize(node.text or ""))) / len(query_terms)
+
+    return sorted(nodes, key=overlap, reverse=True)
+
+
+def pack_nodes(query: str, nodes: List, token_budget: int = None,
+               dedupe_threshold: float = DEFAULT_DEDUPE_THRESHOLD) -> str:
+    """
+    重排、去重并在 token 预算内拼接知识文本。
+
+    参数:
+        query (str): 查询。
+        nodes (list): 检索返回的节点。
+        token_budget (int): token 预算，默认读取 RAG_CONTEXT_TOKEN_BUDGET。
+        dedupe_threshold (float): 近似重复判定的 Jaccard 相似度阈值。
+
+    返回:
+        str: 拼接后的知识文本。
+    """
+    token_budget = get_token_budget() if token_budget is None else token_budget
+    parts = []
+    kept = []
+    used = 0
+    for node in rerank_nodes(query, nodes):
+        text = node.text or ""
+        grams = shingles(text)
+        if any(jaccard(grams, other) >= dedupe_threshold for other in kept):
+            continue
+        part = f"第{len(parts) + 1}段知识：\n    {text}\n    --\n    "
+        cost = estimate_tokens(part)
+        if used + cost > token_budget:
+            if parts:
+                # 放不下的段落跳过，继续尝试更短的段落
+                continue
+            # 最相关的段落超出预算时截断到恰好放入预算
+            template = "第1段知识：\n    {}\n    --\n    "
+            part = template.format(truncate_to_tokens(text, token_budget, template))
+            cost = estimate_tokens(part)
+        parts.append(part)
+        kept.append(grams)
+        used += cost
+    return "".join(parts)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档本地预处理
+在申请上传租约之前，于进程池中解析 markdown、HTML 和文本文档：去除样板内容（front matter、注释、
+脚本样式、导航页脚等），并将超长文档切分为多个片段，减小上传体积、缩短远程解析时间
+"""
+
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.code_agent.rag.local_index import split_markdown
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_MAX_CHARS = 20000
+DEFAULT_OUTPUT_DIR = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_preprocessed")
+
+# 可本地预处理的文档类型，其余类型原样上传
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+HTML_SUFFIXES = (".html", ".htm")
+TEXT_SUFFIXES = (".txt",)
+
+_FRONT_MATTER_RE = re.compile(r"\A---\s*\n.*?\n---\s*\n", re.S)
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# HTML 中整体丢弃的标签
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "footer", "aside", "form", "iframe", "svg", "template"}
+# 只保留其中标题文本的页面框架标签（页面或章节标题是最好的检索锚点，其余为导航等框架内容）
+_CHROME_TAGS = {"header"}
+# 输出换行的块级标签
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "br", "tr", "table", "ul", "ol", "blockquote", "hr"}
+_VOID_TAGS = {"br", "hr", "img", "input", "meta", "link", "area", "base", "col", "embed", "source", "track", "wbr"}
+
+
+def get_max_chars() -> int:
+    """
+    获取单个上传片段的最大字符数，可通过环境变量 RAG_PREPROCESS_MAX_CHARS 配置。
+
+    返回:
+        int: 最大字符数。
+    """
+    return max(get_env_number("RAG_PREPROCESS_MAX_CHARS", DEFAULT_MAX_CHARS), 1)
+
+
+def normalize_text(text: str) -> str:
+    """
+    统一换行符，去除行尾空白并合并连续空行。
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip() + "\n"
+
+
+def clean_markdown(text: str) -> str:
+    """
+    去除 markdown 的 YAML front matter 和 HTML 注释。
+
+    参数:
+        text (str): markdown 文本。
+
+    返回:
+        str: 清理后的文本。
+    """
+    text = _FRONT_MATTER_RE.sub("", text.lstrip("\ufeff"))
+    text = _HTML_COMMENT_RE.sub("", text)
+    return normalize_text(text)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """
+    将 HTML 转换为 markdown 风格的纯文本：保留标题、列表和代码块，丢弃脚本、样式及导航页脚，
+    页眉中只保留标题文本。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._chrome_depth = 0
+        self._heading_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            if tag not in _VOID_TAGS:
+                self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        if tag in _CHROME_TAGS:
+            self._chrome_depth += 1
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._heading_depth += 1
+            self.parts.append("\n\n" + "#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag == "pre":
+            self._pre_depth += 1
+            self.parts.append("\n\n```\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            return
+        if self._skip_depth:
+            return
+        if tag in _CHROME_TAGS:
+            self._chrome_depth = max(self._chrome_depth - 1, 0)
+        elif tag == "pre":
+            self._pre_depth = max(self._pre_depth - 1, 0)
+            self.parts.append("\n```\n\n")
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._heading_depth = max(self._heading_depth - 1, 0)
+            self.parts.append("\n\n")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if self._skip_depth or (self._chrome_depth and not self._heading_depth):
+            return
+        if self._pre_depth:
+            self.parts.append(data)
+        else:
+            self.parts.append(re.sub(r"\s+", " ", data))
+
+
+def html_to_text(html: str) -> str:
+    """
+    提取 HTML 正文。
+
+    参数:
+        html (str): HTML 文本。
+
+    返回:
+        str: markdown 风格的正文。
+    """
+    extractor = _HTMLTextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    # 代码块内保留缩进，其余行去除首尾空白
+    lines, in_code = [], False
+    for line in "".join(extractor.parts).split("\n"):
+        if line.strip() == "```":
+            in_code = not in_code
+            lines.append("```")
+        else:
+            lines.append(line.rstrip() if in_code else line.strip())
+    return normalize_text("\n".join(lines))
+
+
+def _output_paths(file_path: str, output_dir: str, count: int, suffix: str) -> List[str]:
+    """
+    生成预处理输出路径，按源文件绝对路径的哈希分目录，避免不同目录下的同名文件冲突。
+    """
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:10]
+    stem = Path(file_path).stem
+    target_dir = os.path.join(output_dir, digest)
+    if count == 1:
+        return [os.path.join(target_dir, f"{stem}{suffix}")]
+    return [os.path.join(target_dir, f"{stem}.part{i:03d}{suffix}") for i in range(1, count + 1)]
+
+
+def _write_if_changed(path: str, content: str):
+    """
+    内容变化时才写入文件，使未变化的输出保持原有修改时间，命中文件指纹缓存。
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def preprocess_file(file_path: str, output_dir: str = DEFAULT_OUTPUT_DIR,
+                    max_chars: int = DEFAULT_MAX_CHARS) -> List[str]:
+    """
+    预处理单个文档，不支持的类型原样返回。
+
+    参数:
+        file_path (str): 文档路径。
+        output_dir (str): 输出目录。
+        max_chars (int): 单个片段的最大字符数。
+
+    返回:
+        list: 需要上传的文件路径列表。
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix not in MARKDOWN_SUFFIXES + HTML_SUFFIXES + TEXT_SUFFIXES:
+        return [file_path]
+
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    if suffix in MARKDOWN_SUFFIXES:
+        text, out_suffix = clean_markdown(text), ".md"
+    elif suffix in HTML_SUFFIXES:
+        text, out_suffix = html_to_text(text), ".md"
+    else:
+        text, out_suffix = normalize_text(text), ".txt"
+    if not text.strip():
+        return []
+
+    chunks = [text] if len(text) <= max_chars else split_markdown(text, max_chars)
+    paths = _output_paths(file_path, output_dir, len(chunks), out_suffix)
+    target_dir = os.path.dirname(paths[0])
+    os.makedirs(target_dir, exist_ok=True)
+    for path, chunk in zip(paths, chunks):
+        _write_if_changed(path, chunk)
+    # 清理片段数减少后遗留的旧片段
+    for name in set(os.listdir(target_dir)) - {os.path.basename(path) for path in paths}:
+        os.remove(os.path.join(target_dir, name))
+    return paths
+
+
+def preprocess_files(paths: Iterable[str], output_dir: Optional[str] = None, max_chars: Optional[int] = None,
+                     workers: Optional[int] = None) -> Dict[str, List[str]]:
+    """
+    在进程池中并行预处理多个文档。
+
+    参数:
+        paths (Iterable[str]): 文档路径。
+        output_dir (str): 输出目录，默认读取 RAG_PREPROCESS_DIR。
+        max_chars (int): 单个片段的最大字符数，默认读取 RAG_PREPROCESS_MAX_CHARS。
+        workers (int): 进程数，默认为 CPU 核数。
+
+    返回:
+        dict: 源文档路径 -> 需要上传的文件路径列表（解析失败的文档原样上传）。
+    """
+    paths = list(paths)
+    output_dir = output_dir or os.getenv("RAG_PREPROCESS_DIR") or DEFAULT_OUTPUT_DIR
+    max_chars = max_chars or get_max_chars()
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(paths) <= 1:
+        outputs = []
+        for path in paths:
+            try:
+                outputs.append(preprocess_file(path, output_dir, max_chars))
+            except Exception as e:
+                print(f"预处理失败，原样上传 {path}: {type(e).__name__} {e}")
+                outputs.append([path])
+        return dict(zip(paths, outputs))
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        futures = {path: executor.submit(preprocess_file, path, output_dir, max_chars) for path in paths}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"预处理失败，原样上传 {path}: {type(e).__name__} {e}")
+                results[path] = [path]
+    return results
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库查询日志与缓存预热
+记录每次查询的耗时和结果大小，MCP 服务启动时在后台按最近一段时间内的查询频次
+预先检索最常见的查询，使部署后的首批请求直接命中检索缓存
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.code_agent.rag.cache import normalize_query
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_RETENTION_DAYS = 7
+DEFAULT_PREWARM_TOP_N = 20
+DEFAULT_PREWARM_CONCURRENCY = 4
+DEFAULT_DB_PATH = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_query_log.sqlite3")
+
+
+class QueryLog:
+    """
+    查询日志
+
+    每条记录包含时间、原始查询、归一化查询、耗时、结果节点数、结果字节数和检索后端，
+    打开时清理超过保留天数的记录。
+    """
+
+    def __init__(self, db_path: str, retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_log ("
+            "ts REAL NOT NULL, query TEXT NOT NULL, normalized TEXT NOT NULL, latency_ms REAL NOT NULL, "
+            "nodes INTEGER NOT NULL, bytes INTEGER NOT NULL, backend TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS query_log_ts ON query_log (ts)")
+        self._db.execute("DELETE FROM query_log WHERE ts < ?", (time.time() - retention_days * 86400,))
+
+    def record(self, query: str, latency_ms: float, nodes: int, size: int, backend: Optional[str] = None):
+        """
+        记录一次查询。
+
+        参数:
+            query (str): 原始查询。
+            latency_ms (float): 耗时（毫秒）。
+            nodes (int): 结果节点数。
+            size (int): 结果字节数。
+            backend (str): 检索后端。
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO query_log VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), query, normalize_query(query), latency_ms, nodes, size, backend),
+            )
+
+    def top_queries(self, limit: int, days: Optional[float] = None) -> List[Dict]:
+        """
+        获取最近一段时间内出现次数最多的查询，归一化后相同的查询合并计数。
+
+        参数:
+            limit (int): 返回的查询数。
+            days (float): 统计的天数，默认为保留天数。
+
+        返回:
+            list: 按次数降序的 {"query", "count", "avg_latency_ms"}，query 为最近一次的原始写法。
+        """
+        since = time.time() - (days if days is not None else self.retention_days) * 86400
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT normalized, COUNT(*) AS n, AVG(latency_ms), MAX(ts) FROM query_log "
+                "WHERE ts >= ? GROUP BY normalized ORDER BY n DESC, MAX(ts) DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+            results = []
+            for normalized, count, avg_latency, last_ts in rows:
+                (query,) = self._db.execute(
+                    "SELECT query FROM query_log WHERE normalized = ? AND ts = ?", (normalized, last_ts)
+                ).fetchone()
+                results.append({"query": query, "count": count, "avg_latency_ms": avg_latency})
+        return results
+
+
+_log: Optional[QueryLog] = None
+_log_lock = threading.Lock()
+
+
+def get_query_log() -> Optional[QueryLog]:
+    """
+    获取进程内共享的查询日志，配置来自环境变量：
+    RAG_QUERY_LOG_ENABLED、RAG_QUERY_LOG_DB、RAG_QUERY_LOG_DAYS。
+
+    返回:
+        QueryLog: 查询日志，RAG_QUERY_LOG_ENABLED=0 时返回 None。
+    """
+    global _log
+    if os.getenv("RAG_QUERY_LOG_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = QueryLog(
+                    os.getenv("RAG_QUERY_LOG_DB") or DEFAULT_DB_PATH,
+                    get_env_number("RAG_QUERY_LOG_DAYS", float(DEFAULT_RETENTION_DAYS)),
+                )
+    return _log
+
+
+async def aprewarm(fetch: Callable[[str], Awaitable], query_log: Optional[QueryLog] = None,
+                   top_n: Optional[int] = None, concurrency: Optional[int] = None) -> Dict[str, int]:
+    """
+    按查询日志预热：以有限并发对最常见的查询调用 fetch，失败的查询只计数不中断。
+
+    参数:
+        fetch (Callable): 接收查询的异步检索函数，检索结果由其写入缓存。
+        query_log (QueryLog): 查询日志，默认使用共享的查询日志。
+        top_n (int): 预热的查询数，默认读取 RAG_PREWARM_TOP_N，为 0 时不预热。
+        concurrency (int): 并发数，默认读取 RAG_PREWARM_CONCURRENCY。
+
+    返回:
+        dict: 预热的查询数、成功数、失败数及耗时（秒）。
+    """
+    query_log = query_log or get_query_log()
+    top_n = top_n if top_n is not None else get_env_number("RAG_PREWARM_TOP_N", DEFAULT_PREWARM_TOP_N)
+    concurrency = concurrency or get_env_number("RAG_PREWARM_CONCURRENCY", DEFAULT_PREWARM_CONCURRENCY)
+    stats = {"queries": 0, "succeeded": 0, "failed": 0, "elapsed": 0.0}
+    if query_log is None or top_n <= 0:
+        return stats
+
+    started = time.monotonic()
+    queries = [item["query"] for item in await asyncio.to_thread(query_log.top_queries, top_n)]
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def warm(query):
+        async with semaphore:
+            try:
+                await fetch(query)
+                stats["succeeded"] += 1
+            except Exception:
+                stats["failed"] += 1
+
+    await asyncio.gather(*[warm(query) for query in queries])
+    stats["queries"] = len(queries)
+    stats["elapsed"] = time.monotonic() - started
+    return stats
@@ -1,10 +1,13 @@
 import os
-import requests
-import hashlib
-from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_bailian20231229 import client as bailian_20231229_client
 from alibabacloud_bailian20231229 import models as bailian_20231229_models
-from alibabacloud_tea_util import models as util_models
+
+from app.code_agent.rag.client_pool import create_runtime_options, get_client, get_upload_session
+from app.code_agent.rag.fingerprint import file_fingerprint, get_fingerprint_cache, hash_file
+from app.code_agent.rag.retrieval import aretrieve_index, retrieve_index  # noqa: F401
+
+# 流式上传每次读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # 从环境变量或配置文件读取配置
 from dotenv import load_dotenv
@@ -36,46 +39,23 @@ print(f"加载的配置: access_key_id={access_key_id}, workspace_id={workspace_
 
 def create_client() -> bailian_20231229_client.Client:
     """
-    创建并配置阿里云百炼客户端。
+    获取阿里云百炼客户端，同一配置在进程内共享同一个客户端及其连接池。
 
     返回:
         bailian_20231229_client.Client: 配置好的客户端。
     """
-    config = open_api_models.Config(
+    return get_client(
         access_key_id=os.environ.get('ALIBABA_CLOUD_ACCESS_KEY_ID'),
-        access_key_secret=os.environ.get('ALIBABA_CLOUD_ACCESS_KEY_SECRET')
-    )
-    config.endpoint = 'bailian.cn-beijing.aliyuncs.com'
-    return bailian_20231229_client.Client(config=config)
-
-
-def retrieve_index(client, workspace_id, index_id, query):
-    """
-    在指定的知识库中检索信息。
-
-    参数:
-        client (bailian_20231229_client.Client): 客户端（Client）。
-        workspace_id (str): 业务空间ID。
-        index_id (str): 知识库ID。
-        query (str): 原始输入prompt。
-
-    返回:
-        阿里云百炼服务的响应。
-    """
-    headers = {}
-    retrieve_request = bailian_20231229_models.RetrieveRequest(
-        index_id=index_id,
-        query=query
+        access_key_secret=os.environ.get('ALIBABA_CLOUD_ACCESS_KEY_SECRET'),
+        workspace_id=os.environ.get('WORKSPACE_ID')
     )
-    runtime = util_models.RuntimeOptions()
-    return client.retrieve_with_options(workspace_id, retrieve_request, headers, runtime)
 
 # 计算文件MD5
 
 
 def calculate_md5(file_path: str) -> str:
     """
-    计算文件的 MD5 哈希值。
+    计算文件的 MD5 哈希值，按 1 MB 分块读取，大文件使用 mmap。
 
     参数:
         file_path (str): 文件路径。
@@ -83,18 +63,14 @@ def calculate_md5(file_path: str) -> str:
     返回:
         str: 文件的 MD5 哈希值。
     """
-    hash_md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    return hash_file(file_path)
 
 # 获取文件信息
 
 
 def get_file_info(file_path):
     """
-    获取指定文件的名称、MD5哈希值和大小。
+    获取指定文件的名称、MD5哈希值和大小，文件未变化时直接使用指纹缓存中的 MD5。
 
     参数:
         file_path (str): 文件的完整路径。
@@ -102,17 +78,7 @@ def get_file_info(file_path):
     返回:
         tuple: (file_name, file_md5, file_size)
     """
-
-    # 获取文件名
-    file_name = os.path.basename(file_path)
-
-    # 获取文件大小（字节）
-    file_size = os.path.getsize(file_path)
-
-    # 计算MD5哈希值
-    file_md5 = calculate_md5(file_path)
-
-    return file_name, file_md5, file_size
+    return file_fingerprint(file_path, get_fingerprint_cache())
 
 # 申请文件上传租约
 
@@ -138,7 +104,7 @@ def apply_lease(client, category_id, file_name, file_md5, file_size, workspace_i
         md_5=file_md5,
         size_in_bytes=file_size,
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.apply_file_upload_lease_with_options(category_id, workspace_id, request, headers, runtime)
 
 # 根据文件路径申请租约
@@ -153,22 +119,48 @@ def apply_lease_by_file_path(client, category_id, workspace_id, file_path):
 # 上传文件
 
 
-def upload_file(upload_url, headers, file_path):
+class UploadStream:
+    """
+    按块读取文件的上传请求体，内存占用与文件大小无关，每读取一块调用一次进度回调。
+
+    提供 len 属性，requests 据此设置 Content-Length 而不是使用分块传输编码。
+    """
+
+    def __init__(self, file_obj, total: int, progress=None):
+        self.file_obj = file_obj
+        self.len = total
+        self.sent = 0
+        self.progress = progress
+
+    def read(self, size: int = -1) -> bytes:
+        # HTTP 库按较小的块读取，这里每次至少读取 UPLOAD_CHUNK_SIZE 以减少回调和系统调用
+        chunk = self.file_obj.read(UPLOAD_CHUNK_SIZE if size is None or size < 0 else max(size, UPLOAD_CHUNK_SIZE))
+        if chunk:
+            self.sent += len(chunk)
+            if self.progress is not None:
+                self.progress(self.sent, self.len)
+        return chunk
+
+
+def upload_file(upload_url, headers, file_path, progress=None, session=None):
     """
-    将文件上传到阿里云百炼服务。
+    将文件上传到阿里云百炼服务，从磁盘流式读取文件内容，并复用带连接池的 Session。
 
     参数:
         upload_url (str): 上传 URL。
         headers (dict): 上传请求的头部。
         file_path (str): 文件路径。
+        progress (callable): 进度回调 progress(已上传字节数, 总字节数)，可选。
+        session (requests.Session): 上传使用的 Session，默认使用共享的上传 Session。
     """
-    with open(file_path, 'rb') as f:
-        file_content = f.read()
     upload_headers = {
         "X-bailian-extra": headers["X-bailian-extra"],
         "Content-Type": headers["Content-Type"]
     }
-    response = requests.put(upload_url, data=file_content, headers=upload_headers)
+    session = session or get_upload_session()
+    with open(file_path, 'rb') as f:
+        body = UploadStream(f, os.fstat(f.fileno()).st_size, progress)
+        response = session.put(upload_url, data=body, headers=upload_headers)
     print(response.status_code)
     response.raise_for_status()
 
@@ -195,7 +187,7 @@ def add_file(client, lease_id: str, parser: str, category_id: str, workspace_id:
         parser=parser,
         category_id=category_id,
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.add_file_with_options(workspace_id, request, headers, runtime)
 
 # 查询上传状态
@@ -214,7 +206,7 @@ def describe_file(client, workspace_id, file_id):
         阿里云百炼服务的响应。
     """
     headers = {}
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.describe_file_with_options(workspace_id, file_id, headers, runtime)
 
 # 创建知识库
@@ -244,7 +236,7 @@ def create_index(client, workspace_id, file_id, name, structure_type, source_typ
         sink_type=sink_type,
         document_ids=[file_id]
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.create_index_with_options(workspace_id, request, headers, runtime)
 
 # 提交向量化任务
@@ -266,7 +258,7 @@ def submit_index(client, workspace_id, index_id):
     submit_index_job_request = bailian_20231229_models.SubmitIndexJobRequest(
         index_id=index_id
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.submit_index_job_with_options(workspace_id, submit_index_job_request, headers, runtime)
 
 # 查询向量化任务状态
@@ -290,7 +282,7 @@ def get_index_job_status(client, workspace_id, index_id, job_id):
         index_id=index_id,
         job_id=job_id
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.get_index_job_status_with_options(workspace_id, get_index_job_status_request, headers, runtime)
 
 # 查询所有知识库信息
@@ -309,9 +301,63 @@ def list_indices(client, workspace_id):
     """
     headers = {}
     list_indices_request = bailian_20231229_models.ListIndicesRequest()
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.list_indices_with_options(workspace_id, list_indices_request, headers, runtime)
 
+# 查询知识库下的文档
+
+
+def list_index_documents(client, workspace_id, index_id, page_number=1, page_size=100):
+    """
+    分页查询知识库下的文档。
+
+    参数:
+        client (bailian20231229Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        page_number (int): 页码，从 1 开始。
+        page_size (int): 每页文档数。
+
+    返回:
+        阿里云百炼服务的响应。
+    """
+    headers = {}
+    list_index_documents_request = bailian_20231229_models.ListIndexDocumentsRequest(
+        index_id=index_id,
+        page_number=page_number,
+        page_size=page_size
+    )
+    runtime = create_runtime_options()
+    return client.list_index_documents_with_options(workspace_id, list_index_documents_request, headers, runtime)
+
+# 查询文档的切片
+
+
+def list_chunks(client, workspace_id, index_id, file_id, page_num=1, page_size=100):
+    """
+    分页查询知识库中指定文档的文本切片。
+
+    参数:
+        client (bailian20231229Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        file_id (str): 文档ID。
+        page_num (int): 页码，从 1 开始。
+        page_size (int): 每页切片数。
+
+    返回:
+        阿里云百炼服务的响应。
+    """
+    headers = {}
+    list_chunks_request = bailian_20231229_models.ListChunksRequest(
+        index_id=index_id,
+        filed=file_id,
+        page_num=page_num,
+        page_size=page_size
+    )
+    runtime = create_runtime_options()
+    return client.list_chunks_with_options(workspace_id, list_chunks_request, headers, runtime)
+
 # 追加文件到知识库
 
 
@@ -323,7 +369,7 @@ def submit_index_add_documents_job(client, workspace_id, index_id, file_id, sour
         client (bailian_20231229_client.Client): 客户端（Client）。
         workspace_id (str): 业务空间ID。
         index_id (str): 知识库ID。
-        file_id (str): 文档ID。
+        file_id (str | list): 文档ID，或多个文档ID的列表（合并为一个任务）。
         source_type (str): 数据类型。
 
     返回:
@@ -333,10 +379,10 @@ def submit_index_add_documents_job(client, workspace_id, index_id, file_id, sour
         headers = {}
         submit_index_add_documents_job_request = bailian_20231229_models.SubmitIndexAddDocumentsJobRequest(
             index_id=index_id,
-            document_ids=[file_id],
+            document_ids=file_id if isinstance(file_id, list) else [file_id],
             source_type=source_type
         )
-        runtime = util_models.RuntimeOptions()
+        runtime = create_runtime_options()
         return client.submit_index_add_documents_job_with_options(workspace_id, submit_index_add_documents_job_request, headers, runtime)
     except Exception as e:
         print(f"submit_index_add_documents_job 错误: {e}")
@@ -353,7 +399,7 @@ def delete_index_document(client, workspace_id, index_id, file_id):
         client (bailian20231229Client): 客户端（Client）。
         workspace_id (str): 业务空间ID。
         index_id (str): 知识库ID。
-        file_id (str): 文档ID。
+        file_id (str | list): 文档ID，或多个文档ID的列表。
 
     返回:
         阿里云百炼服务的响应。
@@ -361,9 +407,9 @@ def delete_index_document(client, workspace_id, index_id, file_id):
     headers = {}
     delete_index_document_request = bailian_20231229_models.DeleteIndexDocumentRequest(
         index_id=index_id,
-        document_ids=[file_id]
+        document_ids=file_id if isinstance(file_id, list) else [file_id]
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.delete_index_document_with_options(workspace_id, delete_index_document_request, headers, runtime)
 
 # 删除知识库
@@ -385,7 +431,7 @@ def delete_index(client, workspace_id, index_id):
     delete_index_request = bailian_20231229_models.DeleteIndexRequest(
         index_id=index_id
     )
-    runtime = util_models.RuntimeOptions()
+    runtime = create_runtime_options()
     return client.delete_index_with_options(workspace_id, delete_index_request, headers, runtime)
 
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+百炼知识库检索
+提供同步的 retrieve_index、不阻塞事件循环且受熔断器保护的 aretrieve_index，
+以及带缓存的 acached_retrieve_index（检索失败或熔断时返回最后一次成功的过期结果）
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.breaker import CircuitOpenError, get_breaker
+from app.code_agent.rag.cache import get_retrieval_cache
+from app.code_agent.rag.client_pool import create_runtime_options
+from app.code_agent.rag.similarity_cache import get_similarity_cache
+from app.code_agent.rag.telemetry import get_telemetry
+from app.code_agent.utils.env import get_env_number
+
+# 默认的检索并发上限
+DEFAULT_RETRIEVE_CONCURRENCY = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_retrieve_concurrency() -> int:
+    """
+    获取检索并发上限，可通过环境变量 BAILIAN_RETRIEVE_CONCURRENCY 配置。
+
+    返回:
+        int: 并发上限。
+    """
+    return max(get_env_number('BAILIAN_RETRIEVE_CONCURRENCY', DEFAULT_RETRIEVE_CONCURRENCY), 1)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    获取检索专用的有界线程池。
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_retrieve_concurrency(),
+                    thread_name_prefix="bailian-retrieve"
+                )
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """
+    获取当前事件循环的检索信号量，每个事件循环各自一个。
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(get_retrieve_concurrency())
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def retrieve_index(client, workspace_id, index_id, query):
+    """
+    在指定的知识库中检索信息。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        query (str): 原始输入prompt。
+
+    返回:
+        阿里云百炼服务的响应。
+    """
+    headers = {}
+    retrieve_request = bailian_20231229_models.RetrieveRequest(
+        index_id=index_id,
+        query=query
+    )
+    runtime = create_runtime_options()
+    telemetry = get_telemetry()
+    with telemetry.timed("retrieve_index"):
+        response = client.retrieve_with_options(workspace_id, retrieve_request, headers, runtime)
+    data = response.body.data if response.body else None
+    telemetry.observe("retrieve_index.nodes", len(data.nodes or []) if data else 0)
+    return response
+
+
+async def aretrieve_index(client, workspace_id, index_id, query, breaker=None):
+    """
+    异步检索知识库，检索在有界线程池中执行，不阻塞事件循环。
+
+    SDK 的 retrieve_with_options_async 每次请求都会新建 aiohttp 会话，
+    无法复用连接池，因此这里复用同步客户端的 keep-alive 连接。
+    熔断器打开时不发出请求，直接抛出 CircuitOpenError；调用被取消（如上层超时）按失败计入熔断器。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        query (str): 原始输入prompt。
+        breaker (CircuitBreaker): 熔断器，默认使用进程内共享的熔断器。
+
+    返回:
+        阿里云百炼服务的响应。
+    """
+    breaker = breaker or get_breaker()
+    loop = asyncio.get_running_loop()
+    if breaker is not None and not breaker.allow():
+        get_telemetry().incr("retrieve_index.rejected")
+        raise CircuitOpenError("知识库检索服务熔断中，请稍后重试")
+    try:
+        async with _get_semaphore():
+            started = time.perf_counter()
+            response = await loop.run_in_executor(
+                _get_executor(), retrieve_index, client, workspace_id, index_id, query
+            )
+    except BaseException:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+    if breaker is not None:
+        breaker.record_success((time.perf_counter() - started) * 1000)
+    return response
+
+
+async def acached_retrieve_index(client, workspace_id, index_id, query, cache=None, similarity_cache=None):
+    """
+    依次查精确缓存和近似查询缓存，均未命中时再异步检索知识库并写回缓存；
+    检索失败或熔断时返回精确缓存中最后一次成功的结果，并标记为过期结果（见 cache.is_stale）。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        query (str): 原始输入prompt。
+        cache (RetrievalCache): 检索缓存，默认使用进程内共享的缓存。
+        similarity_cache (SimilarityCache): 近似查询缓存，默认使用进程内共享的缓存。
+
+    返回:
+        阿里云百炼服务的响应。
+    """
+    cache = cache or get_retrieval_cache()
+    similarity_cache = similarity_cache or get_similarity_cache()
+    if cache is not None:
+        cached = cache.get(workspace_id, index_id, query)
+        if cached is not None:
+            return cached
+    if similarity_cache is not None:
+        cached = similarity_cache.get(workspace_id, index_id, query)
+        if cached is not None:
+            return cached
+
+    try:
+        response = await aretrieve_index(client, workspace_id, index_id, query)
+    except Exception:
+        stale = cache.get_stale(workspace_id, index_id, query) if cache is not None else None
+        if stale is None:
+            raise
+        get_telemetry().incr("retrieve_index.stale_served")
+        return stale
+    if cache is not None:
+        cache.put(workspace_id, index_id, query, response)
+    if similarity_cache is not None:
+        similarity_cache.put(workspace_id, index_id, query, response)
+    return response
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库近似查询缓存
+基于字符 n-gram 的 MinHash 签名做局部敏感哈希分桶，
+只有标点、语序或个别字符不同的查询可以复用最近的检索结果
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from app.code_agent.rag.cache import decode_response, encode_response, is_cacheable, normalize_query
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NGRAM = 2
+DEFAULT_NUM_PERM = 32
+DEFAULT_BANDS = 16
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 512
+
+# MinHash 使用的梅森素数及固定的置换参数，保证跨进程签名一致
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+
+
+def _make_permutations(num_perm: int) -> List[Tuple[int, int]]:
+    """
+    生成确定性的 MinHash 置换参数 (a, b)。
+    """
+    permutations = []
+    for i in range(num_perm):
+        digest = hashlib.blake2b(f"minhash-{i}".encode("utf-8"), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "little") % (_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], "little") % _PRIME
+        permutations.append((a, b))
+    return permutations
+
+
+def shingles(text: str, ngram: int = DEFAULT_NGRAM) -> FrozenSet[str]:
+    """
+    提取字符 n-gram 集合（包含 1 到 ngram 元），去除空白和标点，适合中文查询。
+
+    参数:
+        text (str): 查询文本。
+        ngram (int): 最大的 n-gram 长度。
+
+    返回:
+        frozenset: n-gram 集合。
+    """
+    text = re.sub(r"[\W_]+", "", normalize_query(text))
+    grams = set()
+    for n in range(1, ngram + 1):
+        for i in range(len(text) - n + 1):
+            grams.add(text[i:i + n])
+    return frozenset(grams)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """
+    计算两个集合的 Jaccard 相似度。
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SimilarityCache:
+    """
+    近似查询缓存
+
+    MinHash 签名按 bands 分段建立倒排桶，查询时只比较落在同一桶中的候选，
+    再用 n-gram 集合的精确 Jaccard 相似度与阈值比较，避免误命中。
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, ngram: int = DEFAULT_NGRAM,
+                 num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS,
+                 ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.threshold = threshold
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._permutations = _make_permutations(num_perm)
+
+        # entry_id -> (作用域, n-gram 集合, 分段签名, 过期时间, 序列化后的响应)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # (作用域, 段序号, 段签名) -> entry_id 集合
+        self._buckets: Dict[Tuple[Tuple[str, str], int, Tuple[int, ...]], set] = {}
+        # (作用域, n-gram 集合) -> entry_id，相同查询只保留一个条目
+        self._keys: Dict[Tuple[Tuple[str, str], FrozenSet[str]], int] = {}
+        # 按写入顺序排列的 entry_id，TTL 固定，写入顺序即过期顺序
+        self._expiry: deque = deque()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def signature(self, grams: FrozenSet[str]) -> List[int]:
+        """
+        计算 n-gram 集合的 MinHash 签名。
+
+        参数:
+            grams (frozenset): n-gram 集合。
+
+        返回:
+            list: 长度为 num_perm 的签名。
+        """
+        if not grams:
+            return [_MAX_HASH] * len(self._permutations)
+        hashes = [
+            int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+            for g in grams
+        ]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations]
+
+    def _bands_of(self, grams: FrozenSet[str]) -> List[Tuple[int, ...]]:
+        """
+        将签名切分为 bands 段。
+        """
+        sig = self.signature(grams)
+        return [tuple(sig[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    def get(self, workspace_id: str, index_id: str, query: str):
+        """
+        查找与查询足够相似的缓存结果。
+
+        参数:
+            workspace_id (str): 业务空间ID。
+            index_id (str): 知识库ID。
+            query (str): 原始查询。
+
+        返回:
+            命中时返回阿里云百炼检索响应，未命中返回 None。
+        """
+        scope = (workspace_id or "", index_id or "")
+        grams = shingles(query, self.ngram)
+        if not grams:
+            return None
+        bands = self._bands_of(grams)
+        now = time.time()
+
+        with self._lock:
+            candidates = set()
+            for i, band in enumerate(bands):
+                candidates |= self._buckets.get((scope, i, band), set())
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                _, entry_grams, _, expires_at, _ = self._entries[entry_id]
+                if expires_at < now:
+                    continue
+                score = jaccard(grams, entry_grams)
+                if score >= self.threshold and score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return decode_response(self._entries[best_id][4])
+
+    def put(self, workspace_id: str, index_id: str, query: str, response):
+        """
+        写入缓存，非成功的响应会被忽略；替换相同查询的已有条目，并清理已过期的条目。
+
+        参数:
+            workspace_id (str): 业务空间ID。
+            index_id (str): 知识库ID。
+            query (str): 原始查询。
+            response: 阿里云百炼检索响应。
+        """
+        if not is_cacheable(response):
+            return
+        scope = (workspace_id or "", index_id or "")
+        grams = shingles(query, self.ngram)
+        if not grams:
+            return
+        bands = self._bands_of(grams)
+        value = encode_response(response)
+        now = time.time()
+        expires_at = now + self.ttl
+
+        with self._lock:
+            self._purge_expired(now)
+            existing = self._keys.get((scope, grams))
+            if existing is not None:
+                self._remove(existing)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, grams, bands, expires_at, value)
+            self._keys[(scope, grams)] = entry_id
+            self._expiry.append(entry_id)
+            for i, band in enumerate(bands):
+                self._buckets.setdefault((scope, i, band), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        清空缓存。
+        """
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._keys.clear()
+            self._expiry.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息。
+
+        返回:
+            dict: 命中、未命中次数以及当前条目数。
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def _purge_expired(self, now: float):
+        """
+        按写入顺序移除已过期的条目，调用方需持有锁。
+        """
+        while self._expiry:
+            entry = self._entries.get(self._expiry[0])
+            if entry is not None and entry[3] >= now:
+                break
+            entry_id = self._expiry.popleft()
+            if entry is not None:
+                self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        """
+        移除条目及其分桶索引，调用方需持有锁。
+        """
+        scope, grams, bands, _, _ = self._entries.pop(entry_id)
+        self._keys.pop((scope, grams), None)
+        for i, band in enumerate(bands):
+            bucket = self._buckets.get((scope, i, band))
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[(scope, i, band)]
+
+
+_cache: Optional[SimilarityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_similarity_cache() -> Optional[SimilarityCache]:
+    """
+    获取进程内共享的近似查询缓存，配置来自环境变量：
+    RAG_SIMILAR_CACHE_ENABLED、RAG_SIMILAR_THRESHOLD、RAG_SIMILAR_TTL、RAG_SIMILAR_MAX_ENTRIES。
+
+    返回:
+        SimilarityCache: 近似查询缓存，RAG_SIMILAR_CACHE_ENABLED=0 时返回 None。
+    """
+    global _cache
+    if os.getenv("RAG_SIMILAR_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SimilarityCache(
+                    threshold=get_env_number("RAG_SIMILAR_THRESHOLD", DEFAULT_THRESHOLD),
+                    ttl=get_env_number("RAG_SIMILAR_TTL", float(DEFAULT_TTL)),
+                    max_entries=get_env_number("RAG_SIMILAR_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+                )
+    return _cache
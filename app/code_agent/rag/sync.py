@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库增量同步
+在本地清单中记录每个文档的 MD5、文档ID及所属知识库，同步时与工作区比对：
+只导入新增或修改的文档，等待索引任务完成后再从知识库中删除已移除文档及被替换的旧版本
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.code_agent.rag.fingerprint import file_fingerprints, get_fingerprint_cache
+from app.code_agent.rag.ingest import STAGE_INDEX, IngestPipeline, get_index_batch_size, iter_ingest_files
+from app.code_agent.rag.jobs import await_index_jobs
+from app.code_agent.rag.rag import delete_index_document
+
+# 清单格式版本
+MANIFEST_VERSION = 1
+
+# 默认的清单路径
+DEFAULT_MANIFEST_PATH = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_manifest.json")
+
+
+def get_manifest_path() -> str:
+    """
+    获取清单路径，可通过环境变量 RAG_SYNC_MANIFEST 配置。
+
+    返回:
+        str: 清单路径。
+    """
+    return os.getenv("RAG_SYNC_MANIFEST") or DEFAULT_MANIFEST_PATH
+
+
+def load_manifest(manifest_path: str) -> Dict:
+    """
+    读取清单，文件不存在时返回空清单。
+
+    清单结构：
+        {"version": 1, "indices": {知识库ID: {"files": {路径: {"md5", "file_id", "index_id", "size"}},
+                                             "orphans": [待删除的文档ID]}}}
+
+    参数:
+        manifest_path (str): 清单路径。
+
+    返回:
+        dict: 清单。
+    """
+    if not os.path.exists(manifest_path):
+        return {"version": MANIFEST_VERSION, "indices": {}}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"清单格式不兼容: {manifest_path}")
+    return manifest
+
+
+def save_manifest(manifest: Dict, manifest_path: str):
+    """
+    原子地写入清单，先写临时文件再替换，避免中断时留下损坏的清单。
+
+    参数:
+        manifest (dict): 清单。
+        manifest_path (str): 清单路径。
+    """
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _under_roots(path: str, roots: List[str]) -> bool:
+    """
+    判断路径是否位于本次同步的源路径下。
+    """
+    return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+
+
+def diff_manifest(files: Dict, fingerprints: Dict[str, tuple], roots: List[str]) -> Dict[str, List[str]]:
+    """
+    比对清单与工作区。
+
+    参数:
+        files (dict): 清单中某个知识库的 路径 -> 条目。
+        fingerprints (dict): 工作区 路径 -> (file_name, file_md5, file_size)。
+        roots (list): 本次同步的源路径（绝对路径），只有位于其下的清单条目才可能被判定为已删除。
+
+    返回:
+        dict: added、changed、removed、unchanged 四类路径列表。
+    """
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+    for path, (_, md5, _) in fingerprints.items():
+        entry = files.get(path)
+        if entry is None:
+            diff["added"].append(path)
+        elif entry["md5"] != md5:
+            diff["changed"].append(path)
+        else:
+            diff["unchanged"].append(path)
+    for path in files:
+        if path not in fingerprints and _under_roots(path, roots):
+            diff["removed"].append(path)
+    return diff
+
+
+async def _delete_documents(client, workspace_id: str, index_id: str, file_ids: List[str],
+                            batch_size: int) -> List[str]:
+    """
+    分批删除知识库中的文档。
+
+    返回:
+        list: 删除失败的文档ID。
+    """
+    failed = []
+    for start in range(0, len(file_ids), batch_size):
+        batch = file_ids[start:start + batch_size]
+        try:
+            response = await asyncio.to_thread(delete_index_document, client, workspace_id, index_id, batch)
+            if getattr(response.body, "success", True) is False:
+                raise RuntimeError(response.body.message or response.body.code)
+        except Exception as e:
+            print(f"删除文档失败 {batch}: {type(e).__name__} {e}")
+            failed.extend(batch)
+    return failed
+
+
+async def async_knowledge_base(client, workspace_id: str, index_id: str, source_paths: Iterable[str],
+                               manifest_path: Optional[str] = None, dry_run: bool = False,
+                               batch_size: Optional[int] = None, job_options: Optional[Dict] = None,
+                               **kwargs) -> Dict:
+    """
+    将源路径下的文档增量同步到知识库。
+
+    参数:
+        client (bailian_20231229_client.Client): 客户端（Client）。
+        workspace_id (str): 业务空间ID。
+        index_id (str): 知识库ID。
+        source_paths (Iterable[str]): 文件或目录路径。
+        manifest_path (str): 清单路径，默认读取 RAG_SYNC_MANIFEST。
+        dry_run (bool): 只比对不执行。
+        batch_size (int): 每个追加导入或删除请求包含的文档数，默认读取 RAG_INGEST_INDEX_BATCH_SIZE。
+        job_options (dict): 传给 IndexJobTracker 的参数。
+        **kwargs: 传给 IngestPipeline 的其他参数。
+
+    返回:
+        dict: 各类文档数量、导入或索引失败的路径、提交的索引任务ID及待删除的文档数。
+    """
+    manifest_path = manifest_path or get_manifest_path()
+    batch_size = batch_size or get_index_batch_size()
+    roots = [os.path.abspath(source) for source in source_paths]
+
+    manifest = load_manifest(manifest_path)
+    state = manifest["indices"].setdefault(index_id, {"files": {}, "orphans": []})
+    files = state["files"]
+
+    paths = [os.path.abspath(path) for path in iter_ingest_files(roots)]
+    fingerprints = await asyncio.to_thread(file_fingerprints, paths, get_fingerprint_cache())
+    diff = diff_manifest(files, fingerprints, roots)
+    summary = {name: len(items) for name, items in diff.items()}
+    print(f"同步计划: 新增 {summary['added']}，修改 {summary['changed']}，"
+          f"删除 {summary['removed']}，未变化 {summary['unchanged']}")
+    if dry_run:
+        return dict(summary, failed=[], jobs=[], diff=diff)
+
+    results = []
+    to_upload = diff["added"] + diff["changed"]
+    if to_upload:
+        # 清单按源文档记录单个文档ID，同步时不做本地预处理切分
+        kwargs["preprocess"] = False
+        pipeline = IngestPipeline(client, workspace_id, index_id, index_batch_size=batch_size, **kwargs)
+        results = await pipeline.arun(to_upload)
+
+    # 等待索引任务结束，旧版本文档只在新版本的索引任务完成后删除，避免知识库中出现空窗；
+    # 任务失败时保留旧版本及清单条目，新版本文档记为待删除
+    jobs = sorted({result["job_id"] for result in results if result["status"] == "success"})
+    job_results = await await_index_jobs(client, workspace_id, [(index_id, job_id) for job_id in jobs],
+                                         **(job_options or {})) if jobs else []
+    completed = {job_id for job_id, job in zip(jobs, job_results) if isinstance(job, dict)}
+
+    to_delete = list(state["orphans"])
+    failed = []
+    for result in results:
+        path = result["path"]
+        if result["status"] != "success" or result["job_id"] not in completed:
+            failed.append(path)
+            # 已添加但未完成索引的文档记为待删除，下次同步时清理
+            if result["file_id"] and (result["status"] == "success" or result["stage"] == STAGE_INDEX):
+                to_delete.append(result["file_id"])
+            continue
+        previous = files.get(path)
+        if previous is not None:
+            to_delete.append(previous["file_id"])
+        _, md5, size = fingerprints[path]
+        files[path] = {"md5": md5, "file_id": result["file_id"], "index_id": index_id, "size": size}
+    for path in diff["removed"]:
+        to_delete.append(files.pop(path)["file_id"])
+
+    # 删除失败的文档ID记为待删除，下次同步时重试
+    state["orphans"] = await _delete_documents(client, workspace_id, index_id, to_delete, batch_size)
+    save_manifest(manifest, manifest_path)
+
+    summary["failed"] = failed
+    summary["jobs"] = jobs
+    summary["orphans"] = len(state["orphans"])
+    print(f"同步完成: 导入或索引失败 {len(failed)}，待删除 {summary['orphans']}")
+    return summary
+
+
+def sync_knowledge_base(client, workspace_id: str, index_id: str, source_paths: Iterable[str], **kwargs) -> Dict:
+    """
+    async_knowledge_base 的同步版本。
+    """
+    return asyncio.run(async_knowledge_base(client, workspace_id, index_id, source_paths, **kwargs))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.code_agent.rag.rag import create_client
+
+    # 解析命令行参数，指定文档来源和目标知识库
+    parser = argparse.ArgumentParser(description="将文档增量同步到百炼知识库")
+    parser.add_argument("sources", nargs="+", help="文档文件或目录")
+    parser.add_argument("--index-id", default=os.getenv("knowledge_base_id"), help="知识库ID")
+    parser.add_argument("--manifest", default=None, help="清单路径")
+    parser.add_argument("--batch-size", type=int, default=None, help="每个追加导入或删除请求包含的文档数")
+    parser.add_argument("--dry-run", action="store_true", help="只输出同步计划，不做任何修改")
+    args = parser.parse_args()
+
+    sync_knowledge_base(
+        create_client(),
+        os.getenv("workspace_id"),
+        args.index_id,
+        args.sources,
+        manifest_path=args.manifest,
+        dry_run=args.dry_run,
+        batch_size=args.batch_size,
+    )
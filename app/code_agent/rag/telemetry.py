@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+知识库检索遥测
+在进程内统计检索耗时分位数、结果节点数、返回字节数和 token 数、各级缓存命中率及错误类型，
+定期将快照写入本地 JSON 文件，并可按次追加 JSONL 事件日志，用于区分慢轮次来自检索还是模型；
+智能体进程和 RAG 服务进程各自统计，快照文件名中带进程角色，互不覆盖
+"""
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.code_agent.rag.breaker import get_breaker
+from app.code_agent.rag.cache import get_retrieval_cache
+from app.code_agent.rag.similarity_cache import get_similarity_cache
+from app.code_agent.rag.turn_memo import get_turn_memo
+from app.code_agent.utils.env import get_env_number
+
+# 默认配置
+DEFAULT_WINDOW = 2048
+DEFAULT_FLUSH_SECONDS = 30.0
+# 快照路径中的 {role} 替换为进程角色
+DEFAULT_SNAPSHOT_PATH = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_telemetry.{role}.json")
+
+# 快照中输出的分位数
+PERCENTILES = (50, 95, 99)
+
+
+def get_process_role() -> str:
+    """
+    获取进程角色，可通过环境变量 RAG_TELEMETRY_ROLE 配置，默认为入口脚本名（如 code_agent、rag）。
+
+    返回:
+        str: 进程角色。
+    """
+    return os.getenv("RAG_TELEMETRY_ROLE") or Path(sys.argv[0]).stem or "python"
+
+
+def get_snapshot_path(role: Optional[str] = None) -> Optional[str]:
+    """
+    获取快照路径，可通过环境变量 RAG_TELEMETRY_SNAPSHOT 配置，其中的 {role} 替换为进程角色。
+
+    参数:
+        role (str): 进程角色，默认为 get_process_role()。
+
+    返回:
+        str: 快照路径，RAG_TELEMETRY_SNAPSHOT 为空字符串时返回 None。
+    """
+    path = os.getenv("RAG_TELEMETRY_SNAPSHOT", DEFAULT_SNAPSHOT_PATH)
+    if not path:
+        return None
+    return path.replace("{role}", role or get_process_role())
+
+
+def summarize(samples) -> Dict[str, float]:
+    """
+    计算样本的数量、均值、分位数及最大值（最近邻秩分位数）。
+
+    参数:
+        samples (Iterable[float]): 样本。
+
+    返回:
+        dict: count、mean、p50、p95、p99、max，无样本时只有 count。
+    """
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    summary = {"count": len(values), "mean": sum(values) / len(values)}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))]
+    summary["max"] = values[-1]
+    return summary
+
+
+class Telemetry:
+    """
+    检索遥测
+
+    每个指标只保留最近 window 个样本用于计算分位数，计数器和错误类型累计计数；
+    所有方法线程安全，可同时在事件循环和检索线程池中调用。
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, snapshot_path: Optional[str] = None,
+                 log_path: Optional[str] = None, flush_seconds: float = DEFAULT_FLUSH_SECONDS):
+        self.window = window
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.flush_seconds = flush_seconds
+        self.started_at = time.time()
+        self._samples: Dict[str, deque] = {}
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def observe(self, name: str, value: float):
+        """
+        记录一个样本。
+
+        参数:
+            name (str): 指标名，如 retrieve_index.latency_ms。
+            value (float): 样本值。
+        """
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value)
+
+    def incr(self, name: str, n: int = 1):
+        """
+        累加计数器。
+        """
+        with self._lock:
+            self._counters[name] += n
+
+    def record_error(self, name: str, error: BaseException):
+        """
+        按异常类型记录错误。
+
+        参数:
+            name (str): 操作名。
+            error (BaseException): 异常。
+        """
+        with self._lock:
+            self._errors[name][type(error).__name__] += 1
+
+    @contextmanager
+    def timed(self, name: str):
+        """
+        记录代码块耗时到 <name>.latency_ms，抛出异常时同时记录错误类型。
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.record_error(name, e)
+            raise
+        finally:
+            self.observe(f"{name}.latency_ms", (time.perf_counter() - started) * 1000)
+
+    def log_event(self, event: str, **fields):
+        """
+        配置了事件日志时追加一行 JSON。
+
+        参数:
+            event (str): 事件名。
+            **fields: 事件字段。
+        """
+        if not self.log_path:
+            return
+        line = json.dumps({"ts": time.time(), "event": event, **fields}, ensure_ascii=False)
+        with self._log_lock:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取当前指标快照，包含各级缓存的统计信息。
+
+        返回:
+            dict: uptime、metrics（各指标的分位数摘要）、counters、errors、caches 及 breaker。
+        """
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            counters = dict(self._counters)
+            errors = {name: dict(classes) for name, classes in self._errors.items()}
+        breaker = get_breaker()
+        return {
+            "ts": time.time(),
+            "uptime": time.time() - self.started_at,
+            "metrics": {name: summarize(values) for name, values in sorted(samples.items())},
+            "counters": counters,
+            "errors": errors,
+            "caches": _cache_stats(),
+            "breaker": breaker.stats() if breaker is not None else None,
+        }
+
+    def flush(self, path: Optional[str] = None) -> Optional[str]:
+        """
+        将快照原子地写入 JSON 文件。
+
+        参数:
+            path (str): 快照路径，默认为 snapshot_path。
+
+        返回:
+            str: 写入的路径，未配置路径时返回 None。
+        """
+        path = path or self.snapshot_path
+        if not path:
+            return None
+        snapshot = self.snapshot()
+        snapshot_dir = os.path.dirname(path)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+        return path
+
+    def maybe_flush(self) -> Optional[str]:
+        """
+        距上次写入超过 flush_seconds 时写入快照。
+        """
+        if time.monotonic() - self._last_flush < self.flush_seconds:
+            return None
+        return self.flush()
+
+
+def _cache_stats() -> Dict[str, Any]:
+    """
+    收集检索缓存、近似查询缓存和轮次备忘的命中统计。
+    """
+    stats = {}
+    for name, cache in (("retrieval", get_retrieval_cache()), ("similarity", get_similarity_cache())):
+        if cache is not None:
+            stats[name] = cache.stats()
+    memo = get_turn_memo()
+    lookups = memo.hits + memo.misses
+    stats["turn_memo"] = {
+        "hits": memo.hits,
+        "misses": memo.misses,
+        "hit_rate": memo.hits / lookups if lookups else 0.0,
+    }
+    return stats
+
+
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """
+    获取进程内共享的检索遥测，配置来自环境变量：
+    RAG_TELEMETRY_SNAPSHOT（为空字符串时不写快照）、RAG_TELEMETRY_ROLE、RAG_TELEMETRY_LOG、RAG_TELEMETRY_FLUSH_SECONDS、RAG_TELEMETRY_WINDOW。
+
+    返回:
+        Telemetry: 检索遥测。
+    """
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry(
+                    window=get_env_number("RAG_TELEMETRY_WINDOW", DEFAULT_WINDOW),
+                    snapshot_path=get_snapshot_path(),
+                    log_path=os.getenv("RAG_TELEMETRY_LOG") or None,
+                    flush_seconds=get_env_number("RAG_TELEMETRY_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS),
+                )
+    return _telemetry
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 解析命令行参数，打印已写入的快照，默认打印所有进程角色的快照
+    parser = argparse.ArgumentParser(description="查看知识库检索遥测快照")
+    parser.add_argument("snapshots", nargs="*", help="快照路径，默认为各进程角色的快照")
+    args = parser.parse_args()
+
+    snapshot_paths = args.snapshots or sorted(glob.glob(get_snapshot_path("*") or ""))
+    if not snapshot_paths:
+        print("未找到遥测快照")
+    for snapshot_path in snapshot_paths:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        print(f"== {snapshot_path}")
+        print(f"运行时长 {data['uptime']:.0f}s")
+        for name, summary in data["metrics"].items():
+            if summary["count"]:
+                print(f"{name}: n={summary['count']} p50={summary['p50']:.1f} p95={summary['p95']:.1f} "
+                      f"p99={summary['p99']:.1f} max={summary['max']:.1f}")
+        for name, value in data["counters"].items():
+            print(f"{name}: {value}")
+        for name, classes in data["errors"].items():
+            print(f"{name} 错误: {classes}")
+        for name, stats in data["caches"].items():
+            print(f"{name} 缓存命中率: {stats['hit_rate']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']})")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+单轮对话内的知识检索备忘
+同一轮对话中，预检索与 RAG 工具调用对同一查询只检索一次
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from app.code_agent.rag.cache import normalize_query
+
+# MCP 调用元数据中携带轮次 ID 的字段名
+TURN_ID_META_KEY = "turn_id"
+
+# 默认保留的最近轮次数
+DEFAULT_MAX_TURNS = 16
+
+# RAG 工具未检索到节点时返回的提示
+NO_RESULT_MESSAGE = "未找到相关知识节点"
+# RAG 工具返回的错误提示前缀：配置缺失、检索失败及执行异常
+ERROR_PREFIXES = ("错误：", "查询失败: ", "执行错误: ")
+
+# 当前对话轮次 ID，随 asyncio 任务上下文传递到工具调用
+current_turn_id: ContextVar[Optional[str]] = ContextVar("current_turn_id", default=None)
+
+
+def start_turn() -> str:
+    """
+    开始新的一轮对话，生成并设置当前轮次 ID。
+
+    返回:
+        str: 轮次 ID。
+    """
+    turn_id = uuid.uuid4().hex
+    current_turn_id.set(turn_id)
+    return turn_id
+
+
+def is_memoizable(result: str) -> bool:
+    """
+    判断 RAG 工具的结果是否可以备忘，未检索到节点及错误提示不备忘，避免临时失败在本轮内被重复返回。
+
+    参数:
+        result (str): 工具结果文本。
+
+    返回:
+        bool: 是否可以备忘。
+    """
+    return bool(result) and result != NO_RESULT_MESSAGE and not result.startswith(ERROR_PREFIXES)
+
+
+class TurnMemo:
+    """
+    轮次内检索备忘
+
+    按 轮次 ID -> 归一化查询 -> 检索结果文本 记录，只保留最近 max_turns 轮。
+    """
+
+    def __init__(self, max_turns: int = DEFAULT_MAX_TURNS):
+        self.max_turns = max_turns
+        self._turns: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, turn_id: Optional[str], query: str) -> Optional[str]:
+        """
+        查询本轮是否已检索过该查询。
+
+        参数:
+            turn_id (str): 轮次 ID，为空时直接未命中。
+            query (str): 查询。
+
+        返回:
+            str: 已检索的结果文本，未命中返回 None。
+        """
+        if not turn_id:
+            return None
+        with self._lock:
+            result = self._turns.get(turn_id, {}).get(normalize_query(query))
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, turn_id: Optional[str], query: str, result: str):
+        """
+        记录本轮的检索结果。
+
+        参数:
+            turn_id (str): 轮次 ID，为空时忽略。
+            query (str): 查询。
+            result (str): 检索结果文本。
+        """
+        if not turn_id or not result:
+            return
+        with self._lock:
+            turn = self._turns.get(turn_id)
+            if turn is None:
+                turn = self._turns[turn_id] = {}
+                while len(self._turns) > self.max_turns:
+                    self._turns.popitem(last=False)
+            turn[normalize_query(query)] = result
+
+
+_memo = TurnMemo()
+
+
+def get_turn_memo() -> TurnMemo:
+    """
+    获取进程内共享的轮次备忘。
+
+    返回:
+        TurnMemo: 轮次备忘。
+    """
+    return _memo
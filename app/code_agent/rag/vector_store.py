@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地向量知识库
+使用字符 n-gram 特征哈希生成稠密向量，无需下载嵌入模型；向量以 float32 写入磁盘，
+加载时通过 numpy.memmap 映射，多个进程共享操作系统页缓存，检索时分块批量计算余弦相似度
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.cache import normalize_query
+from app.code_agent.rag.local_index import (
+    DEFAULT_CHUNK_SIZE,
+    iter_document_chunks,
+    resolve_directory,
+    write_directory,
+)
+
+# 向量库格式版本
+STORE_VERSION = 1
+
+# 默认配置
+DEFAULT_DIM = 512
+DEFAULT_NGRAMS = (2, 3)
+DEFAULT_TOP_K = 5
+# 检索时每次参与矩阵乘法的向量行数，限制临时内存
+SEARCH_BLOCK_ROWS = 65536
+# 构建时每批写入的片段数
+BUILD_BATCH_SIZE = 1024
+
+# 默认向量库目录
+DEFAULT_STORE_DIR = str(Path(__file__).parent.parent.parent.parent / ".temp" / "rag_vectors")
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def embed_texts(texts: Sequence[str], dim: int = DEFAULT_DIM, ngrams: Sequence[int] = DEFAULT_NGRAMS) -> np.ndarray:
+    """
+    特征哈希嵌入：将归一化文本的字符 n-gram 用 CRC32 哈希到 dim 维，
+    哈希值最高位决定符号以抵消冲突，词频取 log(1 + tf) 后做 L2 归一化。
+
+    参数:
+        texts (Sequence[str]): 文本列表。
+        dim (int): 向量维度。
+        ngrams (Sequence[int]): 使用的 n-gram 长度。
+
+    返回:
+        np.ndarray: 形状为 (len(texts), dim) 的 float32 矩阵，每行 L2 范数为 1（空文本为零向量）。
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        text = _SPACE_RE.sub(" ", normalize_query(text))
+        counts: Dict[int, float] = {}
+        for n in ngrams:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                index = h % dim
+                counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+        if counts:
+            indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            vectors[row, indices] = np.sign(values) * np.log1p(np.abs(values))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def build_vector_store(source_paths: Iterable[str], output_dir: str = DEFAULT_STORE_DIR,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE, dim: int = DEFAULT_DIM) -> Dict:
+    """
+    从文档构建本地向量库并写入磁盘，每次构建写入新的子目录并通过 CURRENT 指针文件切换，
+    正在映射旧向量库的进程不受影响。
+
+    构建目录包含：
+        meta.json      向量库元信息
+        vectors.f32    float32 的 (片段数, dim) 向量矩阵
+        docs.jsonl     片段文本及元数据，行号即向量行号
+        offsets.bin    int64 的 docs.jsonl 行偏移
+
+    参数:
+        source_paths (Iterable[str]): 文件或目录路径。
+        output_dir (str): 向量库目录。
+        chunk_size (int): 片段的最大字符数。
+        dim (int): 向量维度。
+
+    返回:
+        dict: 向量库元信息。
+    """
+    return write_directory(output_dir, lambda tmp_dir: _write_store_files(source_paths, tmp_dir, chunk_size, dim))
+
+
+def _write_store_files(source_paths: Iterable[str], output_dir: str, chunk_size: int, dim: int) -> Dict:
+    """
+    将向量库文件写入指定目录。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = [0]
+    batch: List[str] = []
+    count = 0
+
+    with open(os.path.join(output_dir, "vectors.f32"), "wb") as vectors_file, \
+            open(os.path.join(output_dir, "docs.jsonl"), "wb") as docs_file:
+
+        def flush():
+            embed_texts(batch, dim).tofile(vectors_file)
+            batch.clear()
+
+        for chunk, metadata in iter_document_chunks(source_paths, chunk_size):
+            line = json.dumps({"text": chunk, "metadata": metadata}, ensure_ascii=False).encode("utf-8") + b"\n"
+            docs_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+            batch.append(chunk)
+            count += 1
+            if len(batch) >= BUILD_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+
+    np.asarray(offsets, dtype=np.int64).tofile(os.path.join(output_dir, "offsets.bin"))
+    meta = {
+        "version": STORE_VERSION,
+        "byteorder": sys.byteorder,
+        "dim": dim,
+        "ngrams": list(DEFAULT_NGRAMS),
+        "count": count,
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+class VectorStore:
+    """
+    本地向量库
+
+    向量矩阵、行偏移和片段文本均只读映射，检索时按块计算内积（向量已归一化，内积即余弦相似度）。
+    """
+
+    def __init__(self, store_dir: str):
+        store_dir = resolve_directory(store_dir)
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION or self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"本地向量库格式不兼容，请重新构建: {store_dir}")
+
+        self.dim = self.meta["dim"]
+        self.ngrams = tuple(self.meta["ngrams"])
+        self.count = self.meta["count"]
+        if self.count:
+            self.vectors = np.memmap(os.path.join(store_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dim))
+            self.offsets = np.memmap(os.path.join(store_dir, "offsets.bin"), dtype=np.int64, mode="r")
+            self._docs = np.memmap(os.path.join(store_dir, "docs.jsonl"), dtype=np.uint8, mode="r")
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def search_batch(self, queries: Sequence[str], top_k: int = DEFAULT_TOP_K) -> List[List[tuple]]:
+        """
+        批量检索，所有查询在同一次矩阵乘法中计算。
+
+        参数:
+            queries (Sequence[str]): 查询列表。
+            top_k (int): 每个查询返回的片段数。
+
+        返回:
+            list: 每个查询的 (相似度, 片段序号) 列表，按相似度降序。
+        """
+        if not self.count or not queries or top_k <= 0:
+            return [[] for _ in queries]
+        query_vectors = embed_texts(queries, self.dim, self.ngrams)
+        top_k = min(top_k, self.count)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores = query_vectors @ block.T
+            ids = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+            # 合并当前块与之前的候选，保留每个查询的 top_k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, ids], axis=1)
+            if scores.shape[1] > top_k:
+                keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                ids = np.take_along_axis(ids, keep, axis=1)
+            best_scores, best_ids = scores, ids
+
+        results = []
+        for scores, ids in zip(best_scores, best_ids):
+            order = np.argsort(-scores, kind="stable")
+            results.append([(float(scores[i]), int(ids[i])) for i in order if scores[i] > 0])
+        return results
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[tuple]:
+        """
+        检索单个查询。
+
+        返回:
+            list: (相似度, 片段序号) 列表，按相似度降序。
+        """
+        return self.search_batch([query], top_k)[0]
+
+    def get_document(self, doc_id: int) -> Dict:
+        """
+        读取片段文本及元数据。
+
+        参数:
+            doc_id (int): 片段序号。
+
+        返回:
+            dict: 包含 text 和 metadata 的字典。
+        """
+        start, end = int(self.offsets[doc_id]), int(self.offsets[doc_id + 1])
+        return json.loads(self._docs[start:end].tobytes().decode("utf-8"))
+
+    def retrieve(self, query: str, top_k: int = DEFAULT_TOP_K):
+        """
+        检索并返回与百炼 retrieve_index 结构一致的响应。
+
+        参数:
+            query (str): 查询。
+            top_k (int): 返回的片段数。
+
+        返回:
+            RetrieveResponse: 检索响应，节点包含 text、score 和 metadata。
+        """
+        nodes = []
+        for score, doc_id in self.search(query, top_k):
+            doc = self.get_document(doc_id)
+            nodes.append({"Text": doc["text"], "Score": score, "Metadata": doc["metadata"]})
+        return bailian_20231229_models.RetrieveResponse().from_map({
+            "statusCode": 200,
+            "body": {"Code": "Success", "Success": True, "Data": {"Nodes": nodes}},
+        })
+
+
+_store: Optional[tuple] = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """
+    获取进程内共享的本地向量库，目录由环境变量 RAG_VECTOR_INDEX_DIR 配置，
+    向量库重新构建（当前构建目录或 meta.json 修改时间变化）后自动重新加载。
+
+    返回:
+        VectorStore: 本地向量库。
+    """
+    global _store
+    store_dir = resolve_directory(os.getenv("RAG_VECTOR_INDEX_DIR") or DEFAULT_STORE_DIR)
+    version = (store_dir, os.stat(os.path.join(store_dir, "meta.json")).st_mtime_ns)
+    with _store_lock:
+        if _store is None or _store[0] != version:
+            _store = (version, VectorStore(store_dir))
+        return _store[1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 解析命令行参数，指定文档来源和向量库目录
+    parser = argparse.ArgumentParser(description="构建本地向量知识库")
+    parser.add_argument("sources", nargs="+", help="文档文件或目录")
+    parser.add_argument("--output", default=os.getenv("RAG_VECTOR_INDEX_DIR") or DEFAULT_STORE_DIR, help="向量库目录")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="片段的最大字符数")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="向量维度")
+    args = parser.parse_args()
+
+    meta = build_vector_store(args.sources, args.output, args.chunk_size, args.dim)
+    print(f"本地向量库构建完成: {args.output}，片段数={meta['count']}，维度={meta['dim']}")
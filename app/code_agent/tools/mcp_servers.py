@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MCP 工具服务统一加载模块
+并发启动智能体使用的所有 MCP 工具服务，每个服务单独限时
+"""
+
+from app.code_agent.tools import file_tools, powershell_tools, rag_tools, terminal_tools
+from app.code_agent.utils.mcp import load_mcp_servers
+
+
+def get_stdio_servers():
+    """
+    获取智能体使用的所有 MCP 工具服务的启动配置
+
+    Returns:
+        dict: 服务名称 -> create_mcp_stdio_client 的参数
+    """
+    return {
+        file_tools.SERVER_NAME: file_tools.get_file_server(),
+        powershell_tools.SERVER_NAME: powershell_tools.get_powershell_server(),
+        terminal_tools.SERVER_NAME: terminal_tools.get_terminal_server(),
+        rag_tools.SERVER_NAME: rag_tools.get_rag_server(),
+    }
+
+
+async def get_all_stdio_tools():
+    """
+    并发启动所有 MCP 工具服务并加载工具，启动超时或失败的服务返回空列表
+
+    Returns:
+        dict: 服务名称 -> 工具列表
+    """
+    return await load_mcp_servers(get_stdio_servers())
@@ -6,8 +6,34 @@ PowerShell工具获取模块
 负责获取基于stdio的PowerShell工具列表
 """
 
+import os
+
 from app.code_agent.utils.mcp import create_mcp_stdio_client
 
+# MCP 服务名称
+SERVER_NAME = "powershell_tools"
+
+
+def get_powershell_server():
+    """
+    获取PowerShell工具 MCP 服务的启动配置
+
+    Returns:
+        dict: create_mcp_stdio_client 的参数
+    """
+    # 使用动态路径，确保在不同操作系统上都能正确找到文件
+    script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    powershell_tools_path = os.path.join(script_dir, "app", "mcp", "stdio", "powershell_tools.py")
+
+    # 配置MCP客户端参数
+    params = {
+        "command": "python",
+        "args": [
+            powershell_tools_path
+        ]
+    }
+    return {"params": params}
+
 
 async def get_stdio_powershell_tools():
     """
@@ -17,21 +43,8 @@ async def get_stdio_powershell_tools():
         list: 可用的PowerShell工具列表
     """
     try:
-        # 使用动态路径，确保在不同操作系统上都能正确找到文件
-        import os
-        script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        powershell_tools_path = os.path.join(script_dir, "app", "mcp", "stdio", "powershell_tools.py")
-
-        # 配置MCP客户端参数
-        params = {
-            "command": "python",
-            "args": [
-                powershell_tools_path
-            ]
-        }
-
         # 创建MCP客户端并获取工具列表
-        client, tools = await create_mcp_stdio_client("powershell_tools", params)
+        client, tools = await create_mcp_stdio_client(SERVER_NAME, **get_powershell_server())
 
         return tools
     except Exception as e:
@@ -6,8 +6,81 @@ RAG 工具获取函数
 """
 
 import os
+
+from mcp.types import CallToolResult, TextContent
+
+from app.code_agent.rag.turn_memo import TURN_ID_META_KEY, current_turn_id, get_turn_memo, is_memoizable
 from app.code_agent.utils.mcp import create_mcp_stdio_client
 
+# RAG 查询工具名称
+RAG_TOOL_NAME = "query_rag_from_bailian"
+
+# MCP 服务名称
+SERVER_NAME = "rag"
+
+
+async def turn_memo_interceptor(request, handler):
+    """
+    RAG 工具调用拦截器：本轮已检索过的查询直接返回备忘结果，不再发起 MCP 调用；
+    与服务端一样只备忘成功的结果，错误提示和空结果不备忘
+
+    Args:
+        request: 工具调用请求
+        handler: 实际执行工具调用的处理函数
+
+    Returns:
+        CallToolResult: 工具调用结果
+    """
+    if request.name != RAG_TOOL_NAME:
+        return await handler(request)
+
+    turn_id = current_turn_id.get()
+    query = request.args.get("query", "")
+    memo = get_turn_memo()
+
+    cached = memo.get(turn_id, query)
+    if cached is not None:
+        return CallToolResult(content=[TextContent(type="text", text=cached)])
+
+    result = await handler(request)
+    if isinstance(result, CallToolResult) and not result.isError:
+        text = "".join(block.text for block in result.content if isinstance(block, TextContent))
+        if is_memoizable(text):
+            memo.put(turn_id, query, text)
+    return result
+
+
+def turn_meta():
+    """
+    生成 RAG 工具调用的请求元数据，携带当前对话轮次 ID，供服务端的轮次备忘使用
+
+    Returns:
+        dict: 请求元数据，不在对话轮次中时返回 None
+    """
+    turn_id = current_turn_id.get()
+    return {TURN_ID_META_KEY: turn_id} if turn_id else None
+
+
+def get_rag_server():
+    """
+    获取RAG工具 MCP 服务的启动配置，同一轮对话内重复的查询由拦截器直接返回，轮次 ID 随调用元数据传给服务端
+
+    Returns:
+        dict: create_mcp_stdio_client 的参数
+    """
+    # 使用动态路径，确保在不同操作系统上都能正确找到文件
+    script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    rag_tools_path = os.path.join(script_dir, "app", "code_agent", "mcp", "rag.py")
+
+    # 配置MCP客户端参数
+    params = {
+        "command": "python",
+        "args": [
+            rag_tools_path
+        ]
+    }
+    return {"params": params, "tool_interceptors": [turn_memo_interceptor], "call_meta": turn_meta}
+
 
 async def get_stdio_rag_tools():
     """
@@ -17,20 +90,8 @@ async def get_stdio_rag_tools():
         list: 可用的RAG工具列表
     """
     try:
-        # 使用动态路径，确保在不同操作系统上都能正确找到文件
-        script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        rag_tools_path = os.path.join(script_dir, "app", "code_agent", "mcp", "rag.py")
-
-        # 配置MCP客户端参数
-        params = {
-            "command": "python",
-            "args": [
-                rag_tools_path
-            ]
-        }
-
         # 创建MCP客户端并获取工具列表
-        client, tools = await create_mcp_stdio_client("rag", params)
+        client, tools = await create_mcp_stdio_client(SERVER_NAME, **get_rag_server())
 
         return tools
     except Exception as e:
@@ -5,8 +5,33 @@
 终端工具获取模块，用于获取通过MCP协议连接的终端控制工具
 """
 
+import os
+
 from app.code_agent.utils.mcp import create_mcp_stdio_client
 
+# MCP 服务名称
+SERVER_NAME = "terminal"
+
+
+def get_terminal_server():
+    """
+    获取终端工具 MCP 服务的启动配置
+
+    Returns:
+        dict: create_mcp_stdio_client 的参数
+    """
+    # 使用动态路径，确保在不同操作系统上都能正确找到文件
+    script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    terminal_tools_path = os.path.join(script_dir, "app", "mcp", "stdio", "terminal_tools.py")
+
+    params = {
+        "command": "python",
+        "args": [
+            terminal_tools_path,
+        ],
+    }
+    return {"params": params}
+
 
 async def get_stdio_terminal_tools():
     """
@@ -16,19 +41,7 @@ async def get_stdio_terminal_tools():
         list: 终端控制工具列表
     """
     try:
-        # 使用动态路径，确保在不同操作系统上都能正确找到文件
-        import os
-        script_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        terminal_tools_path = os.path.join(script_dir, "app", "mcp", "stdio", "terminal_tools.py")
-
-        params = {
-            "command": "python",
-            "args": [
-                terminal_tools_path,
-            ],
-        }
-
-        client, tools = await create_mcp_stdio_client("terminal", params)
+        client, tools = await create_mcp_stdio_client(SERVER_NAME, **get_terminal_server())
 
         return tools
     except Exception as e:
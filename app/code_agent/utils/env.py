@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+环境变量读取公共方法
+"""
+
+import os
+
+
+def get_env_number(name: str, default):
+    """
+    读取数值型环境变量，按默认值的类型转换，格式错误时使用默认值
+
+    Args:
+        name: 环境变量名
+        default: 默认值（int 或 float）
+
+    Returns:
+        与默认值类型相同的数值
+    """
+    try:
+        return type(default)(os.getenv(name, default))
+    except ValueError:
+        return default
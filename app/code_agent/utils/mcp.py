@@ -4,28 +4,325 @@
 """
 MCP (Multi-Component Protocol) 工具公共方法
 提供 MCP 客 户端创建和管理功能
+
+每个 MCP 服务只启动一次并保持长连接会话，所有工具调用复用该会话，
+工具调用的开销是一次进程间通信而不是启动一个新的 Python 解释器；
+程序退出前调用 close_mcp_sessions 关闭所有会话及服务进程；
+多个服务通过 load_mcp_servers 并发启动，每个服务单独限时，慢服务或失败的服务不会拖慢其他服务；
+工具定义缓存在磁盘上，命中缓存时直接构建工具，服务在后台启动并校验工具定义
 """
 
-from typing import Any, Dict, Tuple
+import asyncio
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+from langchain_mcp_adapters.sessions import create_session
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, Tool
+
+from app.code_agent.utils.env import get_env_number
+from app.code_agent.utils.tool_schemas import dump_tools, get_tool_schema_cache, schema_key
+
+# 默认的单个服务启动超时时间（秒）
+DEFAULT_STARTUP_TIMEOUT = 30.0
+
+# 已打开的长连接会话：服务名称 -> 会话
+_sessions: Dict[str, "PersistentMCPSession"] = {}
+_sessions_locks = weakref.WeakKeyDictionary()
+# 后台校验工具定义的任务
+_schema_checks = set()
+
+
+class PersistentMCPSession:
+    """
+    MCP 长连接会话
+
+    会话由一个后台任务持有：该任务进入 stdio 连接上下文并初始化会话后一直等待，直到 close() 时退出上下文，
+    保证连接上下文在同一个任务中进入和退出。服务进程退出后关闭旧会话并重新连接，
+    请求未发出或请求幂等时重试一次，已发出的工具调用不重试。
+    实现了 list_tools 和 call_tool，可直接作为 load_mcp_tools 的 session 使用。
+    """
+
+    def __init__(self, name: str, connection: Dict[str, Any],
+                 call_meta: Optional[Callable[[], Optional[Dict[str, Any]]]] = None):
+        """
+        Args:
+            name: 服务名称
+            connection: 连接配置（transport、command、args 等）
+            call_meta: 每次工具调用时生成请求元数据（_meta）的函数，可选
+        """
+        self.name = name
+        self.connection = connection
+        self.call_meta = call_meta
+        self._session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._error: Optional[BaseException] = None
+        self._failed: Optional[BaseException] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """
+        会话是否处于可用状态
+        """
+        return self._session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self):
+        try:
+            async with create_session(self.connection) as session:
+                await session.initialize()
+                self._session = session
+                self._ready.set()
+                await self._closing.wait()
+        except BaseException as e:
+            self._error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self._session = None
+            self._ready.set()
+
+    async def open(self) -> ClientSession:
+        """
+        打开会话，已打开时直接返回
+
+        Returns:
+            ClientSession: 已初始化的 MCP 会话
+
+        Raises:
+            RuntimeError: 服务启动或初始化失败，或服务已被停用
+            asyncio.TimeoutError: 服务启动超过 get_startup_timeout 配置的时间
+        """
+        async with self._lock:
+            if self._failed is not None:
+                raise RuntimeError(f"MCP 服务 {self.name} 已停用: {self._failed!r}") from self._failed
+            if self.is_open:
+                return self._session
+            self._error = None
+            self._ready = asyncio.Event()
+            self._closing = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name=f"mcp-session-{self.name}")
+            timeout = get_startup_timeout(self.name)
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout if timeout > 0 else None)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                # 启动超时或等待时被取消，同时取消启动任务，由其退出连接上下文并结束服务进程
+                self._task.cancel()
+                raise
+            if self._session is None:
+                raise RuntimeError(f"MCP 服务 {self.name} 启动失败: {self._error!r}") from self._error
+            return self._session
+
+    async def _close(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        self._closing.set()
+        try:
+            await task
+        except asyncio.CancelledError:
+            # 启动超时时任务已被取消，属于正常关闭
+            if not task.cancelled():
+                raise
+        except BaseException as e:
+            print(f"关闭 MCP 服务 {self.name} 时出错: {type(e).__name__} {e}")
+
+    async def close(self):
+        """
+        关闭会话并等待服务进程退出
+        """
+        async with self._lock:
+            await self._close()
+
+    async def fail(self, error: BaseException):
+        """
+        关闭会话并停用该服务，之后的调用立即失败而不是再次等待服务启动
+
+        Args:
+            error: 停用原因
+        """
+        async with self._lock:
+            self._failed = error
+            await self._close()
+
+    async def _request(self, send: Callable[[ClientSession], Awaitable[Any]], idempotent: bool = True):
+        """
+        通过会话发送请求；连接已断开（服务进程退出）时关闭旧会话，下一次请求重新连接
+
+        请求未能发出（写入已关闭的连接）时重新连接后重试一次；请求已发出后连接断开时，
+        只有幂等的请求（如 list_tools）才重试，工具调用直接抛出异常，避免服务端已执行的工具再执行一次。
+        """
+        session = await self.open()
+        try:
+            return await send(session)
+        except Exception as e:
+            if not _is_disconnected(e):
+                raise
+            async with self._lock:
+                # 并发的请求可能已经完成了重新连接
+                if self._session is session:
+                    await self._close()
+            if not (idempotent or _is_unsent(e)):
+                print(f"MCP 服务 {self.name} 在请求执行期间断开连接，下一次调用时重新连接: {type(e).__name__} {e}")
+                raise
+            print(f"MCP 服务 {self.name} 连接已断开，重新连接后重试: {type(e).__name__} {e}")
+        session = await self.open()
+        return await send(session)
+
+    async def list_tools(self, cursor: Optional[str] = None, **kwargs):
+        """
+        列出服务提供的工具
+        """
+        return await self._request(lambda session: session.list_tools(cursor, **kwargs))
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, *args, **kwargs):
+        """
+        通过长连接会话调用工具，配置了 call_meta 时附加请求元数据；工具调用不是幂等的，已发出后断开连接时不重试
+        """
+        if self.call_meta is not None and kwargs.get("meta") is None:
+            kwargs["meta"] = self.call_meta() or None
+        return await self._request(
+            lambda session: session.call_tool(name, arguments, *args, **kwargs), idempotent=False)
+
+
+def _is_disconnected(error: BaseException) -> bool:
+    """
+    判断请求失败是否因为与服务的连接已断开
+    """
+    if isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)):
+        return True
+    return isinstance(error, McpError) and error.error.code == CONNECTION_CLOSED
+
+
+def _is_unsent(error: BaseException) -> bool:
+    """
+    判断请求是否因为连接在发送前已关闭而未发出，此时服务端没有收到请求，可以安全重试
+    """
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError))
+
+
+def _get_sessions_lock() -> asyncio.Lock:
+    """
+    获取当前事件循环的会话注册表锁，每个事件循环各自一个
+    """
+    loop = asyncio.get_running_loop()
+    lock = _sessions_locks.get(loop)
+    if lock is None:
+        lock = asyncio.Lock()
+        _sessions_locks[loop] = lock
+    return lock
+
+
+async def get_mcp_session(name: str, connection: Dict[str, Any],
+                          call_meta: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+                          connect: bool = True) -> PersistentMCPSession:
+    """
+    获取指定服务的长连接会话，同名服务只启动一次
+
+    Args:
+        name: 服务名称
+        connection: 连接配置
+        call_meta: 每次工具调用时生成请求元数据的函数，可选
+        connect: 是否立即打开会话，为 False 时在第一次调用时打开
+
+    Returns:
+        PersistentMCPSession: 会话
+    """
+    async with _get_sessions_lock():
+        session = _sessions.get(name)
+        if session is None:
+            session = PersistentMCPSession(name, connection, call_meta)
+            _sessions[name] = session
+    if connect:
+        await session.open()
+    return session
+
 
-from langchain_mcp_adapters.client import MultiServerMCPClient
+async def close_mcp_session(name: str):
+    """
+    关闭指定服务的长连接会话，下次获取时重新启动
+
+    Args:
+        name: 服务名称
+    """
+    async with _get_sessions_lock():
+        session = _sessions.pop(name, None)
+    if session is not None:
+        await session.close()
+
+
+async def close_mcp_sessions():
+    """
+    关闭所有长连接会话及对应的服务进程
+    """
+    for task in list(_schema_checks):
+        task.cancel()
+    await asyncio.gather(*_schema_checks, return_exceptions=True)
+    async with _get_sessions_lock():
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        await session.close()
+
+
+async def _list_all_tools(session: PersistentMCPSession) -> List[Tool]:
+    """
+    分页获取服务提供的全部工具定义
+    """
+    tools: List[Tool] = []
+    cursor = None
+    while True:
+        result = await session.list_tools(cursor)
+        tools.extend(result.tools or [])
+        cursor = result.nextCursor
+        if not cursor:
+            return tools
+
+
+async def _check_tool_schemas(session: PersistentMCPSession, key: str, cached: List[Tool]):
+    """
+    后台启动服务（受启动超时限制）并校验缓存的工具定义，定义变化时更新缓存，下次启动生效；
+    服务启动失败时停用该服务
+    """
+    try:
+        tools = await _list_all_tools(session)
+    except Exception as e:
+        # 服务无法启动或超时，停用该服务，缓存构建的工具调用时立即失败
+        print(f"警告：MCP 服务 {session.name} 启动失败，已停用 - {type(e).__name__} {str(e)}")
+        await session.fail(e)
+        return
+    if dump_tools(tools) != dump_tools(cached):
+        get_tool_schema_cache().put(session.name, key, tools)
+        print(f"警告：MCP 服务 {session.name} 的工具定义已变化，已更新缓存，重新启动后生效")
 
 
 async def create_mcp_stdio_client(
-    name: str, params: Dict[str, Any] = None
-) -> Tuple[MultiServerMCPClient, list]:
+    name: str, params: Dict[str, Any] = None, tool_interceptors: List[Any] = None,
+    call_meta: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+) -> Tuple[PersistentMCPSession, list]:
     """
-    创建基于标准输入输出的 MCP 客户端
+    创建基于标准输入输出的 MCP 客户端，服务进程只启动一次，所有工具调用复用同一个会话
+
+    工具定义命中磁盘缓存时直接构建工具并立即返回，服务在后台启动并校验工具定义；
+    未命中时启动服务获取工具定义并写入缓存。
 
     Args:
         name: 客户端名称
         params: 额外配置参数
+        tool_interceptors: 工具调用拦截器列表
+        call_meta: 每次工具调用时生成请求元数据（_meta）的函数，可选
 
     Returns:
-        Tuple[MultiServerMCPClient, list]: MCP 客户端实例和可用工具列表
+        Tuple[PersistentMCPSession, list]: MCP 长连接会话和可用工具列表
 
     Example:
-        client, tools = await create_mcp_stdio_client("test_client")
+        session, tools = await create_mcp_stdio_client("test_client")
     """
     # 初始化默认参数
     params = params or {}
@@ -33,10 +330,81 @@ async def create_mcp_stdio_client(
     # 构建配置，移除name参数，因为_create_stdio_session不接受它
     config = {"transport": "stdio", **params}
 
-    # 创建客户端实例
-    client = MultiServerMCPClient({name: config})
+    # 查找缓存的工具定义
+    cache = get_tool_schema_cache()
+    key = schema_key(config) if cache is not None else None
+    cached = cache.get(name, key) if cache is not None else None
+
+    # 打开（或复用）长连接会话，命中缓存时延迟到后台校验或第一次工具调用时再打开
+    session = await get_mcp_session(name, config, call_meta, connect=cached is None)
 
-    # 获取工具列表
-    tools = await client.get_tools()
+    if cached is None:
+        mcp_tools = await _list_all_tools(session)
+        if cache is not None:
+            cache.put(name, key, mcp_tools)
+    else:
+        mcp_tools = cached
+        task = asyncio.create_task(_check_tool_schemas(session, key, cached), name=f"mcp-schema-check-{name}")
+        _schema_checks.add(task)
+        task.add_done_callback(_schema_checks.discard)
+
+    # 构建工具，工具调用通过长连接会话执行
+    tools = [
+        convert_mcp_tool_to_langchain_tool(session, tool, tool_interceptors=tool_interceptors, server_name=name)
+        for tool in mcp_tools
+    ]
+
+    return session, tools
+
+
+def get_startup_timeout(name: str) -> float:
+    """
+    获取服务启动超时时间，优先使用 MCP_STARTUP_TIMEOUT_<服务名称大写>，其次使用 MCP_STARTUP_TIMEOUT
+
+    Args:
+        name: 服务名称
+
+    Returns:
+        float: 超时时间（秒），小于等于 0 表示不限时
+    """
+    timeout = get_env_number("MCP_STARTUP_TIMEOUT", DEFAULT_STARTUP_TIMEOUT)
+    return get_env_number(f"MCP_STARTUP_TIMEOUT_{name.upper()}", timeout)
+
+
+async def load_mcp_servers(servers: Dict[str, Dict[str, Any]]) -> Dict[str, list]:
+    """
+    并发启动多个 MCP 服务并加载工具，每个服务单独限时
+
+    启动超时或失败的服务会被关闭并返回空工具列表，不影响其他服务；
+    总耗时约为最慢的一个服务（或其超时时间），而不是所有服务启动时间之和。
+
+    Args:
+        servers: 服务名称 -> create_mcp_stdio_client 的参数（params、tool_interceptors、call_meta），
+                 可额外指定 timeout 覆盖 get_startup_timeout 的配置
+
+    Returns:
+        Dict[str, list]: 服务名称 -> 工具列表，顺序与 servers 一致
+
+    Example:
+        tools = await load_mcp_servers({"file_tools": {"params": {"command": "python", "args": [path]}}})
+    """
+    async def load(name: str, spec: Dict[str, Any]) -> list:
+        spec = dict(spec)
+        timeout = spec.pop("timeout", None)
+        if timeout is None:
+            timeout = get_startup_timeout(name)
+        started = time.perf_counter()
+        try:
+            _, tools = await asyncio.wait_for(create_mcp_stdio_client(name, **spec), timeout if timeout > 0 else None)
+        except asyncio.TimeoutError:
+            print(f"警告：MCP 服务 {name} 启动超时（{timeout:.0f}s），已跳过")
+        except Exception as e:
+            print(f"警告：加载 MCP 服务 {name} 的工具失败 - {str(e)}")
+        else:
+            print(f"MCP 服务 {name} 已就绪，加载 {len(tools)} 个工具，耗时 {time.perf_counter() - started:.2f}s")
+            return tools
+        await close_mcp_session(name)
+        return []
 
-    return client, tools
+    results = await asyncio.gather(*[load(name, spec) for name, spec in servers.items()])
+    return dict(zip(servers, results))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MCP 工具定义磁盘缓存
+按服务记录 list_tools 返回的工具定义，键为启动命令、参数及参数中脚本文件内容的哈希；
+智能体启动时直接用缓存的定义构建工具，不必为获取几乎不变的工具定义而等待每个服务完成握手
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from mcp.types import Tool
+
+# 默认缓存文件路径
+DEFAULT_CACHE_PATH = str(Path(__file__).parent.parent.parent.parent / ".temp" / "mcp_tool_schemas.json")
+
+
+def schema_key(connection: Dict[str, Any]) -> str:
+    """
+    计算服务的工具定义缓存键，脚本内容或启动参数变化后缓存自动失效
+
+    Args:
+        connection: 连接配置（command、args 等）
+
+    Returns:
+        str: 十六进制 SHA-256 哈希
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([connection.get("command"), connection.get("args") or []]).encode("utf-8"))
+    for arg in connection.get("args") or []:
+        if isinstance(arg, str) and os.path.isfile(arg):
+            with open(arg, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def dump_tools(tools: List[Tool]) -> List[Dict[str, Any]]:
+    """
+    将工具定义转换为可写入 JSON 的字典列表
+    """
+    return [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools]
+
+
+class ToolSchemaCache:
+    """
+    MCP 工具定义缓存
+
+    所有服务的工具定义保存在同一个 JSON 文件中：服务名称 -> {"key": 缓存键, "tools": 工具定义列表}，
+    写入时先写临时文件再替换，文件损坏或格式不符时视为空缓存。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 缓存文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self._entries = entries
+        except (OSError, ValueError):
+            pass
+
+    def get(self, name: str, key: str) -> Optional[List[Tool]]:
+        """
+        获取服务的工具定义
+
+        Args:
+            name: 服务名称
+            key: 缓存键
+
+        Returns:
+            List[Tool]: 工具定义，未缓存、缓存键不一致或定义无法解析时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if not entry or entry.get("key") != key:
+            return None
+        try:
+            return [Tool.model_validate(tool) for tool in entry["tools"]]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, name: str, key: str, tools: List[Tool]):
+        """
+        保存服务的工具定义并写入磁盘
+
+        Args:
+            name: 服务名称
+            key: 缓存键
+            tools: 工具定义
+        """
+        with self._lock:
+            self._entries[name] = {"key": key, "tools": dump_tools(tools)}
+            cache_dir = os.path.dirname(self.path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+_cache: Optional[ToolSchemaCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_tool_schema_cache() -> Optional[ToolSchemaCache]:
+    """
+    获取进程内共享的工具定义缓存，路径来自环境变量 MCP_SCHEMA_CACHE
+
+    Returns:
+        ToolSchemaCache: 工具定义缓存，MCP_SCHEMA_CACHE 为空字符串时返回 None
+    """
+    global _cache
+    path = os.getenv("MCP_SCHEMA_CACHE", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    if _cache is None or _cache.path != path:
+        with _cache_lock:
+            if _cache is None or _cache.path != path:
+                _cache = ToolSchemaCache(path)
+    return _cache
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试检索熔断器及过期结果兜底
+"""
+
+import asyncio
+import time
+
+import pytest
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError
+from app.code_agent.rag.cache import STALE_NOTICE, RetrievalCache, is_stale, mark_stale_text
+from app.code_agent.rag.retrieval import acached_retrieve_index, aretrieve_index
+
+
+def make_response(text):
+    """构造一个检索响应"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9}]}},
+    })
+
+
+class FlakyClient:
+    """可切换成功或失败的假客户端"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def retrieve_with_options(self, workspace_id, request, headers, runtime):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("service unavailable")
+        return make_response(f"结果{self.calls}")
+
+
+def test_breaker_state_machine():
+    """测试连续失败、慢调用熔断及半开探测"""
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_ms=100, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_success(10)
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record_failure()
+    breaker.record_success(500)
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success(10)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["opens"] == 2
+
+
+def test_open_breaker_serves_stale(monkeypatch):
+    """测试熔断期间不发出请求，并返回标记为过期的最后一次成功结果"""
+    client = FlakyClient()
+    cache = RetrievalCache(ttl=0.01, stale_ttl=60)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    monkeypatch.setenv("RAG_SIMILAR_CACHE_ENABLED", "0")
+    monkeypatch.setattr("app.code_agent.rag.retrieval.get_breaker", lambda: breaker)
+
+    async def run():
+        fresh = await acached_retrieve_index(client, "ws", "idx", "终端规范", cache=cache)
+        assert not is_stale(fresh)
+        assert mark_stale_text(fresh, "知识") == "知识"
+        await asyncio.sleep(0.02)
+
+        client.fail = True
+        with pytest.raises(ConnectionError):
+            await aretrieve_index(client, "ws", "idx", "终端规范")
+        calls = client.calls
+        with pytest.raises(CircuitOpenError):
+            await acached_retrieve_index(client, "ws", "idx", "其他查询", cache=cache)
+        stale = await acached_retrieve_index(client, "ws", "idx", "终端规范", cache=cache)
+        assert client.calls == calls
+        return stale
+
+    stale = asyncio.run(run())
+    assert is_stale(stale)
+    assert mark_stale_text(stale, "知识") == f"{STALE_NOTICE}\n知识"
+    assert stale.body.data.nodes[0].text == "结果1"
+    assert cache.stats()["stale_hits"] == 1
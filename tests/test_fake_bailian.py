@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地模拟百炼服务及基准测试
+"""
+
+import asyncio
+
+from app.code_agent.rag.benchmark import BENCHMARK_ENV, FAKE_CREDENTIALS, arun_load, configure_env, run_benchmark
+from app.code_agent.rag.client_pool import get_client
+from app.code_agent.rag.fake_bailian import FakeBailianServer, FakeProfile
+from app.code_agent.rag.retrieval import retrieve_index
+
+
+def test_sdk_retrieve_through_fake_server(monkeypatch):
+    """测试百炼 SDK 经由模拟服务检索，结果确定且按配置返回节点"""
+    monkeypatch.setenv("BAILIAN_PROTOCOL", "http")
+    with FakeBailianServer(FakeProfile(latency_ms=0, jitter_ms=0, nodes=3, node_chars=50)) as server:
+        client = get_client("fake-ak", "fake-sk", "ws", endpoint=server.endpoint)
+        first = retrieve_index(client, "ws", "idx", "终端规范")
+        second = retrieve_index(client, "ws", "idx", "终端规范")
+        assert server.state.requests == {"retrieve": 2}
+
+    nodes = first.body.data.nodes
+    assert len(nodes) == 3
+    assert nodes[0].text.startswith("终端规范")
+    assert nodes[0].score > nodes[1].score
+    assert [node.text for node in nodes] == [node.text for node in second.body.data.nodes]
+
+
+def test_load_percentiles_and_errors(monkeypatch):
+    """测试负载统计：错误率按类型计数，延迟分位数覆盖所有请求"""
+    # configure_env 直接修改环境变量，先登记到 monkeypatch 以便测试结束后恢复
+    for name in [*BENCHMARK_ENV, *FAKE_CREDENTIALS, "BAILIAN_ENDPOINT"]:
+        monkeypatch.delenv(name, raising=False)
+    with FakeBailianServer(FakeProfile(latency_ms=1, jitter_ms=1, error_rate=0.5, seed=7)) as server:
+        configure_env(server.endpoint)
+        client = get_client("fake-ak", "fake-sk", "ws")
+        stats = asyncio.run(arun_load(
+            lambda query: asyncio.to_thread(retrieve_index, client, "ws", "idx", query),
+            [f"查询 {i}" for i in range(40)], concurrency=4, warmup=False,
+        ))
+
+    assert stats["requests"] == stats["latency_ms"]["count"] == 40
+    assert 0 < stats["errors"] < 40
+    assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"] <= stats["latency_ms"]["max"]
+
+
+def test_ingest_benchmark_waits_for_index_jobs(monkeypatch):
+    """测试导入场景跟踪追加导入任务直到完成，任务状态接口被调用"""
+    for name in [*BENCHMARK_ENV, *FAKE_CREDENTIALS, "BAILIAN_ENDPOINT"]:
+        monkeypatch.delenv(name, raising=False)
+    profile = FakeProfile(latency_ms=0, jitter_ms=0, parse_polls=1, job_polls=2)
+    report = run_benchmark(profile, scenarios=["ingest"], files=3)
+
+    stats = report["ingest"]
+    assert stats["errors"] == 0
+    assert stats["latency_ms"]["count"] == 3
+    assert stats["index_jobs"]["completed"] == stats["index_jobs"]["tracked"] >= 1
+    assert report["server_requests"]["job_status"] >= 2
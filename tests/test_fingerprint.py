@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文件指纹缓存
+"""
+
+import hashlib
+import os
+
+from app.code_agent.rag import fingerprint
+from app.code_agent.rag.fingerprint import FingerprintCache, file_fingerprints, hash_file
+
+
+def test_hash_file_matches_hashlib(tmp_path, monkeypatch):
+    """测试分块读取和 mmap 两种方式的哈希结果"""
+    content = os.urandom(3 * 1024 * 1024 + 17)
+    path = tmp_path / "data.bin"
+    path.write_bytes(content)
+    expected = hashlib.md5(content).hexdigest()
+
+    assert hash_file(str(path), buffer_size=4096) == expected
+    monkeypatch.setattr(fingerprint, "MMAP_THRESHOLD", 1024)
+    assert hash_file(str(path)) == expected
+
+
+def test_cache_skips_unchanged_files(tmp_path, monkeypatch):
+    """测试未变化的文件命中缓存，修改后的文件重新计算，重启后仍可命中"""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"doc{i}.md"
+        path.write_text(f"内容 {i}", encoding="utf-8")
+        paths.append(str(path))
+    db_path = str(tmp_path / "fingerprints.sqlite3")
+
+    cache = FingerprintCache(db_path)
+    first = file_fingerprints(paths, cache, workers=2)
+    assert first[paths[0]] == ("doc0.md", hashlib.md5("内容 0".encode("utf-8")).hexdigest(), len("内容 0".encode("utf-8")))
+
+    calls = []
+    monkeypatch.setattr(fingerprint, "hash_file", lambda path: calls.append(path) or "changed")
+    reopened = FingerprintCache(db_path)
+    assert file_fingerprints(paths, reopened) == first
+    assert calls == []
+
+    os.utime(paths[1], ns=(0, 0))
+    assert file_fingerprints(paths, reopened)[paths[1]][1] == "changed"
+    assert calls == [paths[1]]
+    assert reopened.stats()["hits"] == 7
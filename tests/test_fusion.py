@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多知识库并发检索及倒数排名融合
+"""
+
+import asyncio
+
+import pytest
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag import fusion
+from app.code_agent.rag.fusion import amulti_index_retrieve, reciprocal_rank_fusion
+
+
+def make_response(*texts):
+    """构造一个检索响应"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9} for text in texts]}},
+    })
+
+
+def test_reciprocal_rank_fusion():
+    """测试融合得分排序、相同文本去重及来源知识库记录"""
+    ranked_lists = {
+        "a": make_response("共同", "只在a").body.data.nodes,
+        "b": make_response("只在b", "共同").body.data.nodes,
+    }
+    nodes = reciprocal_rank_fusion(ranked_lists, top_k=5, k=60)
+    assert [node["Text"] for node in nodes] == ["共同", "只在b", "只在a"]
+    assert nodes[0]["Score"] == pytest.approx(1 / 61 + 1 / 62)
+    assert nodes[0]["Metadata"]["index_id"] == "a"
+    assert nodes[1]["Metadata"]["index_id"] == "b"
+    assert len(reciprocal_rank_fusion(ranked_lists, top_k=1)) == 1
+
+
+def test_slow_index_does_not_block_others(monkeypatch):
+    """测试单个知识库超时只丢弃该知识库的结果"""
+    async def fake_retrieve(client, workspace_id, index_id, query):
+        if index_id == "slow":
+            await asyncio.sleep(1)
+        return make_response(f"{index_id} 结果")
+
+    monkeypatch.setattr(fusion, "acached_retrieve_index", fake_retrieve)
+    rag = asyncio.run(amulti_index_retrieve(None, "ws", ["fast", "slow", "other"], "查询", timeout=0.05, top_k=5))
+    assert sorted(node.text for node in rag.body.data.nodes) == ["fast 结果", "other 结果"]
+
+
+def test_all_indices_failed(monkeypatch):
+    """测试全部失败时返回第一个原始响应，没有响应时抛出第一个异常"""
+    failed = bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200, "body": {"Success": False, "Message": "index not found"},
+    })
+
+    async def fake_failed(client, workspace_id, index_id, query):
+        if index_id == "error":
+            raise ConnectionError("service unavailable")
+        return failed
+
+    monkeypatch.setattr(fusion, "acached_retrieve_index", fake_failed)
+    rag = asyncio.run(amulti_index_retrieve(None, "ws", ["error", "missing"], "查询", timeout=1, top_k=5))
+    assert rag is failed
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(amulti_index_retrieve(None, "ws", ["error", "error"], "查询", timeout=1, top_k=5))
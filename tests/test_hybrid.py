@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试对冲式混合检索
+"""
+
+import asyncio
+
+import pytest
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag import hybrid
+from app.code_agent.rag.telemetry import Telemetry
+
+
+def make_response(*texts):
+    """构造一个检索响应"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9} for text in texts]}},
+    })
+
+
+class FakeLocalIndex:
+    """假的本地索引"""
+
+    def __init__(self, *texts):
+        self.texts = texts
+
+    def retrieve(self, query):
+        return make_response(*self.texts)
+
+
+def run_hybrid(monkeypatch, remote_delay, local_index, deadline=0.2):
+    """以假的远程检索和本地索引运行混合检索，返回节点文本及遥测计数器"""
+    telemetry = Telemetry()
+    monkeypatch.setattr(hybrid, "get_telemetry", lambda: telemetry)
+
+    async def fake_remote(client, workspace_id, index_ids, query):
+        await asyncio.sleep(remote_delay)
+        return make_response("远程结果", "共同结果")
+
+    def fake_local_index():
+        if isinstance(local_index, Exception):
+            raise local_index
+        return local_index
+
+    monkeypatch.setattr(hybrid, "aretrieve_indices", fake_remote)
+    monkeypatch.setattr(hybrid, "get_local_index", fake_local_index)
+    rag = asyncio.run(hybrid.ahybrid_retrieve(None, "ws", "idx", "查询", deadline=deadline))
+    return [node.text for node in rag.body.data.nodes], telemetry.snapshot()["counters"]
+
+
+def test_remote_within_deadline_merges_local(monkeypatch):
+    """测试两者都按时返回时合并结果，远程结果在前且去重"""
+    texts, counters = run_hybrid(monkeypatch, 0, FakeLocalIndex("共同结果", "本地结果"))
+    assert texts == ["远程结果", "共同结果", "本地结果"]
+    assert counters == {"hybrid.win.merged": 1}
+
+
+def test_remote_late_falls_back_to_local(monkeypatch):
+    """测试远程超过截止时间时回退到本地结果"""
+    texts, counters = run_hybrid(monkeypatch, 1, FakeLocalIndex("本地结果"), deadline=0.05)
+    assert texts == ["本地结果"]
+    assert counters == {"hybrid.win.local": 1}
+
+
+def test_local_index_missing(monkeypatch):
+    """测试本地索引不存在时等待远程结果，远程也不可用时抛出本地的异常"""
+    texts, counters = run_hybrid(monkeypatch, 0.1, FileNotFoundError("meta.json"), deadline=0.05)
+    assert texts == ["远程结果", "共同结果"]
+    assert counters == {"hybrid.win.remote": 1}
+
+    async def failing_remote(client, workspace_id, index_ids, query):
+        raise ConnectionError("service unavailable")
+
+    monkeypatch.setattr(hybrid, "aretrieve_indices", failing_remote)
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(hybrid.ahybrid_retrieve(None, "ws", "idx", "查询", deadline=0.05))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试索引任务跟踪
+"""
+
+import asyncio
+import os
+
+import pytest
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+# rag.rag 在导入时校验配置
+for _name in ("accessKeyId", "accessKeySecret", "workspace_id", "knowledge_base_id"):
+    os.environ.setdefault(_name, "test")
+
+from app.code_agent.rag.jobs import IndexJobError, IndexJobTracker  # noqa: E402
+
+
+class FakeJobClient:
+    """模拟索引任务状态查询：job-ok 轮询三次后完成，job-bad 直接失败"""
+
+    def __init__(self):
+        self.polls = {}
+
+    def get_index_job_status_with_options(self, workspace_id, request, headers, runtime):
+        count = self.polls[request.job_id] = self.polls.get(request.job_id, 0) + 1
+        if request.job_id == "job-bad":
+            status = "FAILED"
+        elif count == 2:
+            raise ConnectionError("临时网络错误")
+        else:
+            status = "COMPLETED" if count >= 3 else "RUNNING"
+        return bailian_20231229_models.GetIndexJobStatusResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {
+                "JobId": request.job_id,
+                "Status": status,
+                "Documents": [{"DocId": "d1"}, {"DocId": "d2"}],
+            }},
+        })
+
+
+def test_tracker_resolves_futures():
+    """测试任务完成、失败、重复跟踪及吞吐量统计"""
+    client = FakeJobClient()
+
+    async def run():
+        tracker = IndexJobTracker(client, "ws", concurrency=2, initial_interval=0.01, max_interval=0.02)
+        ok = tracker.track("idx", "job-ok")
+        assert tracker.track("idx", "job-ok") is ok
+        bad = tracker.track("idx", "job-bad")
+
+        result = await ok
+        assert result["status"] == "COMPLETED"
+        assert result["documents"] == 2
+        with pytest.raises(IndexJobError):
+            await bad
+        return tracker.stats()
+
+    stats = asyncio.run(run())
+    assert client.polls["job-ok"] == 3
+    assert (stats["tracked"], stats["completed"], stats["failed"], stats["pending"]) == (2, 1, 1, 0)
+    assert stats["documents"] == 2
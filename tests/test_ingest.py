@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试知识库批量导入流水线
+"""
+
+import asyncio
+import json
+import os
+import threading
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+# rag.rag 在导入时校验配置
+for _name in ("accessKeyId", "accessKeySecret", "workspace_id", "knowledge_base_id"):
+    os.environ.setdefault(_name, "test")
+
+from app.code_agent.rag.ingest import IngestPipeline, iter_ingest_files  # noqa: E402
+from app.code_agent.rag.sync import sync_knowledge_base  # noqa: E402
+
+
+class FakeBailianClient:
+    """模拟百炼导入相关接口，记录调用并支持注入失败"""
+
+    def __init__(self, fail_lease_times=0, parse_polls=1, fail_add_times=0, fail_jobs=()):
+        self.lock = threading.Lock()
+        self.fail_jobs = set(fail_jobs)
+        self.fail_lease_times = fail_lease_times
+        self.fail_add_times = fail_add_times
+        self.add_calls = 0
+        self.parse_polls = parse_polls
+        self.polls = {}
+        self.indexed = []
+        self.jobs = []
+        self.deleted = []
+        self.uploads = 0
+
+    def apply_file_upload_lease_with_options(self, category_id, workspace_id, request, headers, runtime):
+        with self.lock:
+            if self.fail_lease_times > 0:
+                self.fail_lease_times -= 1
+                raise ConnectionError("lease 连接失败")
+        return bailian_20231229_models.ApplyFileUploadLeaseResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {
+                "FileUploadLeaseId": f"lease-{request.file_name}",
+                "Param": {"Url": f"http://fake/{request.file_name}", "Headers": {}},
+            }},
+        })
+
+    def next_upload(self):
+        with self.lock:
+            self.uploads += 1
+            return self.uploads
+
+    def add_file_with_options(self, workspace_id, request, headers, runtime):
+        with self.lock:
+            self.add_calls += 1
+            if self.fail_add_times > 0:
+                self.fail_add_times -= 1
+                raise TimeoutError("add 读取超时")
+        file_id = f"{request.lease_id.replace('lease-', 'file-')}-{self.next_upload()}"
+        return bailian_20231229_models.AddFileResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"FileId": file_id}},
+        })
+
+    def describe_file_with_options(self, workspace_id, file_id, headers, runtime):
+        with self.lock:
+            self.polls[file_id] = self.polls.get(file_id, 0) + 1
+            polls = self.polls[file_id]
+        if "broken" in file_id:
+            status = "PARSE_FAILED"
+        else:
+            status = "PARSE_SUCCESS" if polls >= self.parse_polls else "PARSING"
+        return bailian_20231229_models.DescribeFileResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"FileId": file_id, "Status": status}},
+        })
+
+    def submit_index_add_documents_job_with_options(self, workspace_id, request, headers, runtime):
+        with self.lock:
+            self.indexed.extend(request.document_ids)
+            self.jobs.append(list(request.document_ids))
+        return bailian_20231229_models.SubmitIndexAddDocumentsJobResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"Id": f"job-{len(self.jobs)}"}},
+        })
+
+    def get_index_job_status_with_options(self, workspace_id, request, headers, runtime):
+        status = "FAILED" if request.job_id in self.fail_jobs else "COMPLETED"
+        return bailian_20231229_models.GetIndexJobStatusResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"JobId": request.job_id, "Status": status, "Documents": []}},
+        })
+
+    def delete_index_document_with_options(self, workspace_id, request, headers, runtime):
+        with self.lock:
+            self.deleted.extend(request.document_ids)
+        return bailian_20231229_models.DeleteIndexDocumentResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"DeletedDocument": request.document_ids}},
+        })
+
+
+def test_ingest_directory(tmp_path, monkeypatch):
+    """测试流水线导入、重试及解析失败的处理"""
+    monkeypatch.setenv("RAG_FINGERPRINT_CACHE_ENABLED", "0")
+    for name in ("a.md", "b.txt", "broken.md", "skip.bin"):
+        (tmp_path / name).write_text(f"# {name}\n内容", encoding="utf-8")
+    paths = iter_ingest_files([str(tmp_path)])
+    assert [os.path.basename(p) for p in paths] == ["a.md", "b.txt", "broken.md"]
+
+    client = FakeBailianClient(fail_lease_times=2, parse_polls=2)
+    uploaded = []
+    snapshots = []
+    pipeline = IngestPipeline(
+        client, "ws", "idx",
+        backoff=0, poll_interval=0,
+        uploader=lambda url, headers, path: uploaded.append(url),
+        progress=snapshots.append,
+    )
+    results = asyncio.run(pipeline.arun(paths))
+
+    by_name = {os.path.basename(r["path"]): r for r in results}
+    assert by_name["a.md"]["status"] == "success"
+    assert by_name["a.md"]["job_id"] == by_name["b.txt"]["job_id"] == "job-1"
+    assert by_name["broken.md"]["status"] == "failed"
+    assert by_name["broken.md"]["stage"] == "parse"
+    assert len(client.jobs) == 1
+    assert sorted(client.indexed) == sorted([by_name["a.md"]["file_id"], by_name["b.txt"]["file_id"]])
+    assert len(uploaded) == 3
+
+    final = snapshots[-1]
+    assert final["done"] == 2
+    assert final["failed"] == 1
+    assert final["retries"]["lease"] == 2
+
+
+def test_non_idempotent_stage_not_retried_on_error(tmp_path, monkeypatch):
+    """测试添加文件调用异常时不重试，避免服务端已接受请求时产生重复文件"""
+    monkeypatch.setenv("RAG_FINGERPRINT_CACHE_ENABLED", "0")
+    (tmp_path / "a.md").write_text("# a\n内容", encoding="utf-8")
+    client = FakeBailianClient(fail_add_times=1)
+    pipeline = IngestPipeline(client, "ws", "idx", backoff=0, poll_interval=0,
+                              uploader=lambda url, headers, path: None, progress=lambda snapshot: None)
+    results = asyncio.run(pipeline.arun([str(tmp_path / "a.md")]))
+    assert results[0]["status"] == "failed"
+    assert results[0]["stage"] == "add"
+    assert client.add_calls == 1
+    assert client.jobs == []
+
+
+def test_sync_knowledge_base(tmp_path, monkeypatch):
+    """测试增量同步只导入新增和修改的文档，删除已移除文档及旧版本，并批量提交任务"""
+    monkeypatch.setenv("RAG_FINGERPRINT_CACHE_ENABLED", "0")
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for i in range(5):
+        (docs / f"doc{i}.md").write_text(f"文档 {i}", encoding="utf-8")
+    manifest = str(tmp_path / "manifest.json")
+    client = FakeBailianClient()
+    options = dict(manifest_path=manifest, batch_size=2, backoff=0, poll_interval=0,
+                   job_options=dict(initial_interval=0),
+                   uploader=lambda url, headers, path: None, progress=lambda snapshot: None)
+
+    summary = sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    assert summary["added"] == 5
+    assert [len(job) for job in client.jobs] == [2, 2, 1]
+
+    with open(manifest, "r", encoding="utf-8") as f:
+        files = json.load(f)["indices"]["idx"]["files"]
+    old_id = files[str(docs / "doc1.md")]["file_id"]
+    removed_id = files[str(docs / "doc4.md")]["file_id"]
+
+    (docs / "doc1.md").write_text("文档 1 已修改", encoding="utf-8")
+    (docs / "doc4.md").unlink()
+    (docs / "doc5.md").write_text("文档 5", encoding="utf-8")
+    client.jobs.clear()
+
+    summary = sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    assert (summary["added"], summary["changed"], summary["removed"], summary["unchanged"]) == (1, 1, 1, 3)
+    assert [len(job) for job in client.jobs] == [2]
+    assert sorted(client.deleted) == sorted([old_id, removed_id])
+
+    summary = sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    assert summary["unchanged"] == 5
+
+
+def test_sync_keeps_old_version_when_index_job_fails(tmp_path, monkeypatch):
+    """测试新版本的索引任务失败时保留旧版本及清单条目，只删除未完成索引的新版本，下次同步重新导入"""
+    monkeypatch.setenv("RAG_FINGERPRINT_CACHE_ENABLED", "0")
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "doc.md").write_text("文档", encoding="utf-8")
+    manifest = str(tmp_path / "manifest.json")
+    client = FakeBailianClient()
+    options = dict(manifest_path=manifest, backoff=0, poll_interval=0, job_options=dict(initial_interval=0),
+                   uploader=lambda url, headers, path: None, progress=lambda snapshot: None)
+    sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    with open(manifest, "r", encoding="utf-8") as f:
+        old_id = json.load(f)["indices"]["idx"]["files"][str(docs / "doc.md")]["file_id"]
+
+    (docs / "doc.md").write_text("文档已修改", encoding="utf-8")
+    client.fail_jobs.add("job-2")
+    summary = sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    assert summary["failed"] == [str(docs / "doc.md")]
+    assert old_id not in client.deleted
+    assert len(client.deleted) == 1 and client.deleted[0] != old_id
+    with open(manifest, "r", encoding="utf-8") as f:
+        assert json.load(f)["indices"]["idx"]["files"][str(docs / "doc.md")]["file_id"] == old_id
+
+    client.deleted.clear()
+    summary = sync_knowledge_base(client, "ws", "idx", [str(docs)], **options)
+    assert (summary["changed"], summary["failed"]) == (1, [])
+    assert client.deleted == [old_id]
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地 BM25 知识库索引
+"""
+
+import os
+
+from app.code_agent.rag.local_index import (
+    LocalIndex,
+    build_local_index,
+    get_local_index,
+    resolve_directory,
+    split_markdown,
+    tokenize,
+)
+
+
+def test_tokenize():
+    """测试中英文混合分词"""
+    assert tokenize("终端操作") == ["终端", "端操", "操作"]
+    assert tokenize("Shell 命令, git") == ["shell", "命令", "git"]
+    assert tokenize("的") == ["的"]
+
+
+def test_split_markdown():
+    """测试按标题和长度切分 markdown"""
+    chunks = split_markdown("# 标题一\n内容一\n\n# 标题二\n" + "长" * 50, chunk_size=20)
+    assert chunks[0] == "# 标题一\n内容一"
+    assert all(len(chunk) <= 20 for chunk in chunks)
+
+    # 代码块中的注释不切分，相邻的短段落合并
+    chunks = split_markdown("# A\n```python\n# 注释\nx = 1\n```\n# B\n正文", chunk_size=200)
+    assert chunks == ["# A\n```python\n# 注释\nx = 1\n```\n\n# B\n正文"]
+
+
+def test_build_and_retrieve(tmp_path):
+    """测试构建索引后通过 mmap 加载并检索"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "shell.md").write_text("# 终端操作规范\n执行删除命令前必须确认路径。", encoding="utf-8")
+    (docs / "code.md").write_text("# 代码规范\n函数需要编写文档字符串。", encoding="utf-8")
+    (docs / "image.png").write_bytes(b"\x89PNG")
+
+    meta = build_local_index([str(docs)], str(tmp_path / "index"))
+    assert meta["num_docs"] == 2
+
+    index = LocalIndex(str(tmp_path / "index"))
+    rag = index.retrieve("终端操作规范", top_k=1)
+    nodes = rag.body.data.nodes
+    assert len(nodes) == 1
+    assert "删除命令" in nodes[0].text
+    assert nodes[0].score > 0
+    assert nodes[0].metadata["doc_name"] == "shell.md"
+
+    assert index.retrieve("完全无关的内容xyz").body.data.nodes == []
+
+
+def test_rebuild_swaps_index(tmp_path, monkeypatch):
+    """测试重新构建索引时切换到新的构建目录：已打开的旧索引仍可读取，共享索引自动重新加载"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "shell.md").write_text("# 终端操作规范\n执行删除命令前必须确认路径。", encoding="utf-8")
+    index_dir = tmp_path / "index"
+    build_local_index([str(docs)], str(index_dir))
+    monkeypatch.setenv("RAG_LOCAL_INDEX_DIR", str(index_dir))
+    old = get_local_index()
+    assert get_local_index() is old
+
+    (docs / "code.md").write_text("# 代码规范\n函数需要编写文档字符串。", encoding="utf-8")
+    build_local_index([str(docs)], str(index_dir))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["docs", "index"]
+
+    assert "删除命令" in old.retrieve("终端操作规范").body.data.nodes[0].text
+    new = get_local_index()
+    assert new is not old
+    assert new.num_docs == 2
+    assert "文档字符串" in new.retrieve("代码规范", top_k=1).body.data.nodes[0].text
+
+
+def test_rebuild_keeps_build_in_use(tmp_path, monkeypatch):
+    """测试旧构建无法删除（Windows 上仍被映射）时新构建照常生效，旧构建留到下次构建时清理"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "shell.md").write_text("# 终端操作规范\n执行删除命令前必须确认路径。", encoding="utf-8")
+    index_dir = tmp_path / "index"
+    build_local_index([str(docs)], str(index_dir))
+    first = resolve_directory(str(index_dir))
+
+    def locked_rmtree(path, *args, **kwargs):
+        raise PermissionError(f"文件正在使用: {path}")
+
+    monkeypatch.setattr("app.code_agent.rag.local_index.shutil.rmtree", locked_rmtree)
+    (docs / "code.md").write_text("# 代码规范\n函数需要编写文档字符串。", encoding="utf-8")
+    build_local_index([str(docs)], str(index_dir))
+    second = resolve_directory(str(index_dir))
+    assert second != first
+    assert sorted(p.name for p in index_dir.iterdir()) == sorted(["CURRENT", os.path.basename(first),
+                                                                  os.path.basename(second)])
+    assert LocalIndex(str(index_dir)).num_docs == 2
+
+    monkeypatch.undo()
+    build_local_index([str(docs)], str(index_dir))
+    current = os.path.basename(resolve_directory(str(index_dir)))
+    assert sorted(p.name for p in index_dir.iterdir()) == ["CURRENT", current]
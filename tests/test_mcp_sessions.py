@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 MCP 长连接会话
+"""
+
+import asyncio
+import sys
+import time
+
+import pytest
+from mcp.types import Tool
+
+from app.code_agent.utils import mcp
+from app.code_agent.utils.mcp import close_mcp_sessions, create_mcp_stdio_client, load_mcp_servers
+from app.code_agent.utils.tool_schemas import get_tool_schema_cache, schema_key
+
+SERVER_SCRIPT = '''
+import os
+from mcp.server.fastmcp import Context, FastMCP
+
+mcp = FastMCP()
+
+
+@mcp.tool()
+async def whoami(ctx: Context = None) -> str:
+    return f"{os.getpid()} {getattr(ctx.request_context.meta, 'turn_id', None)}"
+
+
+@mcp.tool()
+async def crash(path: str) -> str:
+    with open(path, "a") as f:
+        f.write("run\\n")
+    os._exit(0)
+
+
+mcp.run(transport="stdio")
+'''
+
+
+def test_tool_calls_reuse_one_server_process(tmp_path, monkeypatch):
+    """测试多次工具调用复用同一个服务进程，并携带调用元数据"""
+    monkeypatch.setenv("MCP_SCHEMA_CACHE", "")
+    script = tmp_path / "server.py"
+    script.write_text(SERVER_SCRIPT, encoding="utf-8")
+    turns = iter(["turn-1", "turn-2"])
+
+    async def run():
+        params = {"command": sys.executable, "args": [str(script)]}
+        session, tools = await create_mcp_stdio_client("whoami", params, call_meta=lambda: {"turn_id": next(turns)})
+        again, _ = await create_mcp_stdio_client("whoami", params)
+        assert again is session
+        outputs = [(await tools[0].ainvoke({}))[0]["text"] for _ in range(2)]
+        await close_mcp_sessions()
+        return session, outputs
+
+    session, outputs = asyncio.run(run())
+    pids = {output.split()[0] for output in outputs}
+    assert len(pids) == 1
+    assert [output.split()[1] for output in outputs] == ["turn-1", "turn-2"]
+    assert not session.is_open
+
+
+def test_reconnect_after_server_exits(tmp_path, monkeypatch):
+    """测试工具执行期间服务进程退出：本次调用失败且不重试（工具只执行一次），下一次调用重新连接"""
+    monkeypatch.setenv("MCP_SCHEMA_CACHE", "")
+    script = tmp_path / "server.py"
+    script.write_text(SERVER_SCRIPT, encoding="utf-8")
+    runs = tmp_path / "runs.txt"
+
+    async def run():
+        params = {"command": sys.executable, "args": [str(script)]}
+        session, tools = await create_mcp_stdio_client("crashy", params)
+        tools = {tool.name: tool for tool in tools}
+        before = (await tools["whoami"].ainvoke({}))[0]["text"]
+        with pytest.raises(Exception):
+            await tools["crash"].ainvoke({"path": str(runs)})
+        after = (await tools["whoami"].ainvoke({}))[0]["text"]
+        is_open = session.is_open
+        await close_mcp_sessions()
+        return before, after, is_open
+
+    before, after, is_open = asyncio.run(run())
+    assert runs.read_text().splitlines() == ["run"]
+    assert before.split()[0] != after.split()[0]
+    assert is_open
+
+
+def test_load_mcp_servers_concurrently_with_timeouts(tmp_path, monkeypatch):
+    """测试并发启动多个服务：慢服务超时被跳过，失败的服务返回空列表，不影响正常服务"""
+    monkeypatch.setenv("MCP_SCHEMA_CACHE", "")
+    fast = tmp_path / "fast.py"
+    fast.write_text(SERVER_SCRIPT, encoding="utf-8")
+    slow = tmp_path / "slow.py"
+    slow.write_text("import time\ntime.sleep(30)\n" + SERVER_SCRIPT, encoding="utf-8")
+    broken = tmp_path / "broken.py"
+    broken.write_text("raise SystemExit(1)\n", encoding="utf-8")
+
+    async def run():
+        started = time.perf_counter()
+        tools = await load_mcp_servers({
+            "fast": {"params": {"command": sys.executable, "args": [str(fast)]}, "timeout": 10},
+            "slow": {"params": {"command": sys.executable, "args": [str(slow)]}, "timeout": 1},
+            "broken": {"params": {"command": sys.executable, "args": [str(broken)]}, "timeout": 10},
+        })
+        elapsed = time.perf_counter() - started
+        await close_mcp_sessions()
+        return tools, elapsed
+
+    tools, elapsed = asyncio.run(run())
+    assert list(tools) == ["fast", "slow", "broken"]
+    assert [tool.name for tool in tools["fast"]] == ["whoami", "crash"]
+    assert tools["slow"] == [] and tools["broken"] == []
+    assert elapsed < 8
+
+
+def test_tool_schema_cache_skips_handshake(tmp_path, monkeypatch):
+    """测试命中工具定义缓存时不等待服务启动，后台校验发现定义变化时更新缓存"""
+    monkeypatch.setenv("MCP_SCHEMA_CACHE", str(tmp_path / "schemas.json"))
+    script = tmp_path / "server.py"
+    script.write_text(SERVER_SCRIPT, encoding="utf-8")
+    params = {"command": sys.executable, "args": [str(script)]}
+
+    async def load():
+        session, tools = await create_mcp_stdio_client("whoami", params)
+        connected = session.is_open
+        await asyncio.gather(*mcp._schema_checks)
+        output = (await tools[0].ainvoke({}))[0]["text"]
+        await close_mcp_sessions()
+        return connected, [tool.name for tool in tools], output
+
+    # 未命中缓存：启动服务获取工具定义并写入缓存
+    assert asyncio.run(load())[:2] == (True, ["whoami", "crash"])
+    key = schema_key({"transport": "stdio", **params})
+    assert [tool.name for tool in get_tool_schema_cache().get("whoami", key)] == ["whoami", "crash"]
+
+    # 命中缓存：直接构建工具，第一次调用时才连接服务
+    connected, names, output = asyncio.run(load())
+    assert not connected and names == ["whoami", "crash"] and output
+
+    # 缓存的定义与服务不一致：本次仍使用缓存的定义，后台校验后更新缓存
+    stale = Tool(name="outdated", inputSchema={"type": "object", "properties": {}})
+    get_tool_schema_cache().put("whoami", key, [stale])
+
+    async def check():
+        _, tools = await create_mcp_stdio_client("whoami", params)
+        await asyncio.gather(*mcp._schema_checks)
+        await close_mcp_sessions()
+        return [tool.name for tool in tools]
+
+    assert asyncio.run(check()) == ["outdated"]
+    assert [tool.name for tool in get_tool_schema_cache().get("whoami", key)] == ["whoami", "crash"]
+
+    # 脚本内容变化后缓存键随之变化
+    script.write_text(SERVER_SCRIPT + "\n", encoding="utf-8")
+    assert schema_key({"transport": "stdio", **params}) != key
+
+
+def test_cached_tools_of_hung_server_fail_fast(tmp_path, monkeypatch):
+    """测试命中缓存但服务启动超时：后台校验停用该服务，工具调用立即失败"""
+    monkeypatch.setenv("MCP_SCHEMA_CACHE", str(tmp_path / "schemas.json"))
+    monkeypatch.setenv("MCP_STARTUP_TIMEOUT_HUNG", "1")
+    script = tmp_path / "hung.py"
+    script.write_text("import time\ntime.sleep(30)\n", encoding="utf-8")
+    params = {"command": sys.executable, "args": [str(script)]}
+    key = schema_key({"transport": "stdio", **params})
+    get_tool_schema_cache().put("hung", key, [Tool(name="whoami", inputSchema={"type": "object", "properties": {}})])
+
+    async def run():
+        session, tools = await create_mcp_stdio_client("hung", params)
+        started = time.perf_counter()
+        await asyncio.gather(*mcp._schema_checks)
+        checked = time.perf_counter() - started
+        started = time.perf_counter()
+        with pytest.raises(RuntimeError, match="已停用"):
+            await tools[0].ainvoke({})
+        called = time.perf_counter() - started
+        await close_mcp_sessions()
+        return checked, called
+
+    checked, called = asyncio.run(run())
+    assert checked < 5
+    assert called < 0.5
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试知识库本地镜像
+"""
+
+import asyncio
+import os
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+# rag.rag 在导入时校验配置
+for _name in ("accessKeyId", "accessKeySecret", "workspace_id", "knowledge_base_id"):
+    os.environ.setdefault(_name, "test")
+
+from app.code_agent.rag.backends import aretrieve_from_backend  # noqa: E402
+from app.code_agent.rag.mirror import mirror_index  # noqa: E402
+
+
+class FakeMirrorClient:
+    """模拟知识库文档及切片的分页查询"""
+
+    def __init__(self, documents):
+        # 文档ID -> (名称, 切片文本列表)
+        self.documents = documents
+        self.chunk_requests = []
+
+    def list_index_documents_with_options(self, workspace_id, request, headers, runtime):
+        items = sorted(self.documents.items())
+        page = items[(request.page_number - 1) * request.page_size:request.page_number * request.page_size]
+        return bailian_20231229_models.ListIndexDocumentsResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {
+                "TotalCount": len(items),
+                "Documents": [
+                    {"Id": doc_id, "Name": name, "Size": sum(map(len, chunks)), "Status": "FINISH"}
+                    for doc_id, (name, chunks) in page
+                ],
+            }},
+        })
+
+    def list_chunks_with_options(self, workspace_id, request, headers, runtime):
+        self.chunk_requests.append(request.filed)
+        _, chunks = self.documents[request.filed]
+        page = chunks[(request.page_num - 1) * request.page_size:request.page_num * request.page_size]
+        return bailian_20231229_models.ListChunksResponse().from_map({
+            "statusCode": 200,
+            "body": {"Success": True, "Data": {"Total": len(chunks), "Nodes": [{"Text": text} for text in page]}},
+        })
+
+
+def test_mirror_refresh_and_serve(tmp_path, monkeypatch):
+    """测试分页镜像、增量刷新及从镜像检索"""
+    monkeypatch.setenv("RAG_MIRROR_DIR", str(tmp_path))
+    client = FakeMirrorClient({
+        "doc-1": ("terminal.md", ["终端操作规范：删除前确认目录", "终端命令需要记录日志"]),
+        "doc-2": ("weather.md", ["天气接口需要城市编码"]),
+        "doc-3": ("git.md", ["提交信息需要说明修改内容"]),
+    })
+
+    stats = mirror_index(client, "ws", "idx", page_size=1)
+    assert (stats["changed"], stats["chunks"]) == (3, 4)
+
+    response = asyncio.run(aretrieve_from_backend(None, "ws", "idx", "终端操作规范", backend="mirror"))
+    node = response.body.data.nodes[0]
+    assert node.metadata["doc_name"] == "terminal.md"
+    assert node.metadata["doc_id"] == "doc-1"
+
+    client.chunk_requests.clear()
+    client.documents["doc-2"] = ("weather.md", ["天气接口需要城市编码和日期"])
+    del client.documents["doc-3"]
+    stats = mirror_index(client, "ws", "idx", page_size=1)
+    assert (stats["changed"], stats["removed"], stats["unchanged"]) == (1, 1, 1)
+    assert set(client.chunk_requests) == {"doc-2"}
+
+    response = asyncio.run(aretrieve_from_backend(None, "ws", "idx", "提交信息", backend="mirror"))
+    assert all(node.metadata["doc_id"] != "doc-3" for node in response.body.data.nodes)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试检索结果上下文打包
+"""
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag.packing import estimate_tokens, pack_nodes, rerank_nodes, truncate_to_tokens
+
+
+def make_nodes(*texts):
+    """构造检索节点"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9} for text in texts]}},
+    }).body.data.nodes
+
+
+def test_rerank_by_query_overlap():
+    """测试按与查询的词项重合度重排，重合度相同时保持原有顺序"""
+    nodes = make_nodes("天气接口说明", "终端删除命令规范", "其他内容", "终端操作")
+    assert [node.text for node in rerank_nodes("终端删除命令", nodes)] == [
+        "终端删除命令规范", "终端操作", "天气接口说明", "其他内容",
+    ]
+
+
+def test_pack_dedupes_near_duplicates():
+    """测试近似重复的段落只保留一段"""
+    nodes = make_nodes("执行删除命令前必须确认路径。", "执行删除命令前，必须确认路径", "提交前需要运行测试。")
+    packed = pack_nodes("删除命令", nodes, token_budget=1000)
+    assert packed.count("确认路径") == 1
+    assert "第2段知识" in packed and "第3段知识" not in packed
+
+
+def test_pack_budget_cutoff():
+    """测试放不下的段落被跳过，仍尝试更短的段落"""
+    nodes = make_nodes("终端" * 10, "终端" * 200, "终端规范")
+    packed = pack_nodes("终端", nodes, token_budget=60)
+    assert estimate_tokens(packed) <= 60
+    assert "终端" * 200 not in packed
+    assert "终端规范" in packed
+
+
+def test_oversized_first_passage_truncated_to_budget():
+    """测试最相关的段落超出预算时按 token 估算截断，英文文本不会被过度截断"""
+    text = "shell command guidelines " * 200
+    packed = pack_nodes("shell command", make_nodes(text), token_budget=100)
+    assert 90 <= estimate_tokens(packed) <= 100
+
+    assert truncate_to_tokens("中文" * 50, 10) == "中文" * 5
+    assert truncate_to_tokens("abcd" * 10, 2) == "abcdabcd"
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试文档本地预处理
+"""
+
+import os
+
+from app.code_agent.rag.preprocess import clean_markdown, html_to_text, preprocess_files
+
+
+def test_clean_markdown_and_html():
+    """测试去除 front matter、注释、脚本及导航等样板内容"""
+    markdown = "---\ntitle: 终端\n---\n# 规范\n<!-- 草稿 -->\n\n\n\n内容  \n"
+    assert clean_markdown(markdown) == "# 规范\n\n内容\n"
+
+    html = """
+    <html><head><style>body {}</style><script>var a = 1;</script></head>
+    <body><nav>首页 | 关于</nav>
+    <h1>终端操作规范</h1><p>执行命令前 <b>确认</b> 目录。</p>
+    <ul><li>禁止 rm -rf /</li></ul>
+    <pre>if True:
+    print("ok")</pre>
+    <footer>版权所有</footer></body></html>
+    """
+    text = html_to_text(html)
+    assert "# 终端操作规范" in text
+    assert "执行命令前 确认 目录。" in text
+    assert "- 禁止 rm -rf /" in text
+    assert '```\nif True:\n    print("ok")\n```' in text
+    for boilerplate in ("var a", "首页", "版权所有", "body {}"):
+        assert boilerplate not in text
+
+
+def test_html_header_keeps_headings():
+    """测试页眉中保留页面及章节标题，丢弃导航和其他框架内容"""
+    html = """
+    <body><header><a href="/">Logo</a><nav><a>首页</a></nav>
+    <h1>部署手册</h1><span>登录</span></header>
+    <article><header><h2>回滚步骤</h2><p>发布于 2024-01-01</p></header><p>先停止服务。</p></article></body>
+    """
+    text = html_to_text(html)
+    assert "# 部署手册" in text
+    assert "## 回滚步骤" in text
+    assert "先停止服务。" in text
+    for chrome in ("Logo", "首页", "登录", "发布于"):
+        assert chrome not in text
+
+
+def test_preprocess_files_in_process_pool(tmp_path):
+    """测试进程池预处理、超长文档切分及不支持类型原样返回"""
+    sources = tmp_path / "docs"
+    sources.mkdir()
+    long_doc = sources / "long.md"
+    long_doc.write_text("\n\n".join(f"## 第{i}节\n" + "内容" * 100 for i in range(10)), encoding="utf-8")
+    short_doc = sources / "page.html"
+    short_doc.write_text("<h2>标题</h2><p>正文</p>", encoding="utf-8")
+    pdf = sources / "manual.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    output_dir = str(tmp_path / "out")
+    paths = [str(long_doc), str(short_doc), str(pdf)]
+    results = preprocess_files(paths, output_dir=output_dir, max_chars=500, workers=2)
+
+    assert results[str(pdf)] == [str(pdf)]
+    assert [os.path.basename(p) for p in results[str(short_doc)]] == ["page.md"]
+    parts = results[str(long_doc)]
+    assert len(parts) > 1
+    assert os.path.basename(parts[0]) == "long.part001.md"
+    for part in parts:
+        with open(part, "r", encoding="utf-8") as f:
+            assert len(f.read()) <= 500
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试查询日志与缓存预热
+"""
+
+import asyncio
+
+from app.code_agent.rag.query_log import QueryLog, aprewarm
+
+
+def test_top_queries(tmp_path):
+    """测试归一化后相同的查询合并计数并按次数排序"""
+    query_log = QueryLog(str(tmp_path / "log.sqlite3"))
+    for query in ["终端规范", "终端规范 ", "天气查询", "终端规范"]:
+        query_log.record(query, 10.0, 3, 100)
+    query_log.record("Git 提交", 20.0, 1, 50)
+
+    top = query_log.top_queries(2)
+    assert [item["count"] for item in top] == [3, 1]
+    assert top[0]["query"].strip() == "终端规范"
+    assert top[0]["avg_latency_ms"] == 10.0
+
+
+def test_prewarm_concurrency_and_failures(tmp_path):
+    """测试预热限制并发且失败的查询只计数"""
+    query_log = QueryLog(str(tmp_path / "log.sqlite3"))
+    for i in range(6):
+        query_log.record(f"查询{i}", 1.0, 1, 10)
+
+    running, peak, warmed = 0, 0, []
+
+    async def fetch(query):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if query == "查询0":
+            raise RuntimeError("boom")
+        warmed.append(query)
+
+    stats = asyncio.run(aprewarm(fetch, query_log, top_n=5, concurrency=2))
+    assert stats["queries"] == 5
+    assert stats["succeeded"] + stats["failed"] == 5
+    assert peak <= 2
+    assert len(warmed) == stats["succeeded"]
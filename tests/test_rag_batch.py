@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量知识库查询工具
+"""
+
+import asyncio
+
+import app.code_agent.mcp.rag as rag_server
+
+
+def test_query_rag_batch(monkeypatch):
+    """测试去重、并发上限、数量上限及 token 预算平分"""
+    monkeypatch.setenv("RAG_BATCH_CONCURRENCY", "2")
+    monkeypatch.setenv("RAG_BATCH_MAX_QUERIES", "3")
+    monkeypatch.setenv("RAG_CONTEXT_TOKEN_BUDGET", "3000")
+    running, peak, calls = 0, 0, []
+
+    async def fake_query(query, turn_id=None, token_budget=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        calls.append((query, token_budget))
+        return f"{query} 的知识"
+
+    monkeypatch.setattr(rag_server, "aquery_rag", fake_query)
+    result = asyncio.run(rag_server.query_rag_batch(["终端规范", " 终端规范", "天气", "Git", "部署", ""]))
+
+    assert sorted(query for query, _ in calls) == ["Git", "天气", "终端规范"]
+    assert {budget for _, budget in calls} == {1000}
+    assert peak <= 2
+    assert "## 天气\n天气 的知识" in result
+    assert "部署" in result.split("\n\n")[-1]
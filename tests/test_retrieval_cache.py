@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试知识库检索缓存
+"""
+
+import time
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag import cache as cache_module
+from app.code_agent.rag.cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, RetrievalCache, normalize_query
+
+
+def make_response(text):
+    """构造一个检索响应"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9}]}},
+    })
+
+
+def test_normalize_query():
+    """测试查询归一化"""
+    assert normalize_query("  终端操作规范  ") == "终端操作规范"
+    assert normalize_query("Shell\t  命令") == "shell 命令"
+    assert normalize_query("ＡＢＣ") == "abc"
+
+
+def test_hit_and_miss():
+    """测试命中与未命中统计"""
+    cache = RetrievalCache(ttl=60)
+    assert cache.get("ws", "idx", "终端操作规范") is None
+
+    cache.put("ws", "idx", "终端操作规范", make_response("规范内容"))
+    cached = cache.get("ws", "idx", " 终端操作规范 ")
+    assert cached.body.data.nodes[0].text == "规范内容"
+    assert cache.get("ws", "other", "终端操作规范") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_ttl_expire():
+    """测试过期条目不会被命中"""
+    cache = RetrievalCache(ttl=0.01)
+    cache.put("ws", "idx", "q", make_response("a"))
+    time.sleep(0.02)
+    assert cache.get("ws", "idx", "q") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction():
+    """测试按条目数淘汰最久未使用的条目"""
+    cache = RetrievalCache(max_entries=2)
+    cache.put("ws", "idx", "a", make_response("a"))
+    cache.put("ws", "idx", "b", make_response("b"))
+    cache.get("ws", "idx", "a")
+    cache.put("ws", "idx", "c", make_response("c"))
+
+    assert cache.get("ws", "idx", "b") is None
+    assert cache.get("ws", "idx", "a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit():
+    """测试按字节数淘汰"""
+    size = len(str(make_response("x" * 100).to_map()))
+    cache = RetrievalCache(max_bytes=size * 2)
+    for query in ("a", "b", "c"):
+        cache.put("ws", "idx", query, make_response("x" * 100))
+    assert cache.stats()["entries"] < 3
+    assert cache.stats()["bytes"] <= size * 2
+
+
+def test_failed_response_not_cached():
+    """测试失败的响应不写入缓存"""
+    cache = RetrievalCache()
+    failed = bailian_20231229_models.RetrieveResponse().from_map({"body": {"Success": False, "Message": "err"}})
+    cache.put("ws", "idx", "q", failed)
+    assert cache.stats()["entries"] == 0
+
+
+def test_sqlite_tier(tmp_path):
+    """测试 SQLite 磁盘层在重建缓存后仍可命中"""
+    db_path = str(tmp_path / "rag_cache.sqlite3")
+    RetrievalCache(db_path=db_path).put("ws", "idx", "q", make_response("持久化"))
+
+    cache = RetrievalCache(db_path=db_path)
+    cached = cache.get("ws", "idx", "q")
+    assert cached.body.data.nodes[0].text == "持久化"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_malformed_env_falls_back_to_defaults(monkeypatch):
+    """测试 RAG_CACHE_* 配置格式错误时使用默认值，而不是每次检索都抛出异常"""
+    monkeypatch.setattr(cache_module, "_cache", None)
+    monkeypatch.setenv("RAG_CACHE_TTL", "10m")
+    monkeypatch.setenv("RAG_CACHE_MAX_ENTRIES", "1e3")
+    monkeypatch.setenv("RAG_CACHE_STALE_TTL", "1.5")
+    cache = cache_module.get_retrieval_cache()
+    assert (cache.ttl, cache.max_entries, cache.stale_ttl) == (DEFAULT_TTL, DEFAULT_MAX_ENTRIES, 1.5)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试知识库近似查询缓存
+"""
+
+from alibabacloud_bailian20231229 import models as bailian_20231229_models
+
+from app.code_agent.rag import similarity_cache
+from app.code_agent.rag.similarity_cache import DEFAULT_THRESHOLD, SimilarityCache, jaccard, shingles
+
+
+def make_response(text):
+    """构造一个检索响应"""
+    return bailian_20231229_models.RetrieveResponse().from_map({
+        "statusCode": 200,
+        "body": {"Success": True, "Data": {"Nodes": [{"Text": text, "Score": 0.9}]}},
+    })
+
+
+def test_shingles_ignore_punctuation():
+    """测试 n-gram 提取忽略标点和空白"""
+    assert shingles("终端操作规范？") == shingles(" 终端 操作规范 ")
+
+
+def test_near_duplicate_hit():
+    """测试标点、语序不同的查询可以命中"""
+    cache = SimilarityCache(threshold=0.8)
+    cache.put("ws", "idx", "终端操作规范", make_response("规范内容"))
+
+    for query in ("终端操作规范？", "终端操作规范。。", "操作规范 终端"):
+        cached = cache.get("ws", "idx", query)
+        assert cached is not None, query
+        assert cached.body.data.nodes[0].text == "规范内容"
+
+
+def test_different_query_miss():
+    """测试含义不同的查询不会误命中"""
+    cache = SimilarityCache(threshold=0.8)
+    cache.put("ws", "idx", "删除文件", make_response("删除"))
+
+    assert jaccard(shingles("删除文件"), shingles("创建文件")) < 0.8
+    assert cache.get("ws", "idx", "创建文件") is None
+    assert cache.get("ws", "other", "删除文件") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_max_entries():
+    """测试超出条目上限时淘汰最早的条目"""
+    cache = SimilarityCache(max_entries=1)
+    cache.put("ws", "idx", "终端操作规范", make_response("a"))
+    cache.put("ws", "idx", "代码提交规范", make_response("b"))
+
+    assert cache.get("ws", "idx", "终端操作规范") is None
+    assert cache.get("ws", "idx", "代码提交规范") is not None
+    assert cache.stats()["entries"] == 1
+
+
+def test_put_replaces_same_query_and_purges_expired():
+    """测试重复写入相同查询只保留一个条目，写入时清理过期条目"""
+    cache = SimilarityCache(max_entries=2)
+    cache.put("ws", "idx", "终端操作规范", make_response("a"))
+    cache.put("ws", "idx", "代码提交规范", make_response("b"))
+    cache.put("ws", "idx", "终端操作规范？", make_response("c"))
+    assert cache.stats()["entries"] == 2
+    assert cache.get("ws", "idx", "终端操作规范").body.data.nodes[0].text == "c"
+    assert cache.get("ws", "idx", "代码提交规范") is not None
+
+    cache = SimilarityCache(ttl=-1)
+    cache.put("ws", "idx", "终端操作规范", make_response("a"))
+    cache.put("ws", "idx", "代码提交规范", make_response("b"))
+    assert cache.stats()["entries"] == 1
+
+
+def test_malformed_env_falls_back_to_defaults(monkeypatch):
+    """测试 RAG_SIMILAR_* 配置格式错误时使用默认值"""
+    monkeypatch.setattr(similarity_cache, "_cache", None)
+    monkeypatch.setenv("RAG_SIMILAR_THRESHOLD", "high")
+    monkeypatch.setenv("RAG_SIMILAR_TTL", "60")
+    cache = similarity_cache.get_similarity_cache()
+    assert (cache.threshold, cache.ttl) == (DEFAULT_THRESHOLD, 60.0)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试知识库检索遥测
+"""
+
+import json
+
+import pytest
+
+from app.code_agent.rag.telemetry import Telemetry, get_snapshot_path, summarize
+
+
+def test_summarize_percentiles():
+    """测试最近邻秩分位数"""
+    summary = summarize(range(1, 101))
+    assert summary["count"] == 100
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (50, 95, 99, 100)
+    assert summarize([]) == {"count": 0}
+
+
+def test_timed_errors_and_flush(tmp_path):
+    """测试耗时、错误类型、滑动窗口及快照和事件日志写入"""
+    telemetry = Telemetry(window=3, snapshot_path=str(tmp_path / "snapshot.json"),
+                          log_path=str(tmp_path / "events.jsonl"))
+    with telemetry.timed("retrieve_index"):
+        pass
+    with pytest.raises(TimeoutError):
+        with telemetry.timed("retrieve_index"):
+            raise TimeoutError()
+    for value in range(5):
+        telemetry.observe("query_rag.nodes", value)
+    telemetry.incr("query_rag.ok")
+    telemetry.log_event("query_rag", query="终端规范", latency_ms=1.0)
+
+    telemetry.flush()
+    snapshot = json.loads((tmp_path / "snapshot.json").read_text(encoding="utf-8"))
+    assert snapshot["metrics"]["retrieve_index.latency_ms"]["count"] == 2
+    assert snapshot["metrics"]["query_rag.nodes"] == summarize([2, 3, 4])
+    assert snapshot["errors"] == {"retrieve_index": {"TimeoutError": 1}}
+    assert snapshot["counters"] == {"query_rag.ok": 1}
+    assert "turn_memo" in snapshot["caches"]
+    event = json.loads((tmp_path / "events.jsonl").read_text(encoding="utf-8"))
+    assert event["query"] == "终端规范"
+
+
+def test_snapshot_path_per_role(monkeypatch):
+    """测试智能体和 RAG 服务进程的快照路径按进程角色区分"""
+    monkeypatch.delenv("RAG_TELEMETRY_SNAPSHOT", raising=False)
+    monkeypatch.setenv("RAG_TELEMETRY_ROLE", "code_agent")
+    agent_path = get_snapshot_path()
+    assert agent_path.endswith("rag_telemetry.code_agent.json")
+    assert get_snapshot_path("rag") != agent_path
+
+    monkeypatch.setenv("RAG_TELEMETRY_SNAPSHOT", "telemetry/{role}.json")
+    assert get_snapshot_path() == "telemetry/code_agent.json"
+    monkeypatch.setenv("RAG_TELEMETRY_SNAPSHOT", "")
+    assert get_snapshot_path() is None
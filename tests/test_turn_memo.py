@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试单轮对话内的知识检索备忘
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from mcp.types import CallToolResult, TextContent
+
+import app.code_agent.mcp.rag as rag_server
+from app.code_agent.rag.turn_memo import NO_RESULT_MESSAGE, TurnMemo, current_turn_id, start_turn
+from app.code_agent.tools import rag_tools
+
+
+def test_turn_memo_scoped_to_turn():
+    """测试同一轮内命中（查询归一化），跨轮次未命中，只保留最近的轮次"""
+    memo = TurnMemo(max_turns=2)
+    memo.put("turn-1", "终端规范", "知识")
+    assert memo.get("turn-1", " 终端规范 ") == "知识"
+    assert memo.get("turn-2", "终端规范") is None
+    assert memo.get(None, "终端规范") is None
+    assert (memo.hits, memo.misses) == (1, 1)
+
+    memo.put("turn-2", "a", "x")
+    memo.put("turn-3", "a", "y")
+    assert memo.get("turn-1", "终端规范") is None
+    assert memo.get("turn-3", "a") == "y"
+
+
+def test_interceptor_dedupes_within_turn(monkeypatch):
+    """测试拦截器：同一轮内重复查询不再发起 MCP 调用，新一轮重新调用，错误结果及错误提示不备忘"""
+    memo = TurnMemo()
+    monkeypatch.setattr(rag_tools, "get_turn_memo", lambda: memo)
+    calls = []
+
+    async def handler(request):
+        query = request.args["query"]
+        calls.append(query)
+        texts = {"超时": "执行错误: ReadTimeout", "无结果": NO_RESULT_MESSAGE}
+        return CallToolResult(content=[TextContent(type="text", text=texts.get(query, f"{query} 的知识"))],
+                              isError=query == "错误")
+
+    def call(name, query):
+        request = SimpleNamespace(name=name, args={"query": query})
+        return rag_tools.turn_memo_interceptor(request, handler)
+
+    async def run():
+        start_turn()
+        first = await call(rag_tools.RAG_TOOL_NAME, "终端规范")
+        second = await call(rag_tools.RAG_TOOL_NAME, "终端规范")
+        for query in ("错误", "错误", "超时", "超时", "无结果", "无结果"):
+            await call(rag_tools.RAG_TOOL_NAME, query)
+        await call("other_tool", "终端规范")
+        meta = rag_tools.turn_meta()
+        start_turn()
+        await call(rag_tools.RAG_TOOL_NAME, "终端规范")
+        return first, second, meta
+
+    first, second, meta = asyncio.run(run())
+    assert second.content[0].text == first.content[0].text == "终端规范 的知识"
+    assert calls == ["终端规范", "错误", "错误", "超时", "超时", "无结果", "无结果", "终端规范", "终端规范"]
+    assert set(meta) == {"turn_id"}
+    assert current_turn_id.get() is None
+
+
+def test_server_reuses_memo_for_turn(monkeypatch):
+    """测试服务端从调用元数据读取轮次 ID，本轮已检索的查询直接返回备忘结果"""
+    async def no_record(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(rag_server, "record_query", no_record)
+    rag_server.get_turn_memo().put("turn-x", "终端规范", "备忘的知识")
+    ctx = SimpleNamespace(request_context=SimpleNamespace(meta=SimpleNamespace(turn_id="turn-x")))
+
+    turn_id = rag_server.get_turn_id(ctx)
+    assert turn_id == "turn-x"
+    assert asyncio.run(rag_server.aquery_rag("终端规范", turn_id)) == "备忘的知识"
+    assert rag_server.get_turn_id(SimpleNamespace()) is None
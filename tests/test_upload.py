@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式文件上传
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# rag.rag 在导入时校验配置
+for _name in ("accessKeyId", "accessKeySecret", "workspace_id", "knowledge_base_id"):
+    os.environ.setdefault(_name, "test")
+
+from app.code_agent.rag import rag  # noqa: E402
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """记录收到的 PUT 请求"""
+    received = {}
+
+    def do_PUT(self):
+        length = int(self.headers["Content-Length"])
+        UploadHandler.received = {
+            "body": self.rfile.read(length),
+            "chunked": self.headers.get("Transfer-Encoding"),
+            "extra": self.headers.get("X-bailian-extra"),
+        }
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_upload_file_streams_with_progress(tmp_path, monkeypatch):
+    """测试上传内容完整、使用 Content-Length 并按块回调进度"""
+    monkeypatch.setattr(rag, "UPLOAD_CHUNK_SIZE", 64 * 1024)
+    content = os.urandom(300 * 1024)
+    path = tmp_path / "big.pdf"
+    path.write_bytes(content)
+
+    server = HTTPServer(("127.0.0.1", 0), UploadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        progress = []
+        rag.upload_file(
+            f"http://127.0.0.1:{server.server_port}/upload",
+            {"X-bailian-extra": "extra", "Content-Type": "application/pdf"},
+            str(path),
+            progress=lambda sent, total: progress.append((sent, total)),
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert UploadHandler.received["body"] == content
+    assert UploadHandler.received["chunked"] is None
+    assert UploadHandler.received["extra"] == "extra"
+    assert progress[-1] == (len(content), len(content))
+    assert len(progress) == 5
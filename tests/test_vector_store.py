@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地向量知识库
+"""
+
+import numpy as np
+
+from app.code_agent.rag.vector_store import VectorStore, build_vector_store, embed_texts, get_vector_store
+
+
+def test_embed_texts_normalized():
+    """测试嵌入向量归一化且相似文本更接近"""
+    vectors = embed_texts(["终端操作规范", "终端的操作规范", "天气查询接口", ""], dim=256)
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0, atol=1e-5)
+    assert not vectors[3].any()
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+
+def test_build_and_search(tmp_path, monkeypatch):
+    """测试构建、分块批量检索及检索响应结构"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "terminal.md").write_text("# 终端操作规范\n执行删除命令前必须确认当前目录。", encoding="utf-8")
+    (docs / "weather.md").write_text("# 天气查询\n调用天气接口需要城市编码。", encoding="utf-8")
+    (docs / "git.md").write_text("# Git 提交规范\n提交信息需要说明修改内容。", encoding="utf-8")
+    store_dir = str(tmp_path / "vectors")
+
+    meta = build_vector_store([str(docs)], store_dir, dim=256)
+    assert meta["count"] == 3
+
+    # 每块一行，验证跨块合并 top-k
+    monkeypatch.setattr("app.code_agent.rag.vector_store.SEARCH_BLOCK_ROWS", 1)
+    store = VectorStore(store_dir)
+    results = store.search_batch(["终端删除命令规范", "天气接口"], top_k=2)
+    assert store.get_document(results[0][0][1])["metadata"]["doc_name"] == "terminal.md"
+    assert store.get_document(results[1][0][1])["metadata"]["doc_name"] == "weather.md"
+    assert len(results[0]) <= 2
+    for top_k in (0, -1):
+        assert store.search_batch(["终端删除命令规范", "天气接口"], top_k=top_k) == [[], []]
+
+    response = store.retrieve("Git 提交信息", top_k=1)
+    assert response.body.data.nodes[0].metadata["doc_name"] == "git.md"
+
+
+def test_rebuild_swaps_store(tmp_path, monkeypatch):
+    """测试重新构建向量库时切换到新的构建目录：已映射的旧向量库仍可读取，共享向量库自动重新加载"""
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "terminal.md").write_text("# 终端操作规范\n执行删除命令前必须确认当前目录。", encoding="utf-8")
+    store_dir = tmp_path / "vectors"
+    build_vector_store([str(docs)], str(store_dir), dim=64)
+    monkeypatch.setenv("RAG_VECTOR_INDEX_DIR", str(store_dir))
+    old = get_vector_store()
+
+    (docs / "git.md").write_text("# Git 提交规范\n提交信息需要说明修改内容。", encoding="utf-8")
+    build_vector_store([str(docs)], str(store_dir), dim=64)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["docs", "vectors"]
+
+    assert old.retrieve("终端删除命令", top_k=1).body.data.nodes[0].metadata["doc_name"] == "terminal.md"
+    new = get_vector_store()
+    assert new is not old
+    assert new.retrieve("Git 提交信息", top_k=1).body.data.nodes[0].metadata["doc_name"] == "git.md"